@@ -3,4 +3,5 @@ from . import search as sea
 from . import create as cre
 from . import edit_func as ef
 from . import plot as pl
-from . import eval_func as ev
\ No newline at end of file
+from . import eval_func as ev
+from . import location_tensor as lt
\ No newline at end of file
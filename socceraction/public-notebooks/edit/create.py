@@ -1,9 +1,12 @@
 import pandas as pd
 import numpy as np
 import copy
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Union
+from scipy import ndimage, sparse
 from edit.type_def import *
+from edit.location_tensor import FrameTable, LocationTensor
 import edit.convert_take as con
+import edit.location_tensor as lt
 
 # ある時刻から最も近いフレームを取得
 def get_frame_by_time(simple_data : SimpleData, time : float) -> str:
@@ -34,39 +37,25 @@ def create_simple_info(location, jersey, team) -> SimpleInfo:
     }
     return simple_info
 
+# 前半・後半のフレーム時刻表を作成
+def create_frame_tables(simple_data_1 : SimpleData, simple_data_2 : SimpleData) -> Dict[int, FrameTable]:
+    return {1: FrameTable(simple_data_1), 2: FrameTable(simple_data_2)}
+
+# アクションデータに入れる用の座標データを作成（アクション × 選手 × 2 の配列）
+def create_location_tensor(
+    actions : pd.DataFrame, frame_tables : Dict[int, FrameTable], team_names : TeamNames, player_names : PlayerNames,
+    tolerance : Optional[float] = None, mode : str = "nearest"
+) -> LocationTensor:
+    return lt.align_location_tensor(actions, frame_tables, team_names, player_names, tolerance, mode)
+
 # アクションデータに入れる用の座標データを作成
 def create_location_data(
-    actions : pd.DataFrame, simple_data_1 : SimpleData, simple_data_2 : SimpleData, team_names : TeamNames, player_names : PlayerNames
+    actions : pd.DataFrame, simple_data_1 : SimpleData, simple_data_2 : SimpleData, team_names : TeamNames, player_names : PlayerNames,
+    tolerance : Optional[float] = None, mode : str = "nearest"
 ) -> List[LocationData]:
-    location_data_list : List[LocationData] = []
-    simple_data : SimpleData = {}
-
-    for action_num in range(len(actions)):
-        a = actions.iloc[action_num]
-        a_time = a.time_seconds
-        period_id = a.period_id
-        if period_id == 1:
-            simple_data = simple_data_1
-        elif period_id == 2:
-            simple_data = simple_data_2
-        
-        location_data : LocationData = {}
-        frame_time = get_frame_by_time(simple_data, a_time)
-        if frame_time != "":
-            simple_info_list = simple_data[frame_time]
-            for simple_info in simple_info_list:
-                location, jersey, team = con.take_simple_info(simple_info)
-                if (team == "left" and period_id == 1) or (team == "right" and period_id == 2):
-                    team_name = team_names["left"]
-                else:
-                    team_name = team_names["right"]
-                player_name = player_names[team_name][jersey]
-                location_data[player_name] = create_simple_info(location, jersey, team_name)
-        else:
-            print(f"action_num: {action_num}, time: {a_time} not found in simple_data")
-        location_data_list.append(location_data)
-
-    return location_data_list
+    frame_tables = create_frame_tables(simple_data_1, simple_data_2)
+    tensor = create_location_tensor(actions, frame_tables, team_names, player_names, tolerance, mode)
+    return tensor.to_location_data_list()
 
 # キーパー情報の作成
 def create_keepers(player_infos : PlayerInfos) -> List[str]:
@@ -92,9 +81,16 @@ def get_player_in_num(location_data_list : List[LocationData], e_player_name : s
                 return action_num
     return -1
 
-# フィールド選手情報の作成
-def create_field_players(
-    location_data_list : List[LocationData], player_infos : PlayerInfos, substitutions : SubStitutions
+# 選手が初めて出るaction_numの取得（配列版）
+def get_player_in_num_by_tensor(tensor : LocationTensor, e_player_name : str) -> int:
+    if e_player_name not in tensor.player_codes:
+        return -1
+    is_present = tensor.is_present[:, tensor.player_codes[e_player_name]]
+    return int(np.argmax(is_present)) if is_present.any() else -1
+
+# フィールド選手情報の作成（in_nums: dict{in_player_name, action_num}）
+def create_field_players_by_in_nums(
+    player_infos : PlayerInfos, substitutions : SubStitutions, in_nums : Dict[str, int]
 ) -> FieldPlayers:
     field_players : FieldPlayers = {}
     
@@ -106,11 +102,39 @@ def create_field_players(
     for (in_player_name, out_player_name) in substitutions:
         field_player.remove(out_player_name)
         field_player.append(in_player_name)
-        action_num = get_player_in_num(location_data_list, in_player_name)
+        action_num = in_nums[in_player_name]
         field_players[action_num] = copy.deepcopy(field_player)
     
     return field_players
 
+# フィールド選手情報の作成
+def create_field_players(
+    location_data_list : List[LocationData], player_infos : PlayerInfos, substitutions : SubStitutions
+) -> FieldPlayers:
+    in_nums = {in_player_name: get_player_in_num(location_data_list, in_player_name) for in_player_name, _ in substitutions}
+    return create_field_players_by_in_nums(player_infos, substitutions, in_nums)
+
+# フィールド選手情報の作成（配列版）
+def create_field_players_by_tensor(
+    tensor : LocationTensor, player_infos : PlayerInfos, substitutions : SubStitutions
+) -> FieldPlayers:
+    in_nums = {in_player_name: get_player_in_num_by_tensor(tensor, in_player_name) for in_player_name, _ in substitutions}
+    return create_field_players_by_in_nums(player_infos, substitutions, in_nums)
+
+# 出場選手ごとの区間を作成（一度も出てこない選手の交代（action_num = -1）は反映しない）
+def create_field_ranges(field_players : FieldPlayers, action_len : int) -> List[Tuple[int, int, List[str]]]:
+    action_nums = sorted(action_num for action_num in field_players if action_num >= 0)
+    end_action_nums = action_nums[1:] + [action_len]
+    return [(start, end, field_players[start]) for start, end in zip(action_nums, end_action_nums)]
+
+# 出場中の選手のマスクを作成（アクション × 選手、交代は区間として扱う）
+def create_field_mask(field_players : FieldPlayers, tensor : LocationTensor) -> np.ndarray:
+    field_mask = np.zeros(tensor.is_present.shape, dtype=bool)
+    for start, end, field_player in create_field_ranges(field_players, len(tensor)):
+        player_codes = [tensor.player_codes[p] for p in field_player if p in tensor.player_codes]
+        field_mask[start:end, player_codes] = True
+    return field_mask
+
 # １行分のデータフレーム作成
 def create_pd_entry(
     game_id : float, period_id :float, action_id : float, team_id : float, player_id : float, location : List[float]
@@ -126,30 +150,15 @@ def create_pd_entry(
     }
 
 # アクションデータと同じ形式の座標データを作成
-def create_action_locations(actions : pd.DataFrame, location_data_list : List[LocationData]) -> pd.DataFrame:
-    team_to_id = actions.drop_duplicates(subset=["team_id", "team_name"])[["team_name", "team_id"]]
-    team_to_id_dict = dict(zip(team_to_id["team_name"], team_to_id["team_id"]))
-    player_to_id = actions.drop_duplicates(subset=["player_id", "player_name"])[["player_name", "player_id"]]
-    player_to_id_dict = dict(zip(player_to_id["player_name"], player_to_id["player_id"]))
-
-    action_locations : pd.DataFrame = {}
-    action_locations_list = []
-    for action_num in range(len(actions)):
-        a = actions.iloc[action_num]
-        game_id = a["game_id"]
-        period_id = a["period_id"]
-        action_id = a["action_id"]
-
-        location_data = location_data_list[action_num]
-        for player_name, simple_info in location_data.items():
-            location, jersey, team_name = con.take_simple_info(simple_info)
-            team_id = team_to_id_dict[team_name]
-            player_id = player_to_id_dict[player_name]
-            pd_entry = create_pd_entry(game_id, period_id, action_id, team_id, player_id, location)
-            action_locations_list.append(pd_entry)
+def create_action_locations(actions : pd.DataFrame, location_data_list : List[LocationData]) -> Dict[float, pd.DataFrame]:
+    tensor = lt.create_location_tensor_from_list(location_data_list)
+    return create_action_locations_by_tensor(actions, tensor)
 
-    action_locations[game_id] = pd.DataFrame(action_locations_list)
-    return action_locations
+# アクションデータと同じ形式の座標データを作成（座標データの配列から）
+def create_action_locations_by_tensor(actions : pd.DataFrame, tensor : LocationTensor) -> Dict[float, pd.DataFrame]:
+    builder = lt.ActionLocationsBuilder()
+    builder.append(actions, tensor)
+    return builder.take_action_locations()
 
 # 選手名とIDの対応情報作成
 def create_name_ids(players : pd.DataFrame, game_locations : pd.DataFrame) -> NameIds:
@@ -162,35 +171,93 @@ def create_name_ids(players : pd.DataFrame, game_locations : pd.DataFrame) -> Na
         name_ids[player_name] = (player_id, team_id)
     return name_ids
 
+# 座標をグリッドの番号（x * grid_y + y）に変換（範囲外やnanは-1、np.histogram2dと同じ区切り方）
+def take_grid_cells(x : np.ndarray, y : np.ndarray) -> np.ndarray:
+    cells = []
+    for values, bins, size in [(x, grid_x, pitch_width), (y, grid_y, pitch_length)]:
+        edges = np.linspace(0, size, bins + 1)
+        values = np.asarray(values, dtype=np.float64)
+        cell = np.searchsorted(edges, values, side="right") - 1
+        cell[values == edges[-1]] = bins - 1
+        cell[(cell < 0) | (cell >= bins)] = -1
+        cells.append(cell)
+    return np.where((cells[0] >= 0) & (cells[1] >= 0), cells[0] * grid_y + cells[1], -1)
+
+# 全選手のヒートマップ（選手 × grid_x × grid_y、sparseなら 選手 × グリッド数 のCSR）と出場範囲をまとめて作成
+def create_heatmap_tensor(
+    game_locations : pd.DataFrame, sigma : Optional[float] = None, is_sparse : bool = False
+) -> Tuple[np.ndarray, Union[np.ndarray, sparse.csr_matrix], np.ndarray]:
+    cell_len = grid_x * grid_y
+    player_ids, player_codes = np.unique(game_locations["player_id"].values, return_inverse=True)
+    player_codes = player_codes.reshape(-1)
+    cells = take_grid_cells(game_locations["location_x"].values, game_locations["location_y"].values)
+    is_valid = cells >= 0
+
+    if is_sparse and sigma is None:
+        heatmaps = sparse.coo_matrix(
+            (np.ones(np.count_nonzero(is_valid)), (player_codes[is_valid], cells[is_valid])),
+            shape=(len(player_ids), cell_len)
+        ).tocsr()
+    else:
+        heatmaps = np.bincount(
+            player_codes[is_valid] * cell_len + cells[is_valid], minlength=len(player_ids) * cell_len
+        ).astype(np.float64).reshape(len(player_ids), grid_x, grid_y)
+        if sigma is not None:
+            heatmaps = smooth_heatmaps(heatmaps, sigma)
+        if is_sparse:
+            heatmaps = sparse.csr_matrix(heatmaps.reshape(len(player_ids), cell_len))
+
+    player_ranges = take_player_ranges(game_locations["action_id"].values, player_codes, len(player_ids))
+    return player_ids, heatmaps, player_ranges
+
+# 全選手の出場範囲（選手 × [最初のaction_id, 最後のaction_id]、座標がnanの行も含む）
+def take_player_ranges(action_ids : np.ndarray, player_codes : np.ndarray, player_len : int) -> np.ndarray:
+    order = np.argsort(player_codes, kind="stable")
+    starts = np.searchsorted(player_codes[order], np.arange(player_len))
+    return np.stack([
+        np.minimum.reduceat(action_ids[order], starts) if len(order) else action_ids[:0],
+        np.maximum.reduceat(action_ids[order], starts) if len(order) else action_ids[:0],
+    ], axis=1)
+
+# ヒートマップの平滑化（ガウシアン、sigmaはグリッド単位）
+def smooth_heatmaps(heatmaps : np.ndarray, sigma : float) -> np.ndarray:
+    return ndimage.gaussian_filter(heatmaps, sigma=(0, sigma, sigma), mode="constant")
+
+# 複数試合のヒートマップを選手ごとに合計
+def aggregate_heatmaps(
+    heatmap_list : List[Tuple[np.ndarray, Union[np.ndarray, sparse.csr_matrix]]]
+) -> Tuple[np.ndarray, Union[np.ndarray, sparse.csr_matrix]]:
+    all_player_ids = np.unique(np.concatenate([player_ids for player_ids, _ in heatmap_list]))
+    if any(sparse.issparse(heatmaps) for _, heatmaps in heatmap_list):
+        total = sparse.csr_matrix((len(all_player_ids), grid_x * grid_y))
+        for player_ids, heatmaps in heatmap_list:
+            rows = sparse.csr_matrix(heatmaps.reshape(len(player_ids), -1)) if not sparse.issparse(heatmaps) else heatmaps
+            scatter = sparse.csr_matrix(
+                (np.ones(len(player_ids)), (np.searchsorted(all_player_ids, player_ids), np.arange(len(player_ids)))),
+                shape=(len(all_player_ids), len(player_ids))
+            )
+            total = total + scatter @ rows
+        return all_player_ids, total.tocsr()
+    total = np.zeros((len(all_player_ids), grid_x, grid_y), dtype=np.float64)
+    for player_ids, heatmaps in heatmap_list:
+        total[np.searchsorted(all_player_ids, player_ids)] += heatmaps
+    return all_player_ids, total
+
 # ヒートマップ作成
 def create_heatmaps(game_locations : pd.DataFrame) -> Heatmaps:
-    player_locations : Dict[float, Tuple[np.ndarray, np.ndarray]] = {}
-    for player_id, group in game_locations.groupby("player_id"):
-        group = group.dropna(subset=["location_x", "location_y"])
-        x = group["location_x"].values
-        y = group["location_y"].values
-        player_locations[player_id] = (x, y)
-
+    player_ids, heatmap_tensor, _ = create_heatmap_tensor(game_locations)
     heatmaps : Heatmaps = {}
-    for player_id, (x, y) in player_locations.items():
-        heatmap, _, _ = np.histogram2d(
-            x, y,
-            bins=[grid_x, grid_y],
-            range=[[0, pitch_width], [0, pitch_length]]
-        )
+    for player_id, heatmap in zip(player_ids, heatmap_tensor):
         heatmaps[player_id] = heatmap
-    
     return heatmaps
 
 # 各選手の出場範囲情報を作成
 def create_player_ranges(game_locations : pd.DataFrame) -> PlayerRanges:
+    player_ids, player_codes = np.unique(game_locations["player_id"].values, return_inverse=True)
+    ranges = take_player_ranges(game_locations["action_id"].values, player_codes.reshape(-1), len(player_ids))
     player_ranges : PlayerRanges = {}
-    for player_id, group in game_locations.groupby("player_id"):
-        action_ids = group["action_id"].values
-        start_id = np.min(action_ids)
-        end_id = np.max(action_ids)
+    for player_id, (start_id, end_id) in zip(player_ids, ranges):
         player_ranges[player_id] = (start_id, end_id)
-    
     return player_ranges
 
 # １行分のデータフレーム作成（評価用）
@@ -1,9 +1,12 @@
 import pandas as pd
+import numpy as np
 from typing import List, Dict, Tuple
 from edit.type_def import *
+from edit.location_tensor import LocationTensor
 import edit.convert_take as con
 import edit.create as cre
 import edit.math_func as mf
+import edit.location_tensor as lt
 
 # 座標補正（平行移動）
 def edit_location_by_translation(a_loc : List[float], pred_loc : List[float], location_data : LocationData) -> None:
@@ -18,19 +21,39 @@ def calc_is_in_ranges(action_num: int, delete_ranges: DeleteRanges) -> bool:
             return False
     return True
 
+# 各アクションが削除範囲内かどうか（範囲を開始順に並べ、終了の累積最大と比較）
+def take_in_ranges_mask(action_nums : np.ndarray, delete_ranges : DeleteRanges) -> np.ndarray:
+    if not delete_ranges:
+        return np.zeros(len(action_nums), dtype=bool)
+    ranges = np.array(sorted(delete_ranges), dtype=np.int64)
+    max_ends = np.maximum.accumulate(ranges[:, 1])
+    range_nums = np.searchsorted(ranges[:, 0], action_nums, side="right") - 1
+    return (range_nums >= 0) & (action_nums <= max_ends[np.maximum(range_nums, 0)])
+
+# 自動補正（配列版、アクションの選手の座標がアクションの開始位置に一致するよう全選手を平行移動）
+def edit_tensor_auto(actions : pd.DataFrame, tensor : LocationTensor, delete_ranges : DeleteRanges) -> None:
+    action_nums = np.arange(len(actions))
+    player_codes = actions["player_name"].map(tensor.player_codes).to_numpy(dtype=np.float64)
+    has_player = ~np.isnan(player_codes)
+    player_codes = np.where(has_player, player_codes, 0).astype(np.int64)
+    is_edit = has_player & tensor.is_present[action_nums, player_codes] & ~take_in_ranges_mask(action_nums, delete_ranges)
+
+    a_locs = actions[["start_x", "start_y"]].to_numpy(dtype=np.float64)[is_edit]
+    pred_locs = tensor.locations[action_nums[is_edit], player_codes[is_edit]]
+    tensor.locations[is_edit] += (a_locs - pred_locs)[:, np.newaxis, :]
+
 # 自動補正
 def edit_data_auto(actions : pd.DataFrame, location_data_list : List[LocationData], delete_ranges: DeleteRanges) -> None:
-    for action_num in range(len(actions)):
-        a = actions.iloc[action_num]
-        a_time = a.time_seconds
-        a_loc = [a["start_x"], a["start_y"]]
-        a_player_name = a["player_name"]
-
-        location_data = location_data_list[action_num]
-        if a_player_name in location_data:
-            pred_loc = location_data[a_player_name]["location"]
-            if calc_is_in_ranges(action_num, delete_ranges):
-                edit_location_by_translation(a_loc, pred_loc, location_data)
+    tensor = lt.create_location_tensor_from_list(location_data_list)
+    edit_tensor_auto(actions, tensor, delete_ranges)
+    tensor.write_back(location_data_list)
+
+# コーナー情報の追加（配列版）
+def add_corner_infos_tensor(tensor : LocationTensor, corner_infos : CornerInfos) -> None:
+    for (start_action_num, end_action_num), (player_name, location) in corner_infos.items():
+        player_code = tensor.player_codes[player_name]
+        tensor.locations[start_action_num:end_action_num + 1, player_code] = location
+        tensor.is_present[start_action_num:end_action_num + 1, player_code] = True
 
 # コーナー情報の追加
 def add_corner_infos(location_data_list : List[LocationData], player_infos : PlayerInfos, corner_infos : CornerInfos) -> None:
@@ -41,41 +64,84 @@ def add_corner_infos(location_data_list : List[LocationData], player_infos : Pla
             location_data = location_data_list[action_num]
             location_data[player_name] = simple_info
 
+# 座標が欠損している選手のマスク（アクション × 選手）
+def get_lack_mask(tensor : LocationTensor, field_players : FieldPlayers) -> np.ndarray:
+    return cre.create_field_mask(field_players, tensor) & ~tensor.is_present
+
 # 座標が欠損している選手の情報を取得
 def get_lack_players(location_data_list : List[LocationData], field_players : FieldPlayers) -> FieldPlayers:
-    lack_players : FieldPlayers = {}
-    field_player = field_players[0]
-    for action_num, location_data in enumerate(location_data_list):
-        if action_num in field_players:
-            field_player = field_players[action_num]
+    tensor = lt.create_location_tensor_from_list(location_data_list)
+    lack_lists : Dict[int, List[str]] = {}
+    for start, end, field_player in cre.create_field_ranges(field_players, len(tensor)):
         for player_name in field_player:
-            if player_name not in location_data:
-                if action_num not in lack_players:
-                    lack_players[action_num] = []
-                lack_players[action_num].append(player_name)
+            if player_name in tensor.player_codes:
+                lack_action_nums = start + np.flatnonzero(~tensor.is_present[start:end, tensor.player_codes[player_name]])
+            else:
+                lack_action_nums = np.arange(start, end)
+            for action_num in lack_action_nums:
+                lack_lists.setdefault(int(action_num), []).append(player_name)
+    lack_players : FieldPlayers = {action_num: lack_lists[action_num] for action_num in sorted(lack_lists)}
     return lack_players
 
+# 各選手が最後に見えたアクションと次に見えるアクション（見えなければ-1）
+def take_seen_indexes(is_seen : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    action_len = is_seen.shape[0]
+    action_nums = np.arange(action_len)[:, np.newaxis]
+    last_seen = np.maximum.accumulate(np.where(is_seen, action_nums, -1), axis=0)
+    next_seen = np.minimum.accumulate(np.where(is_seen, action_nums, action_len)[::-1], axis=0)[::-1]
+    next_seen = np.where(next_seen < action_len, next_seen, -1)
+    return last_seen, next_seen
+
+# 欠損選手の補間（配列版）
+# 最後に見えたアクションか次に見えるアクションの近い方から、両方に映っている味方（その時点で最も近い選手）との
+# 相対位置を保ったまま座標を求める
+def interpolate_tensor(tensor : LocationTensor, field_players : FieldPlayers) -> np.ndarray:
+    is_seen = tensor.is_present & ~np.isnan(tensor.locations).any(axis=2)
+    last_seen, next_seen = take_seen_indexes(is_seen)
+    lack_action_nums, lack_player_codes = np.nonzero(get_lack_mask(tensor, field_players))
+
+    prev_nums = last_seen[lack_action_nums, lack_player_codes]
+    next_nums = next_seen[lack_action_nums, lack_player_codes]
+    use_next = (next_nums >= 0) & ((prev_nums < 0) | (next_nums - lack_action_nums < lack_action_nums - prev_nums))
+    seen_nums = np.where(use_next, next_nums, prev_nums)
+    has_seen = seen_nums >= 0
+    lack_action_nums, lack_player_codes, seen_nums = lack_action_nums[has_seen], lack_player_codes[has_seen], seen_nums[has_seen]
+
+    # 基準にする味方選手（補間するアクションと見えたアクションの両方に座標がある選手）
+    is_teammate = tensor.team_names[:, np.newaxis] == tensor.team_names[np.newaxis, :]
+    np.fill_diagonal(is_teammate, False)
+    is_candidate = is_seen[lack_action_nums] & is_seen[seen_nums] & is_teammate[lack_player_codes]
+    seen_locations = tensor.locations[seen_nums]
+    seen_player_locations = seen_locations[np.arange(len(seen_nums)), lack_player_codes]
+    distances = np.linalg.norm(seen_locations - seen_player_locations[:, np.newaxis], axis=2)
+    distances = np.where(is_candidate, distances, np.inf)
+    ref_codes = np.argmin(distances, axis=1)
+    has_ref = is_candidate.any(axis=1)
+
+    lack_action_nums, lack_player_codes = lack_action_nums[has_ref], lack_player_codes[has_ref]
+    seen_nums, ref_codes, seen_player_locations = seen_nums[has_ref], ref_codes[has_ref], seen_player_locations[has_ref]
+    sub_vectors = seen_player_locations - tensor.locations[seen_nums, ref_codes]
+    tensor.locations[lack_action_nums, lack_player_codes] = tensor.locations[lack_action_nums, ref_codes] + sub_vectors
+    tensor.is_present[lack_action_nums, lack_player_codes] = True
+    return np.stack([lack_action_nums, lack_player_codes], axis=1)
+
 # 欠損選手の補間
 def interpolate_data(location_data_list : List[LocationData], field_players : FieldPlayers) -> None:
-    lack_players : FieldPlayers = get_lack_players(location_data_list, field_players)
-    for action_num, player_names in lack_players.items():
-        for player_name in player_names:
-            location_data = location_data_list[action_num]
-            for prev_action_num in range(action_num, -1, -1):
-                prev_location_data = location_data_list[prev_action_num]
-                if player_name in prev_location_data:
-                    p_location, p_jersey, p_team_name = con.take_simple_info(prev_location_data[player_name])
-                    common =  set(location_data.keys()) & set(prev_location_data.keys())
-                    if common:
-                        c_player = next(iter(common))
-                        sub_vector = mf.calc_sub(p_location, prev_location_data[c_player]["location"])
-                        pred_loc = mf.calc_add(location_data[c_player]["location"], sub_vector)
-                        location_data[player_name] = cre.create_simple_info(pred_loc, p_jersey, p_team_name)
+    tensor = lt.create_location_tensor_from_list(location_data_list)
+    filled = interpolate_tensor(tensor, field_players)
+    for action_num, player_code in filled:
+        location = tensor.locations[action_num, player_code].tolist()
+        location_data_list[action_num][tensor.player_names[player_code]] = cre.create_simple_info(
+            location, tensor.jerseis[player_code], tensor.team_names[player_code]
+        )
+
+# アクション数の削減（配列版、削除範囲の座標をnanにする）
+def reduct_tensor(tensor : LocationTensor, delete_ranges : DeleteRanges) -> None:
+    is_reduct = take_in_ranges_mask(np.arange(len(tensor)), delete_ranges)
+    tensor.locations[is_reduct] = np.nan
 
 # アクション数の削減
 def reduct_actions(location_data_list : List[LocationData], delete_ranges : DeleteRanges) -> None:
-    for delete_range in delete_ranges:
-        for action_num in range(delete_range[0], delete_range[1] + 1):
-            location_data = location_data_list[action_num]
-            for player_name, simple_info in location_data.items():
-                simple_info["location"] = mf.create_nan_location()
\ No newline at end of file
+    tensor = lt.create_location_tensor_from_list(location_data_list)
+    reduct_tensor(tensor, delete_ranges)
+    tensor.write_back(location_data_list)
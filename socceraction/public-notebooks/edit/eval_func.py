@@ -1,9 +1,9 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union
 from edit.type_def import *
 import edit.create as cre
-from scipy.stats import pearsonr, spearmanr
+from scipy.stats import pearsonr, spearmanr, rankdata
 
 # ゲームIDの指定
 def specify_game_id(action_locations : pd.DataFrame, game_id : float) -> pd.DataFrame:
@@ -40,20 +40,79 @@ def calc_location_value(
     loc_value_map_def = team_map_def * heatmap
     return np.sum(loc_value_map_off), np.sum(loc_value_map_def)
 
+# 各選手の出場範囲でのチームのVAEPマップ（選手 × 攻撃/守備 × grid_x × grid_y）
+# チームごとにaction_id順の累積グリッドを作り、範囲のマップは累積の差で求める（累積は範囲の区切り位置でのみ持つ）
+def calc_range_vaep_maps(game_actions : pd.DataFrame, team_ids : np.ndarray, player_ranges : np.ndarray) -> np.ndarray:
+    cell_len = grid_x * grid_y
+    range_maps = np.zeros((len(team_ids), 2, cell_len), dtype=np.float64)
+    all_cells = cre.take_grid_cells(game_actions["start_x"].values, game_actions["start_y"].values)
+    all_values = game_actions[["offensive_value", "defensive_value"]].to_numpy(dtype=np.float64)
+    all_team_ids = game_actions["team_id"].values
+    all_action_ids = game_actions["action_id"].values
+
+    for team_id in np.unique(team_ids):
+        is_team = all_team_ids == team_id
+        order = np.argsort(all_action_ids[is_team], kind="stable")
+        action_ids = all_action_ids[is_team][order]
+        cells = all_cells[is_team][order]
+        values = all_values[is_team][order]
+
+        player_nums = np.flatnonzero(team_ids == team_id)
+        starts = np.searchsorted(action_ids, player_ranges[player_nums, 0], side="left")
+        ends = np.searchsorted(action_ids, player_ranges[player_nums, 1], side="right")
+        positions, inverse = np.unique(np.concatenate([starts, ends]), return_inverse=True)
+
+        # segments[i]: positions[i - 1] <= k < positions[i] のアクションの合計、累積すると prefix[positions[i]]
+        segments = np.searchsorted(positions, np.arange(len(action_ids)), side="right")
+        is_valid = cells >= 0
+        bins = segments[is_valid] * cell_len + cells[is_valid]
+        for value_num in range(2):
+            segment_maps = np.bincount(
+                bins, weights=values[is_valid, value_num], minlength=(len(positions) + 1) * cell_len
+            ).reshape(len(positions) + 1, cell_len)
+            prefix_maps = np.cumsum(segment_maps, axis=0)[:len(positions)]
+            range_maps[player_nums, value_num] = (
+                prefix_maps[inverse[len(player_nums):]] - prefix_maps[inverse[:len(player_nums)]]
+            )
+    return range_maps.reshape(len(team_ids), 2, grid_x, grid_y)
+
+# 全選手の座標スコア（攻撃, 守備）をまとめて計算
+def calc_location_values(
+    game_actions : pd.DataFrame, heatmaps : np.ndarray, team_ids : np.ndarray, player_ranges : np.ndarray
+) -> np.ndarray:
+    range_maps = calc_range_vaep_maps(game_actions, team_ids, player_ranges)
+    return np.einsum("pxy,pvxy->pv", heatmaps, range_maps)
+
 # 全選手の座標スコアを計算
 def calc_all_location_value(
     game_actions : pd.DataFrame, heatmaps : Heatmaps, names_ids : NameIds, player_ranges : PlayerRanges, gamma : float, 
 ) -> pd.DataFrame:
-    loc_values_list = []
-    for player_name, (player_id, team_id) in names_ids.items():
-        heatmap = heatmaps[player_id]
-        player_range = player_ranges[player_id]
-        loc_value_off, loc_value_def = calc_location_value(game_actions, heatmap, team_id, player_range)
-        loc_value = loc_value_off + gamma * loc_value_def
-        pd_entry = cre.create_pd_entry_eval(player_id, player_name, loc_value, loc_value_off, loc_value_def)
-        loc_values_list.append(pd_entry)
-    
-    return pd.DataFrame(loc_values_list)
+    player_names = list(names_ids.keys())
+    player_ids = [names_ids[player_name][0] for player_name in player_names]
+    team_ids = np.array([names_ids[player_name][1] for player_name in player_names])
+    stacked_heatmaps = np.zeros((len(player_ids), grid_x, grid_y), dtype=np.float64)
+    for i, player_id in enumerate(player_ids):
+        stacked_heatmaps[i] = heatmaps[player_id]
+    ranges = np.array([player_ranges[player_id] for player_id in player_ids], dtype=np.float64).reshape(-1, 2)
+
+    location_values = calc_location_values(game_actions, stacked_heatmaps, team_ids, ranges)
+    loc_values_off = location_values[:, 0]
+    loc_values_def = location_values[:, 1]
+    return pd.DataFrame({
+        "player_id" : player_ids,
+        "player_name" : player_names,
+        "location_value" : loc_values_off + gamma * loc_values_def,
+        "off_location_value" : loc_values_off,
+        "def_location_value" : loc_values_def,
+    })
+
+# 選手ごとのアクションスコアを集計（ニックネームを優先）
+def create_playersR(actions : pd.DataFrame, players : pd.DataFrame) -> pd.DataFrame:
+    actions = actions[["player_id", "vaep_value", "offensive_value", "defensive_value"]].assign(count=1)
+    playersR = actions.groupby(["player_id"]).sum().reset_index()
+    playersR = playersR.merge(players[["player_id", "nickname", "player_name"]], how="left")
+    playersR["player_name"] = playersR[["nickname", "player_name"]].apply(lambda x: x.iloc[0] if x.iloc[0] else x.iloc[1], axis=1)
+    return playersR[["player_id", "player_name", "vaep_value", "offensive_value", "defensive_value", "count"]]
 
 # 選手の除外
 def delete_players(playersR : pd.DataFrame, delete_names : List[str]) -> pd.DataFrame:
@@ -119,4 +178,128 @@ def batch_normalization(playersR_list : List[pd.DataFrame]) -> None:
 def calc_corr(playersR : pd.DataFrame, value1, value2) -> Tuple[float, float]:
     pearson_corr, _ = pearsonr(playersR[value1], playersR[value2])
     spearman_corr, _ = spearmanr(playersR[value1], playersR[value2])
-    return pearson_corr, spearman_corr
\ No newline at end of file
+    return pearson_corr, spearman_corr
+
+# 列ごとのピアソン相関係数（values: 選手 × 条件、ratings: 選手 または 選手 × 条件）
+def calc_pearson_columns(values : np.ndarray, ratings : np.ndarray) -> np.ndarray:
+    if ratings.ndim == 1:
+        ratings = ratings[:, np.newaxis]
+    values = values - values.mean(axis=0)
+    ratings = ratings - ratings.mean(axis=0)
+    cov = np.sum(values * ratings, axis=0)
+    return cov / np.sqrt(np.sum(values ** 2, axis=0) * np.sum(ratings ** 2, axis=0))
+
+# 列ごとのスピアマン順位相関係数（順位にしてからピアソン）
+def calc_spearman_columns(values : np.ndarray, ratings : np.ndarray) -> np.ndarray:
+    return calc_pearson_columns(rankdata(values, axis=0), rankdata(ratings, axis=0))
+
+# γ・βの組み合わせごとの評価値（選手 × 組み合わせ）
+# total = (攻撃 + γ守備) + β(座標攻撃 + γ座標守備) なので、4成分と重みの行列積で求める
+def calc_total_values(playersR : pd.DataFrame, gammas : np.ndarray, betas : np.ndarray, is_vdep : bool = True) -> np.ndarray:
+    components = playersR[["offensive_value", "defensive_value", "off_location_value", "def_location_value"]].to_numpy(dtype=np.float64)
+    gamma_grid, beta_grid = np.meshgrid(gammas, betas, indexing="ij")
+    gamma_grid, beta_grid = gamma_grid.reshape(-1), beta_grid.reshape(-1)
+    weights = np.stack([
+        np.ones_like(gamma_grid),
+        gamma_grid if is_vdep else np.ones_like(gamma_grid),
+        beta_grid,
+        beta_grid * gamma_grid,
+    ], axis=1)
+    return components @ weights.T
+
+# γ・βの範囲での相関係数の一覧と最大の組み合わせ（評価をやり直さず、選手ごとの攻撃・守備の値から計算）
+# betasを省略した場合は、calc_betaの値の ±beta_range の範囲
+def sweep_gamma_beta(
+    playersR_list : List[pd.DataFrame], rating : str, gammas : np.ndarray, betas : np.ndarray = None,
+    is_vdep : bool = True, key : str = "pearson"
+) -> Tuple[pd.DataFrame, pd.Series]:
+    playersR_all = pd.concat(playersR_list, ignore_index=True)
+    playersR_all = playersR_all.dropna(subset=["offensive_value", "defensive_value", "off_location_value", "def_location_value", rating])
+    gammas = np.asarray(gammas, dtype=np.float64)
+    if betas is None:
+        betas = calc_beta([playersR_all]) * np.linspace(1 - beta_range, 1 + beta_range, 21)
+    betas = np.asarray(betas, dtype=np.float64)
+
+    total_values = calc_total_values(playersR_all, gammas, betas, is_vdep)
+    ratings = playersR_all[rating].to_numpy(dtype=np.float64)
+    gamma_grid, beta_grid = np.meshgrid(gammas, betas, indexing="ij")
+    results = pd.DataFrame({
+        "gamma": gamma_grid.reshape(-1),
+        "beta": beta_grid.reshape(-1),
+        "pearson": calc_pearson_columns(total_values, ratings),
+        "spearman": calc_spearman_columns(total_values, ratings),
+    })
+    return results, results.loc[results[key].idxmax()]
+
+# 再標本の添字（resample_len × 選手数）、groups（試合など）があればその中で選ぶ（選手はgroups順に並んでいること）
+def take_resample_indexes(
+    rng : np.random.Generator, group_codes : np.ndarray, resample_len : int, is_permutation : bool
+) -> np.ndarray:
+    player_len = len(group_codes)
+    if is_permutation:
+        # 乱数にグループ番号を足して並べ替え、グループ内だけで入れ替える
+        return np.argsort(group_codes + rng.random((resample_len, player_len)), axis=1)
+    starts = np.searchsorted(group_codes, group_codes, side="left")
+    sizes = np.searchsorted(group_codes, group_codes, side="right") - starts
+    return starts + (rng.random((resample_len, player_len)) * sizes).astype(np.int64)
+
+# 相関係数のブートストラップ信頼区間と並べ替え検定のp値（resample_len回分の添字をまとめて作り、行列演算で計算）
+# ブートストラップのスピアマンは再標本ごとに順位を付け直し、並べ替え検定は最初に付けた順位をそのまま使う
+def calc_corr_resampled(
+    playersR : pd.DataFrame, values : Union[str, List[str]], rating : str, resample_len : int = 10000,
+    alpha : float = 0.05, group : str = None, seed : int = None, chunk_len : int = 1000
+) -> pd.DataFrame:
+    if isinstance(values, str):
+        values = [values]
+    playersR = playersR.dropna(subset=values + [rating])
+    if group is not None:
+        playersR = playersR.sort_values(group, kind="stable")
+        group_codes = pd.factorize(playersR[group], sort=True)[0].astype(np.float64)
+    else:
+        group_codes = np.zeros(len(playersR))
+    rng = np.random.default_rng(seed)
+
+    ratings = playersR[rating].to_numpy(dtype=np.float64)
+    rating_ranks = rankdata(ratings)
+    value_arrays = playersR[values].to_numpy(dtype=np.float64)
+    value_ranks = rankdata(value_arrays, axis=0)
+    observed = {
+        "pearson": calc_pearson_columns(value_arrays, ratings),
+        "spearman": calc_spearman_columns(value_arrays, ratings),
+    }
+
+    boot_corrs = {method: np.zeros((resample_len, len(values))) for method in observed}
+    perm_counts = {method: np.zeros(len(values)) for method in observed}
+    for start in range(0, resample_len, chunk_len):
+        chunk = min(chunk_len, resample_len - start)
+        boot_indexes = take_resample_indexes(rng, group_codes, chunk, False)
+        perm_indexes = take_resample_indexes(rng, group_codes, chunk, True)
+        boot_ratings = ratings[boot_indexes].T
+        boot_rating_ranks = rankdata(boot_ratings, axis=0)
+        perm_ratings = ratings[perm_indexes].T
+        perm_rating_ranks = rating_ranks[perm_indexes].T
+        for value_num in range(len(values)):
+            boot_values = value_arrays[boot_indexes, value_num].T
+            boot_corrs["pearson"][start:start + chunk, value_num] = calc_pearson_columns(boot_values, boot_ratings)
+            boot_corrs["spearman"][start:start + chunk, value_num] = calc_pearson_columns(
+                rankdata(boot_values, axis=0), boot_rating_ranks
+            )
+            # 並べ替えは値を固定し、評価の方を入れ替える
+            perm_pearson = calc_pearson_columns(perm_ratings, value_arrays[:, value_num])
+            perm_spearman = calc_pearson_columns(perm_rating_ranks, value_ranks[:, value_num])
+            perm_counts["pearson"][value_num] += np.sum(np.abs(perm_pearson) >= abs(observed["pearson"][value_num]))
+            perm_counts["spearman"][value_num] += np.sum(np.abs(perm_spearman) >= abs(observed["spearman"][value_num]))
+
+    results = []
+    for method in observed:
+        ci_low, ci_high = np.nanquantile(boot_corrs[method], [alpha / 2, 1 - alpha / 2], axis=0)
+        for value_num, value in enumerate(values):
+            results.append({
+                "value": value,
+                "method": method,
+                "corr": observed[method][value_num],
+                "ci_low": ci_low[value_num],
+                "ci_high": ci_high[value_num],
+                "p_value": (perm_counts[method][value_num] + 1) / (resample_len + 1),
+            })
+    return pd.DataFrame(results)
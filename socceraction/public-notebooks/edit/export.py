@@ -0,0 +1,207 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+import pandas as pd
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Optional
+from edit.type_def import *
+import edit.convert_take as con
+import edit.fns as fns
+
+# 1プロセスあたりにまとめて描画する枚数
+chunk_len = 64
+
+# 出力できる形式（pngは背景を使い回して差分だけ描画、pdfはベクター形式で全体を描画）
+save_formats = ("png", "pdf")
+
+# 描画プロセスの初期化（画面を使わないAggで描画）
+def use_agg() -> None:
+    matplotlib.use("Agg")
+
+# ピッチの描画（ピッチは最初に1回だけ描き、ヒートマップ・選手・アクションだけを書き換える）
+# pyplotを使わずにAggのキャンバスへ描くため、呼び出し側のバックエンドは変えない
+class PitchRenderer:
+    def __init__(self, figsize : float = 6, dpi : int = 100):
+        cfg = fns.spadl_config
+        self.fig = Figure(figsize=(figsize, figsize * (cfg["width"] + 8) / (cfg["length"] + 8)), dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_axes([0, 0, 1, 1])
+        fns._field(ax=self.ax, linecolor="black", fieldcolor="white", show=False)
+        self.ax.axis("off")
+        self.ax.set_xlim(cfg["origin_x"] - 4, cfg["origin_x"] + cfg["length"] + 4)
+        self.ax.set_ylim(cfg["origin_y"] - 4, cfg["origin_y"] + cfg["width"] + 4)
+        self.figsize = figsize
+        # ヒートマップより手前に描くピッチの線
+        self.line_artists = [artist for artist in self.ax.lines + self.ax.patches if artist.get_zorder() > fns.zheatmap]
+
+        # 書き換える部分
+        extent = (cfg["origin_x"], cfg["origin_x"] + cfg["length"], cfg["origin_y"], cfg["origin_y"] + cfg["width"])
+        self.heatmap = self.ax.imshow(
+            np.zeros((grid_y, grid_x)), extent=extent, aspect="auto", cmap="Reds", zorder=fns.zheatmap, animated=True
+        )
+        self.players = self.ax.scatter(
+            np.zeros(0), np.zeros(0), s=figsize * 10, alpha=0.6, zorder=fns.zaction - 1, animated=True
+        )
+        self.player_texts : List[matplotlib.text.Text] = []
+        (self.action_line,) = self.ax.plot([], [], color="black", linewidth=1.5, zorder=fns.zaction, animated=True)
+        (self.action_marker,) = self.ax.plot(
+            [], [], linestyle="None", marker="o", markersize=figsize * 2, color="blue", mec="black", zorder=fns.zaction, animated=True
+        )
+        self.title = self.ax.text(
+            cfg["origin_x"] + cfg["length"] / 2, cfg["origin_y"] + cfg["width"] + 1.5, "",
+            ha="center", va="bottom", fontsize=9, zorder=fns.ztext, animated=True
+        )
+
+        # ピッチだけの背景を保存
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.clear()
+
+    # 書き換える部分の一覧
+    def take_artists(self) -> List[matplotlib.artist.Artist]:
+        return [self.heatmap, self.players, *self.player_texts, self.action_line, self.action_marker, self.title]
+
+    def clear(self) -> None:
+        for artist in self.take_artists():
+            artist.set_visible(False)
+
+    # ヒートマップ（grid_x × grid_y）
+    def set_heatmap(self, heatmap : np.ndarray, title : str = "") -> None:
+        self.clear()
+        self.heatmap.set_data(np.flipud(heatmap.T))
+        self.heatmap.set_clim(0, max(float(np.max(heatmap)), 1e-9))
+        self.heatmap.set_visible(True)
+        self.title.set_text(title)
+        self.title.set_visible(True)
+
+    # アクションと周りの選手（location: [start_x, start_y, end_x, end_y]）
+    def set_action(
+        self, location : List[float], o_locations : np.ndarray, o_team_names : np.ndarray, o_names : np.ndarray,
+        title : str = "", is_success : bool = True
+    ) -> None:
+        self.clear()
+        sx, sy, ex, ey = location
+        self.action_marker.set_data([sx], [sy])
+        self.action_marker.set_markeredgecolor("black" if is_success else "red")
+        self.action_marker.set_visible(True)
+        self.action_line.set_data([sx, ex], [sy, ey])
+        self.action_line.set_visible(True)
+
+        o_locations = np.asarray(o_locations, dtype=np.float64).reshape(-1, 2)
+        self.players.set_offsets(o_locations)
+        self.players.set_facecolors([team_colors.get(team_name, "gray") for team_name in o_team_names])
+        self.players.set_visible(True)
+        while len(self.player_texts) < len(o_locations):
+            self.player_texts.append(self.ax.text(0, 0, "", fontsize=8, ha="left", va="bottom", zorder=fns.zaction, animated=True))
+        for text, (x, y), name in zip(self.player_texts, o_locations, o_names):
+            text.set_position((x + 0.5, y + 0.5))
+            text.set_text(name)
+            text.set_visible(True)
+        self.title.set_text(title)
+        self.title.set_visible(True)
+
+    # 背景を戻して書き換えた部分だけ描画した画像（高さ × 幅 × RGBA）
+    def take_image(self) -> np.ndarray:
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        artists = [artist for artist in self.take_artists() if artist.get_visible()]
+        if self.heatmap.get_visible():
+            artists += self.line_artists
+        for artist in sorted(artists, key=lambda artist: artist.get_zorder()):
+            self.ax.draw_artist(artist)
+        return np.asarray(canvas.buffer_rgba()).copy()
+
+    def save(self, file_path : str) -> None:
+        extension = os.path.splitext(file_path)[1][1:].lower()
+        if extension not in save_formats:
+            raise ValueError(f"{extension} is not supported")
+        if extension == "png":
+            matplotlib.image.imsave(file_path, self.take_image())
+            return
+        # ベクター形式は通常の描画で出力するため、一時的にanimatedを外す
+        artists = self.take_artists()
+        for artist in artists:
+            artist.set_animated(False)
+        self.fig.savefig(file_path)
+        for artist in artists:
+            artist.set_animated(True)
+
+# 描画内容の作成（1枚ごとのdict、プロセス間で受け渡す）
+def create_heatmap_tasks(heatmaps : Heatmaps, dir_path : str, extension : str = "png") -> List[Dict]:
+    return [
+        {"kind": "heatmap", "heatmap": heatmap, "title": f"Heatmap for id: {player_id}",
+         "file_path": os.path.join(dir_path, f"heatmap_{player_id}.{extension}")}
+        for player_id, heatmap in heatmaps.items()
+    ]
+
+def create_action_tasks(
+    actions : pd.DataFrame, location_data_list : List[LocationData], action_nums : List[int], dir_path : str = "", extension : str = "png"
+) -> List[Dict]:
+    tasks = []
+    for action_num in action_nums:
+        a = actions.iloc[action_num]
+        minute = int((a.period_id - 1) * 45 + a.time_seconds // 60)
+        second = int(a.time_seconds % 60)
+        player_names, o_locations, o_jerseis, o_team_names = con.take_plot_data(location_data_list[action_num])
+        tasks.append({
+            "kind": "action",
+            "location": [a.start_x, a.start_y, a.end_x, a.end_y],
+            "o_locations": np.array(o_locations, dtype=np.float64).reshape(-1, 2),
+            "o_team_names": np.array(o_team_names),
+            "o_names": np.array(o_jerseis),
+            "title": f"{minute}m{second}s {a.type_name} {a.player_name} ({a.team_name})",
+            "is_success": a.result_name == "success",
+            "file_path": os.path.join(dir_path, f"action_{action_num}.{extension}"),
+        })
+    return tasks
+
+def set_task(renderer : PitchRenderer, task : Dict) -> None:
+    if task["kind"] == "heatmap":
+        renderer.set_heatmap(task["heatmap"], task["title"])
+    else:
+        renderer.set_action(
+            task["location"], task["o_locations"], task["o_team_names"], task["o_names"], task["title"], task["is_success"]
+        )
+
+# 1プロセス分の描画（ピッチはプロセスごとに1回だけ描く）
+def render_tasks(tasks : List[Dict], figsize : float = 6, dpi : int = 100) -> int:
+    renderer = PitchRenderer(figsize, dpi)
+    for task in tasks:
+        set_task(renderer, task)
+        renderer.save(task["file_path"])
+    return len(tasks)
+
+# まとめて出力（プロセスごとにchunk_len枚ずつ）
+def export_figures(tasks : List[Dict], figsize : float = 6, dpi : int = 100, max_workers : Optional[int] = None) -> int:
+    for dir_path in {os.path.dirname(task["file_path"]) for task in tasks}:
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+    chunks = [tasks[i:i + chunk_len] for i in range(0, len(tasks), chunk_len)]
+    if len(chunks) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=use_agg) as executor:
+            return sum(executor.map(render_tasks, chunks, [figsize] * len(chunks), [dpi] * len(chunks)))
+    return sum(render_tasks(chunk, figsize, dpi) for chunk in chunks)
+
+# 連続したアクションを1本の動画に出力（ffmpegに画像をそのまま渡す）
+def export_movie(tasks : List[Dict], file_path : str, fps : float = 2, figsize : float = 6, dpi : int = 100) -> None:
+    ffmpeg_path = shutil.which(matplotlib.rcParams["animation.ffmpeg_path"])
+    if ffmpeg_path is None:
+        raise RuntimeError("ffmpeg not found")
+    renderer = PitchRenderer(figsize, dpi)
+    width, height = renderer.fig.canvas.get_width_height()
+    command = [
+        ffmpeg_path, "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+        "-vcodec", "libx264", "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", file_path,
+    ]
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+        for task in tasks:
+            set_task(renderer, task)
+            process.stdin.write(renderer.take_image().tobytes())
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to write {file_path}")
@@ -0,0 +1,249 @@
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Tuple, Optional
+from edit.type_def import *
+from edit.type_def import columns
+
+# 対応付けの方法
+align_modes = ("nearest", "backward", "forward")
+
+# 前半・後半のトラッキングデータ（時刻順に並べた配列）
+class FrameTable:
+    def __init__(self, simple_data : SimpleData):
+        frame_keys = list(simple_data.keys())
+        times = np.array([float(frame_key) for frame_key in frame_keys], dtype=np.float64)
+        order = np.argsort(times, kind="stable")
+        self.times = times[order]
+
+        # 各フレームのエントリは offsets[i]:offsets[i + 1]
+        counts = np.zeros(len(frame_keys), dtype=np.int64)
+        locations : List[Location] = []
+        pair_codes : List[int] = []
+        # (チーム, 背番号) の組み合わせは番号で持つ
+        self.pairs : List[Tuple[str, str]] = []
+        pair_to_code : Dict[Tuple[str, str], int] = {}
+        for i, frame_num in enumerate(order):
+            simple_info_list = simple_data[frame_keys[frame_num]]
+            counts[i] = len(simple_info_list)
+            for simple_info in simple_info_list:
+                pair = (simple_info["team"], simple_info["jersey"])
+                if pair not in pair_to_code:
+                    pair_to_code[pair] = len(self.pairs)
+                    self.pairs.append(pair)
+                locations.append(simple_info["location"])
+                pair_codes.append(pair_to_code[pair])
+        self.offsets = np.zeros(len(frame_keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.locations = np.array(locations, dtype=np.float64).reshape(-1, 2)
+        self.pair_codes = np.array(pair_codes, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    # 各時刻に対応するフレーム番号（見つからなければ-1）
+    def align(self, a_times : np.ndarray, tolerance : Optional[float] = None, mode : str = "nearest") -> np.ndarray:
+        if mode not in align_modes:
+            raise ValueError(f"{mode} is not supported")
+        a_times = np.asarray(a_times, dtype=np.float64)
+        frame_nums = np.full(len(a_times), -1, dtype=np.int64)
+        if len(self.times) == 0:
+            return frame_nums
+
+        # after: a_time より後の最初のフレーム、before: a_time 以前の最後のフレーム
+        after = np.searchsorted(self.times, a_times, side="right")
+        before = after - 1
+        has_before = before >= 0
+        has_after = after < len(self.times)
+        before_diffs = np.where(has_before, a_times - self.times[np.maximum(before, 0)], np.inf)
+        after_diffs = np.where(has_after, self.times[np.minimum(after, len(self.times) - 1)] - a_times, np.inf)
+
+        if mode == "backward":
+            frame_nums = np.where(has_before, before, -1)
+            diffs = before_diffs
+        elif mode == "forward":
+            # 同時刻のフレームがあればそれを使う
+            is_exact = has_before & (before_diffs == 0)
+            frame_nums = np.where(is_exact, before, np.where(has_after, after, -1))
+            diffs = np.where(is_exact, 0.0, after_diffs)
+        else:
+            # 等距離なら前のフレームを優先（get_frame_by_timeと同じ）
+            is_before = before_diffs <= after_diffs
+            frame_nums = np.where(is_before, before, after)
+            diffs = np.minimum(before_diffs, after_diffs)
+            frame_nums[~np.isfinite(diffs)] = -1
+
+        if tolerance is not None:
+            frame_nums[diffs > tolerance] = -1
+        return frame_nums
+
+    # 指定フレームのエントリ（アクション番号、エントリ番号）を一括で取得
+    def take_entries(self, frame_nums : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        action_nums = np.flatnonzero(frame_nums >= 0)
+        starts = self.offsets[frame_nums[action_nums]]
+        counts = self.offsets[frame_nums[action_nums] + 1] - starts
+        entry_action_nums = np.repeat(action_nums, counts)
+        entry_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        entry_nums = entry_starts + np.arange(len(entry_action_nums), dtype=np.int64)
+        return entry_action_nums, entry_nums
+
+# アクションごとの座標データ（アクション × 選手 × 2、欠損はnan）
+class LocationTensor:
+    def __init__(self, player_names : List[str], jerseis : List[str], team_names : List[str], action_len : int):
+        self.player_names = list(player_names)
+        self.jerseis = np.array(jerseis, dtype=object)
+        self.team_names = np.array(team_names, dtype=object)
+        self.player_codes : Dict[str, int] = {player_name: i for i, player_name in enumerate(self.player_names)}
+        self.locations = np.full((action_len, len(self.player_names), 2), np.nan, dtype=np.float64)
+        # LocationDataにキーがあるかどうか（座標がnanでも出場中として扱う）
+        self.is_present = np.zeros((action_len, len(self.player_names)), dtype=bool)
+
+    def __len__(self) -> int:
+        return self.locations.shape[0]
+
+    # 座標をLocationDataのリストに書き戻す（キーがあるものだけ）
+    def write_back(self, location_data_list : List[LocationData]) -> None:
+        for action_num, location_data in enumerate(location_data_list):
+            for player_name, simple_info in location_data.items():
+                simple_info["location"] = self.locations[action_num, self.player_codes[player_name]].tolist()
+
+    # LocationDataのリストに変換
+    def to_location_data_list(self) -> List[LocationData]:
+        location_data_list : List[LocationData] = []
+        for action_num in range(len(self)):
+            location_data : LocationData = {}
+            for player_code in np.flatnonzero(self.is_present[action_num]):
+                location_data[self.player_names[player_code]] = {
+                    "location" : self.locations[action_num, player_code].tolist(),
+                    "jersey" : self.jerseis[player_code],
+                    "team" : self.team_names[player_code],
+                }
+            location_data_list.append(location_data)
+        return location_data_list
+
+# 選手名の一覧から空の座標データを作成
+def create_empty_location_tensor(player_names : PlayerNames, action_len : int) -> LocationTensor:
+    names : List[str] = []
+    jerseis : List[str] = []
+    team_names : List[str] = []
+    for team_name, jersey_names in player_names.items():
+        for jersey, player_name in jersey_names.items():
+            names.append(player_name)
+            jerseis.append(jersey)
+            team_names.append(team_name)
+    return LocationTensor(names, jerseis, team_names, action_len)
+
+# LocationDataのリストから座標データを作成
+def create_location_tensor_from_list(
+    location_data_list : List[LocationData], player_names : Optional[PlayerNames] = None
+) -> LocationTensor:
+    # 選手名の一覧が無ければ出てきた選手から作成
+    if player_names is None:
+        player_names = {}
+        for location_data in location_data_list:
+            for player_name, simple_info in location_data.items():
+                player_names.setdefault(simple_info["team"], {})[simple_info["jersey"]] = player_name
+    tensor = create_empty_location_tensor(player_names, len(location_data_list))
+    for action_num, location_data in enumerate(location_data_list):
+        for player_name, simple_info in location_data.items():
+            player_code = tensor.player_codes[player_name]
+            tensor.locations[action_num, player_code] = simple_info["location"]
+            tensor.is_present[action_num, player_code] = True
+    return tensor
+
+# フレームの各エントリに対応する選手番号（対応付いたフレームに出てくる組のみ引く）
+def take_player_codes(
+    frame_table : FrameTable, entry_nums : np.ndarray, tensor : LocationTensor,
+    period_id : int, team_names : TeamNames, player_names : PlayerNames
+) -> np.ndarray:
+    pair_codes = frame_table.pair_codes[entry_nums]
+    pair_to_player = np.full(len(frame_table.pairs), -1, dtype=np.int64)
+    for i in np.unique(pair_codes):
+        team, jersey = frame_table.pairs[i]
+        if (team == "left" and period_id == 1) or (team == "right" and period_id == 2):
+            team_name = team_names["left"]
+        else:
+            team_name = team_names["right"]
+        pair_to_player[i] = tensor.player_codes[player_names[team_name][jersey]]
+    return pair_to_player[pair_codes]
+
+# アクションとトラッキングデータの対応付け
+def align_location_tensor(
+    actions : pd.DataFrame, frame_tables : Dict[int, FrameTable], team_names : TeamNames, player_names : PlayerNames,
+    tolerance : Optional[float] = None, mode : str = "nearest", is_print : bool = True
+) -> LocationTensor:
+    tensor = create_empty_location_tensor(player_names, len(actions))
+    a_times = actions["time_seconds"].to_numpy(dtype=np.float64)
+    period_ids = actions["period_id"].to_numpy()
+    frame_nums = np.full(len(actions), -1, dtype=np.int64)
+
+    for period_id, frame_table in frame_tables.items():
+        is_period = period_ids == period_id
+        period_frame_nums = np.full(len(actions), -1, dtype=np.int64)
+        period_frame_nums[is_period] = frame_table.align(a_times[is_period], tolerance, mode)
+        frame_nums[is_period] = period_frame_nums[is_period]
+
+        entry_action_nums, entry_nums = frame_table.take_entries(period_frame_nums)
+        player_codes = take_player_codes(frame_table, entry_nums, tensor, period_id, team_names, player_names)
+        tensor.locations[entry_action_nums, player_codes] = frame_table.locations[entry_nums]
+        tensor.is_present[entry_action_nums, player_codes] = True
+
+    if is_print:
+        for action_num in np.flatnonzero(frame_nums < 0):
+            print(f"action_num: {action_num}, time: {a_times[action_num]} not found in simple_data")
+    return tensor
+
+# 座標データフレームの作成（試合ごとに列の配列を貯め、取り出す時に1回だけ連結）
+class ActionLocationsBuilder:
+    def __init__(self):
+        self.game_columns : Dict[float, List[Dict[str, np.ndarray]]] = {}
+        self.game_frames : Dict[float, pd.DataFrame] = {}
+
+    # 1試合分（または数試合分）のアクションと座標データを追加
+    def append(self, actions : pd.DataFrame, tensor : LocationTensor) -> None:
+        team_to_id = actions.drop_duplicates(subset=["team_id", "team_name"])[["team_name", "team_id"]]
+        team_to_id_dict = dict(zip(team_to_id["team_name"], team_to_id["team_id"]))
+        player_to_id = actions.drop_duplicates(subset=["player_id", "player_name"])[["player_name", "player_id"]]
+        player_to_id_dict = dict(zip(player_to_id["player_name"], player_to_id["player_id"]))
+
+        # 選手軸ごとのIDを先に引いておく（出場していない選手は引かない）
+        team_ids = np.zeros(len(tensor.player_names), dtype=actions["team_id"].dtype)
+        player_ids = np.zeros(len(tensor.player_names), dtype=actions["player_id"].dtype)
+        for player_code in np.flatnonzero(tensor.is_present.any(axis=0)):
+            team_ids[player_code] = team_to_id_dict[tensor.team_names[player_code]]
+            player_ids[player_code] = player_to_id_dict[tensor.player_names[player_code]]
+
+        action_nums, player_codes = np.nonzero(tensor.is_present)
+        game_ids = actions["game_id"].to_numpy()[action_nums]
+        column_values = {
+            "game_id": game_ids,
+            "period_id": actions["period_id"].to_numpy()[action_nums],
+            "team_id": team_ids[player_codes],
+            "player_id": player_ids[player_codes],
+            "location_x": tensor.locations[action_nums, player_codes, 0],
+            "location_y": tensor.locations[action_nums, player_codes, 1],
+            "action_id": actions["action_id"].to_numpy()[action_nums],
+        }
+        for game_id in pd.unique(actions["game_id"]):
+            is_game = game_ids == game_id
+            self.game_columns.setdefault(game_id, []).append({column: values[is_game] for column, values in column_values.items()})
+            self.game_frames.pop(game_id, None)
+
+    # 1試合分のデータフレーム
+    def take_game(self, game_id : float) -> pd.DataFrame:
+        if game_id not in self.game_frames:
+            chunks = self.game_columns[game_id]
+            self.game_frames[game_id] = pd.DataFrame(
+                {column: np.concatenate([chunk[column] for chunk in chunks]) for column in columns}
+            )
+        return self.game_frames[game_id]
+
+    # dict{game_id, DataFrame}（create_action_locationsと同じ形式）
+    def take_action_locations(self) -> Dict[float, pd.DataFrame]:
+        return {game_id: self.take_game(game_id) for game_id in self.game_columns}
+
+    # 全試合分をまとめたデータフレーム
+    def take_all(self) -> pd.DataFrame:
+        chunks = [chunk for game_chunks in self.game_columns.values() for chunk in game_chunks]
+        if not chunks:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame({column: np.concatenate([chunk[column] for chunk in chunks]) for column in columns})
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Optional
+import socceraction.spadl as spadl
+import socceraction.vaep.formula as vaepformula
+from edit.type_def import *
+import edit.file_manager as fm
+import edit.create as cre
+import edit.edit_func as ef
+import edit.eval_func as ev
+
+# キャッシュの保存先（data_path以下）
+cache_dir = ".rating"
+
+# 設定の既定値
+default_config = {
+    "spadl_h5": "spadl-statsbomb.h5",
+    "predictions_h5": "predictions.h5",
+    "gamma": 0.1,
+    "c": 0.1,
+    "is_vdep": True,
+    "tolerance": None,
+    "mode": "nearest",
+    "cache": True,
+    "max_workers": None,
+}
+
+# 各段階の入力ファイル（data_path以下）と設定のキー
+location_inputs = ["1/simple_data.json", "2/simple_data.json", "AnyInfos.txt", "PlayerInfos.txt", "CornerInfos.txt", "Substitutions.txt"]
+location_keys = ["spadl_h5", "tolerance", "mode"]
+rating_keys = ["predictions_h5", "gamma", "c", "is_vdep"]
+
+# 入力ファイルのキー（サイズと更新時刻、無ければNone）
+def take_file_key(file_path : str) -> Optional[Tuple[int, int]]:
+    if not os.path.isfile(file_path):
+        return None
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+# 各段階のキー（前の段階のキーを含むため、上流が変われば下流も変わる）
+def calc_cache_keys(game : Dict, config : Dict) -> Tuple[str, str]:
+    sha = hashlib.sha1(json.dumps([
+        game["game_id"],
+        [take_file_key(os.path.join(game["data_path"], input)) for input in location_inputs],
+        take_file_key(config["spadl_h5"]),
+        [config[key] for key in location_keys],
+    ]).encode())
+    location_key = sha.hexdigest()
+    sha = hashlib.sha1(location_key.encode())
+    sha.update(json.dumps([take_file_key(config["predictions_h5"]), [config[key] for key in rating_keys]]).encode())
+    return location_key, sha.hexdigest()
+
+# キャッシュの読み込み（キーが違えばNone）
+def load_cache(data_path : str, name : str, cache_key : str) -> Optional[Dict]:
+    info_path = os.path.join(data_path, cache_dir, f"{name}.json")
+    if not os.path.isfile(info_path):
+        return None
+    with open(info_path, "r") as file:
+        if json.load(file)["key"] != cache_key:
+            return None
+    with open(os.path.join(data_path, cache_dir, f"{name}.pkl"), "rb") as file:
+        return pickle.load(file)
+
+# キャッシュの保存（jsonを最後に書き込み、途中で止まった場合は無効のまま）
+def save_cache(data_path : str, name : str, cache_key : str, artifacts : Dict) -> None:
+    os.makedirs(os.path.join(data_path, cache_dir), exist_ok=True)
+    info_path = os.path.join(data_path, cache_dir, f"{name}.json")
+    if os.path.isfile(info_path):
+        os.remove(info_path)
+    with open(os.path.join(data_path, cache_dir, f"{name}.pkl"), "wb") as file:
+        pickle.dump(artifacts, file)
+    with open(info_path, "w") as file:
+        json.dump({"key": cache_key}, file)
+
+# アクションデータの読み込み（VAEPの値付き、選手名はニックネームを優先）
+def load_game_actions(game_id : int, config : Dict) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    with pd.HDFStore(config["spadl_h5"], mode="r") as spadlstore:
+        players = spadlstore["players"]
+        teams = spadlstore["teams"]
+        actions = spadlstore[f"actions/game_{game_id}"]
+    actions = (
+        spadl.add_names(actions)
+        .merge(players, how="left")
+        .merge(teams, how="left")
+        .sort_values(["game_id", "period_id", "action_id"])
+        .reset_index(drop=True)
+    )
+    actions["player_name"] = actions[["nickname", "player_name"]].apply(lambda x: x.iloc[0] if x.iloc[0] else x.iloc[1], axis=1)
+    del actions["nickname"]
+
+    preds = pd.read_hdf(config["predictions_h5"], f"game_{game_id}")
+    values = vaepformula.value(
+        config["gamma"], config["c"], config["is_vdep"], actions,
+        preds.scores, preds.concedes, preds.recoveries, preds.losts, preds.attacked, preds.attacks
+    )
+    return pd.concat([actions, preds, values], axis=1), players
+
+# 座標データフレームの作成（対応付け → 座標補正 → コーナー情報 → 欠損選手の補間 → アクション数の削減）
+def create_game_locations(actions : pd.DataFrame, manager : fm.FileManager, config : Dict) -> pd.DataFrame:
+    simple_data_1, simple_data_2 = manager.load_files()
+    team_names, delete_ranges = manager.load_any_file()
+    player_names, player_infos = manager.load_player_file()
+
+    frame_tables = cre.create_frame_tables(simple_data_1, simple_data_2)
+    tensor = cre.create_location_tensor(actions, frame_tables, team_names, player_names, config["tolerance"], config["mode"])
+    ef.edit_tensor_auto(actions, tensor, delete_ranges)
+    ef.add_corner_infos_tensor(tensor, manager.load_corner_file())
+    field_players = cre.create_field_players_by_tensor(tensor, player_infos, manager.load_substitution_file())
+    ef.interpolate_tensor(tensor, field_players)
+    ef.reduct_tensor(tensor, delete_ranges)
+
+    game_id = actions["game_id"].values[0]
+    return cre.create_action_locations_by_tensor(actions, tensor)[game_id]
+
+# 選手ごとの評価値の作成（座標スコア → playersR、キーパーは除外）
+def create_game_playersR(
+    actions : pd.DataFrame, game_locations : pd.DataFrame, players : pd.DataFrame, player_infos : PlayerInfos, gamma : float
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    name_ids = cre.create_name_ids(players, game_locations)
+    heatmaps = cre.create_heatmaps(game_locations)
+    player_ranges = cre.create_player_ranges(game_locations)
+    loc_values = ev.calc_all_location_value(actions, heatmaps, name_ids, player_ranges, gamma)
+
+    playersR = ev.create_playersR(actions, players)
+    playersR = ev.delete_players(playersR, cre.create_keepers(player_infos))
+    playersR = ev.add_location_value_to_playersR(playersR, loc_values)
+    playersR = ev.add_player_infos(playersR, player_infos)
+    return loc_values, playersR
+
+# 1試合分の処理（段階ごとにキャッシュ）
+def run_game(game : Dict, config : Dict) -> Dict:
+    config = {**default_config, **config}
+    data_path = game["data_path"]
+    location_key, rating_key = calc_cache_keys(game, config)
+    report = {"game_id": game["game_id"], "data_path": data_path, "cached": []}
+
+    rating = load_cache(data_path, "rating", rating_key) if config["cache"] else None
+    if rating is not None:
+        report["cached"].append("rating")
+    else:
+        start_time = time.perf_counter()
+        manager = fm.FileManager(data_path)
+        actions, players = load_game_actions(game["game_id"], config)
+        locations = load_cache(data_path, "locations", location_key) if config["cache"] else None
+        if locations is not None:
+            report["cached"].append("locations")
+        else:
+            locations = {"game_locations": create_game_locations(actions, manager, config)}
+            if config["cache"]:
+                save_cache(data_path, "locations", location_key, locations)
+        player_names, player_infos = manager.load_player_file()
+        loc_values, playersR = create_game_playersR(actions, locations["game_locations"], players, player_infos, config["gamma"])
+        playersR["game_id"] = game["game_id"]
+        rating = {"loc_values": loc_values, "playersR": playersR}
+        if config["cache"]:
+            save_cache(data_path, "rating", rating_key, rating)
+        report["time"] = time.perf_counter() - start_time
+
+    report["playersR"] = rating["playersR"]
+    return report
+
+# 複数試合の処理（試合ごとに別プロセス）と試合をまたいだ正規化
+# games: [{"game_id": ..., "data_path": ..., "scorer": [得点者名, ...]}]
+def run_games(games : List[Dict], config : Dict) -> Tuple[List[pd.DataFrame], float]:
+    config = {**default_config, **config}
+    max_workers = config["max_workers"]
+    if len(games) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            reports = list(executor.map(run_game, games, [config] * len(games)))
+    else:
+        reports = [run_game(game, config) for game in games]
+    for report in reports:
+        if "time" in report:
+            print(f"{report['data_path']}: {report['time']:.2f}s")
+        else:
+            print(f"{report['data_path']}: up to date")
+
+    playersR_list = [report["playersR"] for report in reports]
+    beta = ev.calc_beta(playersR_list)
+    ev.calc_total_score(playersR_list, beta)
+    if all("scorer" in game for game in games):
+        ev.calc_is_scorer(playersR_list, [game["scorer"] for game in games])
+        ev.batch_normalization(playersR_list)
+    return playersR_list, beta
+
+# 設定ファイルの読み込み（{"games": [{"game_id": ..., "data_path": ...}], ...共通設定}）
+def load_config(config_path : str) -> Tuple[List[Dict], Dict]:
+    with open(config_path, "r") as file:
+        config = json.load(file)
+    games = config.pop("games")
+    for key in config:
+        if key not in default_config:
+            raise ValueError(f"{key} is not a config key")
+    return games, config
+
+def main(argv : List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="座標スコアを含む選手評価を複数試合まとめて実行")
+    parser.add_argument("config", help="設定ファイル（JSON）")
+    parser.add_argument("output", help="全試合のplayersRの保存先（pickle）")
+    parser.add_argument("--no-cache", action="store_true", help="キャッシュを使わない")
+    args = parser.parse_args(argv)
+
+    games, config = load_config(args.config)
+    if args.no_cache:
+        config["cache"] = False
+    playersR_list, beta = run_games(games, config)
+    print(f"beta = {beta:.4f}")
+    pd.concat(playersR_list, ignore_index=True).to_pickle(args.output)
+    print(f"Saved to {args.output}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
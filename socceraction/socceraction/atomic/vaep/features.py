@@ -16,7 +16,10 @@ from socceraction.vaep.features import (
     bodypart_detailed_onehot,
     bodypart_onehot,
     gamestates,
+    gamestates_tracking,
+    play_left_to_right_tracking,
     player_possession_time,
+    playerlocations_tracking,
     simple,
     speed,
     team,
@@ -28,6 +31,9 @@ __all__ = [
     "feature_column_names",
     "play_left_to_right",
     "gamestates",
+    "gamestates_tracking",
+    "play_left_to_right_tracking",
+    "playerlocations_tracking",
     "actiontype",
     "actiontype_onehot",
     "bodypart",
@@ -2,5 +2,6 @@
 
 from . import features, formula, labels
 from .base import VAEP
+from .store import FeatureStore
 
-__all__ = ["VAEP", "features", "labels", "formula"]
+__all__ = ["VAEP", "FeatureStore", "features", "labels", "formula"]
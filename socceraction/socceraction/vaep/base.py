@@ -8,9 +8,12 @@ xfns_default : list(callable)
 """
 
 import math
-from typing import Any, Optional
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Union
 
 import numpy as np
+import numpy.typing as npt
 import pandas as pd
 from sklearn.exceptions import NotFittedError
 from sklearn.metrics import brier_score_loss, roc_auc_score
@@ -34,6 +37,10 @@ try:
 except ImportError:
     lightgbm = None  # type: ignore
 
+# the classifiers trained by the supported learners
+Classifier = Union[
+    "xgboost.XGBClassifier", "catboost.CatBoostClassifier", "lightgbm.LGBMClassifier"
+]
 
 xfns_default = [
     fs.actiontype_onehot,
@@ -70,6 +77,11 @@ class VAEP:
         if None.
     nb_prev_actions : int, default=3  # noqa: DAR103
         Number of previous actions used to decscribe the game state.
+    nb_players : int, default=10  # noqa: DAR103
+        Number of players whose locations are used to describe the game
+        state when tracking data is given. Every game yields the same
+        location features; missing players are NaN and additional players
+        are dropped.
 
 
     References
@@ -89,14 +101,21 @@ class VAEP:
         self,
         xfns: Optional[list[fs.FeatureTransfomer]] = None,
         nb_prev_actions: int = 3,
+        nb_players: int = 10,
     ) -> None:
         self.__models: dict[str, Any] = {}
         self.xfns = xfns_default if xfns is None else xfns
         # self.yfns = [self._lab.scores, self._lab.concedes]
         self.yfns = [self._lab.scores, self._lab.concedes, self._lab.recoveries, self._lab.losts, self._lab.attacked, self._lab.attacks]
         self.nb_prev_actions = nb_prev_actions
+        self.nb_players = nb_players
 
-    def compute_features(self, game: pd.Series, game_actions: fs.Actions) -> pd.DataFrame:
+    def compute_features(
+        self,
+        game: pd.Series,
+        game_actions: fs.Actions,
+        game_locations: Optional[pd.DataFrame] = None,
+    ) -> pd.DataFrame:
         """
         Transform actions to the feature-based representation of game states.
 
@@ -106,16 +125,35 @@ class VAEP:
             The SPADL representation of a single game.
         game_actions : pd.DataFrame
             The actions performed during `game` in the SPADL representation.
+        game_locations : pd.DataFrame, optional
+            The location of each player at each action of `game` (see
+            :func:`~socceraction.vaep.features.tracking_tensor`). If given,
+            the player locations are added to the features.
 
         Returns
         -------
         features : pd.DataFrame
             Returns the feature-based representation of each game state in the game.
         """
+        gamestates = self._gamestates(game, game_actions)
+        X = [fn(gamestates) for fn in self.xfns]
+        if game_locations is not None:
+            X.append(self._tracking_features(game, game_actions, game_locations))
+        return pd.concat(X, axis=1)
+
+    def _gamestates(self, game: pd.Series, game_actions: fs.Actions) -> fs.GameStates:
         game_actions_with_names = self._spadlcfg.add_names(game_actions)  # type: ignore
         gamestates = self._fs.gamestates(game_actions_with_names, self.nb_prev_actions)
-        gamestates = self._fs.play_left_to_right(gamestates, game.home_team_id)
-        return pd.concat([fn(gamestates) for fn in self.xfns], axis=1)
+        return self._fs.play_left_to_right(gamestates, game.home_team_id)
+
+    def _tracking_features(
+        self, game: pd.Series, game_actions: fs.Actions, game_locations: pd.DataFrame
+    ) -> pd.DataFrame:
+        states = self._fs.gamestates_tracking(
+            game_actions, game_locations, self.nb_prev_actions, self.nb_players
+        )
+        states = self._fs.play_left_to_right_tracking(states, game_actions, game.home_team_id)
+        return self._fs.playerlocations_tracking(states)
 
     def compute_labels(
         self,
@@ -138,7 +176,20 @@ class VAEP:
             Returns the labels of each game state in the game.
         """
         game_actions_with_names = self._spadlcfg.add_names(game_actions)  # type: ignore
-        return pd.concat([fn(game_actions_with_names) for fn in self.yfns], axis=1)
+        return pd.concat(self._apply_yfns(game_actions_with_names, self.yfns), axis=1)
+
+    def _apply_yfns(
+        self, game_actions: fs.Actions, yfns: list[Callable[..., pd.DataFrame]]
+    ) -> list[pd.DataFrame]:
+        # compute the labels supported by the fused label engine in one pass
+        fused_names = getattr(self._lab, "fused_label_names", [])
+        if all(
+            getattr(self._lab, fn.__name__, None) is fn and fn.__name__ in fused_names
+            for fn in yfns
+        ):
+            Y = self._lab.fused_labels(game_actions, [fn.__name__ for fn in yfns])
+            return [Y[[fn.__name__]] for fn in yfns]
+        return [fn(game_actions) for fn in yfns]
 
     def fit(
         self,
@@ -148,10 +199,16 @@ class VAEP:
         val_size: float = 0.25,
         tree_params: Optional[dict[str, Any]] = None,
         fit_params: Optional[dict[str, Any]] = None,
+        n_jobs: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        multi_output: bool = False,
     ) -> "VAEP":
         """
         Fit the model according to the given training data.
 
+        The train and validation data are converted once to float32 and
+        shared by the learners, which are trained concurrently in threads.
+
         Parameters
         ----------
         X : pd.DataFrame
@@ -168,6 +225,14 @@ class VAEP:
             Parameters passed to the constructor of the learner.
         fit_params : dict
             Parameters passed to the fit method of the learner.
+        n_jobs : int, optional
+            The number of CPUs shared by all learners. Uses all CPUs if None.
+        max_workers : int, optional
+            The number of learners trained at the same time. Trains all
+            learners at the same time (up to `n_jobs`) if None.
+        multi_output : bool, default=False  # noqa: DAR103
+            Train a single model for all labels instead of one model per label.
+            Only supported by 'xgboost' and 'catboost'.
 
         Raises
         ------
@@ -180,6 +245,8 @@ class VAEP:
             Fitted VAEP model.
 
         """
+        if learner not in ("xgboost", "catboost", "lightgbm"):
+            raise ValueError(f"A {learner} learner is not supported")
         nb_states = len(X)
         idx = np.random.permutation(nb_states)
         # fmt: off
@@ -193,29 +260,75 @@ class VAEP:
             missing_cols = " and ".join(set(cols).difference(X.columns))
             raise ValueError(f"{missing_cols} are not available in the features dataframe")
 
-        # split train and validation data
-        X_train, y_train = X.iloc[train_idx][cols], y.iloc[train_idx]
-        X_val, y_val = X.iloc[val_idx][cols], y.iloc[val_idx]
+        # convert the features once to float32 and split them in train and
+        # validation data, shared by all learners
+        X = X[cols]
+        float_cols = [col for col, dtype in X.dtypes.items() if dtype.name != "category"]
+        values = X[float_cols].to_numpy(dtype=np.float32)
+        X_train, y_train = self._take_states(X, values, train_idx), y.iloc[train_idx]
+        X_val, y_val = self._take_states(X, values, val_idx), y.iloc[val_idx]
 
         # train classifiers F(X) = Y
-        for col in list(y.columns):
+        labels = list(y.columns)
+        if multi_output:
+            eval_set = [(X_val, y_val)] if val_size > 0 else None
+            model = self._fit_learner(
+                learner, X_train, y_train, eval_set, tree_params, fit_params, n_jobs
+            )
+            for i, col in enumerate(labels):
+                self.__models[col] = _LabelModel(model, i)
+            return self
+
+        nb_cpus = n_jobs or os.cpu_count() or 1
+        nb_workers = max(1, min(len(labels), max_workers or nb_cpus, nb_cpus))
+        nb_threads = max(1, nb_cpus // nb_workers)
+
+        def fit_label(col: str) -> Classifier:
             eval_set = [(X_val, y_val[col])] if val_size > 0 else None
-            if learner == "xgboost":
-                self.__models[col] = self._fit_xgboost(
-                    X_train, y_train[col], eval_set, tree_params, fit_params
-                )
-            elif learner == "catboost":
-                self.__models[col] = self._fit_catboost(
-                    X_train, y_train[col], eval_set, tree_params, fit_params
-                )
-            elif learner == "lightgbm":
-                self.__models[col] = self._fit_lightgbm(
-                    X_train, y_train[col], eval_set, tree_params, fit_params
-                )
-            else:
-                raise ValueError(f"A {learner} learner is not supported")
+            return self._fit_learner(
+                learner, X_train, y_train[col], eval_set, tree_params, fit_params, nb_threads
+            )
+
+        if nb_workers > 1:
+            with ThreadPoolExecutor(max_workers=nb_workers) as executor:
+                models = list(executor.map(fit_label, labels))
+        else:
+            models = [fit_label(col) for col in labels]
+        for col, model in zip(labels, models):
+            self.__models[col] = model
         return self
 
+    @staticmethod
+    def _take_states(
+        X: pd.DataFrame, values: npt.NDArray[np.float32], idx: npt.NDArray[np.int64]
+    ) -> pd.DataFrame:
+        # `values` holds the non-categorical columns of `X` as float32
+        is_categorical = [dtype.name == "category" for dtype in X.dtypes]
+        float_cols = [col for col, is_cat in zip(X.columns, is_categorical) if not is_cat]
+        states = pd.DataFrame(values[idx], columns=float_cols, copy=False)
+        # categorical features are passed to the learner as they are
+        for i, (col, is_cat) in enumerate(zip(X.columns, is_categorical)):
+            if is_cat:
+                states.insert(i, col, X[col].array.take(idx))
+        return states
+
+    def _fit_learner(
+        self,
+        learner: str,
+        X: pd.DataFrame,
+        y: pd.DataFrame,
+        eval_set: Optional[list[tuple[pd.DataFrame, pd.DataFrame]]] = None,
+        tree_params: Optional[dict[str, Any]] = None,
+        fit_params: Optional[dict[str, Any]] = None,
+        nb_threads: Optional[int] = None,
+    ) -> Classifier:
+        fit = {
+            "xgboost": self._fit_xgboost,
+            "catboost": self._fit_catboost,
+            "lightgbm": self._fit_lightgbm,
+        }[learner]
+        return fit(X, y, eval_set, tree_params, fit_params, nb_threads)
+
     def _fit_xgboost(
         self,
         X: pd.DataFrame,
@@ -223,6 +336,7 @@ class VAEP:
         eval_set: Optional[list[tuple[pd.DataFrame, pd.Series]]] = None,
         tree_params: Optional[dict[str, Any]] = None,
         fit_params: Optional[dict[str, Any]] = None,
+        nb_threads: Optional[int] = None,
     ) -> "xgboost.XGBClassifier":
         if xgboost is None:
             raise ImportError("xgboost is not installed.")
@@ -235,6 +349,10 @@ class VAEP:
                 "early_stopping_rounds": 10,
                 "enable_categorical": True,
             }
+            if y.ndim > 1:
+                tree_params = {**tree_params, "eval_metric": "logloss", "tree_method": "hist"}
+        if nb_threads is not None:
+            tree_params = {"n_jobs": nb_threads, **tree_params}
         if fit_params is None:
             fit_params = {"verbose": True}
         if eval_set is not None:
@@ -251,6 +369,7 @@ class VAEP:
         eval_set: Optional[list[tuple[pd.DataFrame, pd.Series]]] = None,
         tree_params: Optional[dict[str, Any]] = None,
         fit_params: Optional[dict[str, Any]] = None,
+        nb_threads: Optional[int] = None,
     ) -> "catboost.CatBoostClassifier":
         if catboost is None:
             raise ImportError("catboost is not installed.")
@@ -261,8 +380,16 @@ class VAEP:
                 "loss_function": "Logloss",
                 "iterations": 100,
             }
+            if y.ndim > 1:
+                tree_params = {
+                    **tree_params,
+                    "eval_metric": "MultiLogloss",
+                    "loss_function": "MultiLogloss",
+                }
+        if nb_threads is not None:
+            tree_params = {"thread_count": nb_threads, **tree_params}
         if fit_params is None:
-            is_cat_feature = [c.dtype.name == "category" for (_, c) in X.iteritems()]
+            is_cat_feature = [c.dtype.name == "category" for (_, c) in X.items()]
             fit_params = {
                 "cat_features": np.nonzero(is_cat_feature)[0].tolist(),
                 "verbose": True,
@@ -281,11 +408,16 @@ class VAEP:
         eval_set: Optional[list[tuple[pd.DataFrame, pd.Series]]] = None,
         tree_params: Optional[dict[str, Any]] = None,
         fit_params: Optional[dict[str, Any]] = None,
+        nb_threads: Optional[int] = None,
     ) -> "lightgbm.LGBMClassifier":
         if lightgbm is None:
             raise ImportError("lightgbm is not installed.")
+        if y.ndim > 1:
+            raise ValueError("A lightgbm learner does not support multiple outputs")
         if tree_params is None:
             tree_params = {"n_estimators": 100, "max_depth": 3}
+        if nb_threads is not None:
+            tree_params = {"n_jobs": nb_threads, **tree_params}
         if fit_params is None:
             fit_params = {"eval_metric": "auc", "verbose": True}
         if eval_set is not None:
@@ -303,8 +435,15 @@ class VAEP:
             raise ValueError(f"{missing_cols} are not available in the features dataframe")
 
         Y_hat = pd.DataFrame()
-        for col in self.__models:
-            Y_hat[col] = [p[1] for p in self.__models[col].predict_proba(X[cols])]
+        # a model shared by several labels only predicts once
+        probas: dict[int, npt.NDArray[np.float64]] = {}
+        for col, model in self.__models.items():
+            if isinstance(model, _LabelModel):
+                if id(model.model) not in probas:
+                    probas[id(model.model)] = model.model.predict_proba(X[cols])
+                Y_hat[col] = probas[id(model.model)][:, model.label]
+            else:
+                Y_hat[col] = model.predict_proba(X[cols])[:, 1]
         return Y_hat
 
     def rate(
@@ -384,3 +523,24 @@ class VAEP:
             scores[col]["auroc"] = roc_auc_score(y[col], y_hat[col])
 
         return scores
+
+
+class _LabelModel:
+    """A single label of a model trained on multiple labels.
+
+    Parameters
+    ----------
+    model : Classifier
+        A classifier whose `predict_proba` returns the probability of each
+        label as a column.
+    label : int
+        The column of the label.
+    """
+
+    def __init__(self, model: Classifier, label: int) -> None:
+        self.model = model
+        self.label = label
+
+    def predict_proba(self, X: pd.DataFrame) -> npt.NDArray[np.float64]:
+        p = self.model.predict_proba(X)[:, self.label]
+        return np.stack([1 - p, p], axis=1)
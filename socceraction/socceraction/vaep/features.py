@@ -1,9 +1,10 @@
 """Implements the feature tranformers of the VAEP framework."""
 
 from functools import wraps
-from typing import Any, Callable, Union, no_type_check
+from typing import Any, Callable, Optional, Union, no_type_check
 
 import numpy as np  # type: ignore
+import numpy.typing as npt
 import pandas as pd  # type: ignore
 from pandera.typing import DataFrame
 
@@ -86,17 +87,104 @@ def gamestates(actions: Actions, nb_prev_actions: int = 3) -> GameStates:
     GameStates
          The <nb_prev_actions> previous actions for each action.
     """
-    if nb_prev_actions < 1:
-        raise ValueError("The game state should include at least one preceding action.")
+    idx = gamestate_indexes(actions, nb_prev_actions)
+    order, starts, _ = _period_positions(actions)
+    first_actions = actions.take(order[starts])
     states = [actions]
     for i in range(1, nb_prev_actions):
-        prev_actions = actions.groupby(["game_id", "period_id"], sort=False, as_index=False).apply(
-            lambda x: x.shift(i, fill_value=float("nan")).fillna(x.iloc[0])  # noqa: B023
-        )
+        prev_actions = actions.take(idx[i])
         prev_actions.index = actions.index.copy()
+        # missing values are taken from the first action of the period
+        prev_actions = prev_actions.where(
+            prev_actions.notna(), first_actions.set_axis(actions.index)
+        )
         states.append(prev_actions)  # type: ignore
     return states
 
+
+def gamestate_indexes(actions: Actions, nb_prev_actions: int = 3) -> npt.NDArray[np.int64]:
+    """Return the positions of the previous actions in each game state.
+
+    Row ``i`` contains for each action the position of the action ``i`` steps
+    earlier in the same game and period. At the start of a period the first
+    action of that period is repeated.
+
+    Parameters
+    ----------
+    actions : Actions
+        A DataFrame with the actions of a game.
+    nb_prev_actions : int, default=3  # noqa: DAR103
+        The number of previous actions included in the game state.
+
+    Raises
+    ------
+    ValueError
+        If the number of actions is smaller than 1.
+
+    Returns
+    -------
+    np.ndarray
+        An integer array of shape (nb_prev_actions, len(actions)).
+    """
+    if nb_prev_actions < 1:
+        raise ValueError("The game state should include at least one preceding action.")
+    order, starts, ranks = _period_positions(actions)
+    lags = np.arange(nb_prev_actions, dtype=np.int64)[:, None]
+    return order[starts + np.maximum(ranks - lags, 0)]
+
+
+def _period_positions(
+    actions: Actions,
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """Locate each action within its game and period.
+
+    Returns the positions of the actions ordered by game and period, and for
+    each action the offset of its period in that order and its rank within
+    the period.
+    """
+    codes = actions.groupby(["game_id", "period_id"], sort=False).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    offsets = np.zeros(codes.max() + 2 if len(codes) else 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(offsets) - 1), out=offsets[1:])
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes), dtype=np.int64) - offsets[codes[order]]
+    return order, offsets[codes], ranks
+
+
+def gamestates_array(
+    actions: Actions, nb_prev_actions: int = 3, columns: Optional[list[str]] = None
+) -> npt.NDArray[Any]:
+    """Convert a dataframe of actions to a 3-D array of gamestates.
+
+    This is the same representation as :func:`gamestates`, but gathered in a
+    single array of shape (nb_prev_actions, len(actions), len(columns)) instead
+    of a list of DataFrames.
+
+    Parameters
+    ----------
+    actions : Actions
+        A DataFrame with the actions of a game.
+    nb_prev_actions : int, default=3  # noqa: DAR103
+        The number of previous actions included in the game state.
+    columns : list(str), optional
+        The columns to include. All columns are included if None.
+
+    Returns
+    -------
+    np.ndarray
+        The <nb_prev_actions> previous actions for each action.
+    """
+    idx = gamestate_indexes(actions, nb_prev_actions)
+    order, starts, _ = _period_positions(actions)
+    values = (actions if columns is None else actions[columns]).to_numpy()
+    states = values[idx]
+    # missing values are taken from the first action of the period
+    is_missing = pd.isna(states[1:])
+    if is_missing.any():
+        first_values = np.broadcast_to(values[order[starts]], states[1:].shape)
+        states[1:][is_missing] = first_values[is_missing]
+    return states
+
 def gamestates_loc(action_locations : pd.DataFrame, players_per_action : int, nb_prev_actions: int = 3) -> list[pd.DataFrame]:
     if nb_prev_actions < 1:
         raise ValueError("The game state should include at least one preceding action.")
@@ -156,6 +244,216 @@ def play_left_to_right_loc(gamestates_loc: list[pd.DataFrame], home_team_id : in
         action_locations.loc[away_idx, "location_y"] = spadlcfg.field_width - action_locations[away_idx]["location_y"].values
     return gamestates_loc
 
+class TrackingGameStates:
+    """The tracking data of the game states of a game.
+
+    The locations of the players are stored once as a dense tensor. Lagging
+    and mirroring only store which action and which orientation to use, so
+    the tensor is not copied until the features are extracted.
+
+    Parameters
+    ----------
+    locations : np.ndarray
+        A float32 array of shape (actions, players, 2) with the location of
+        each player at each action. Missing players are NaN.
+    mask : np.ndarray
+        A boolean array of shape (actions, players) that is True for the
+        players with a location.
+    indexes : np.ndarray
+        An integer array of shape (nb_prev_actions, actions) with the
+        position of the previous actions (see :func:`gamestate_indexes`).
+    index : pd.Index
+        The index of the actions.
+    is_flipped : np.ndarray, optional
+        A boolean array of shape (actions,) that is True for the game states
+        that are mirrored.
+    """
+
+    def __init__(
+        self,
+        locations: npt.NDArray[np.float32],
+        mask: npt.NDArray[np.bool_],
+        indexes: npt.NDArray[np.int64],
+        index: pd.Index,
+        is_flipped: Optional[npt.NDArray[np.bool_]] = None,
+    ) -> None:
+        self.locations = locations
+        self.mask = mask
+        self.indexes = indexes
+        self.index = index
+        self.is_flipped = np.zeros(len(index), dtype=bool) if is_flipped is None else is_flipped
+
+    def __len__(self) -> int:
+        """Return the number of actions in each game state."""
+        return len(self.indexes)
+
+    def __getitem__(self, i: int) -> npt.NDArray[np.float32]:
+        """Return the locations at the ``i``-th previous action of each action."""
+        return self._take(self.indexes[i])
+
+    @property
+    def nb_players(self) -> int:
+        """The number of players per action."""
+        return self.locations.shape[1]
+
+    def take_locations(self) -> npt.NDArray[np.float32]:
+        """Gather the locations of all game states.
+
+        Returns
+        -------
+        np.ndarray
+            A float32 array of shape (nb_prev_actions, actions, players, 2).
+        """
+        return self._take(self.indexes)
+
+    def _take(self, indexes: npt.NDArray[np.int64]) -> npt.NDArray[np.float32]:
+        locations = self.locations[indexes]
+        field_size = np.array([spadlcfg.field_length, spadlcfg.field_width], dtype=locations.dtype)
+        is_flipped = np.broadcast_to(self.is_flipped, indexes.shape)
+        locations[is_flipped] = field_size - locations[is_flipped]
+        return locations
+
+
+def tracking_tensor(
+    actions: Actions, action_locations: pd.DataFrame, nb_players: Optional[int] = None
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.bool_]]:
+    """Convert the player locations of each action to a dense tensor.
+
+    Parameters
+    ----------
+    actions : Actions
+        A DataFrame with the actions of a game.
+    action_locations : pd.DataFrame
+        A DataFrame with one row per player and action, with the columns
+        'game_id', 'action_id', 'location_x' and 'location_y'. The players
+        of each action are stored in the order of the rows.
+    nb_players : int, optional
+        The number of players per action. Uses the largest number of players
+        of an action if None. Additional players are dropped.
+
+    Returns
+    -------
+    tuple(np.ndarray, np.ndarray)
+        A float32 array of shape (actions, players, 2) with the locations,
+        and a boolean array of shape (actions, players) that is True for the
+        players with a location.
+    """
+    keys = pd.MultiIndex.from_frame(actions[["game_id", "action_id"]])
+    action_pos = keys.get_indexer(
+        pd.MultiIndex.from_frame(action_locations[["game_id", "action_id"]])
+    )
+    rows = np.flatnonzero(action_pos >= 0)
+    action_pos = action_pos[rows]
+
+    # the slot of each player within its action
+    order = np.argsort(action_pos, kind="stable")
+    counts = np.bincount(action_pos, minlength=len(actions))
+    offsets = np.cumsum(counts) - counts
+    slots = np.empty(len(rows), dtype=np.int64)
+    slots[order] = np.arange(len(rows), dtype=np.int64) - offsets[action_pos[order]]
+    if nb_players is None:
+        nb_players = int(counts.max()) if len(counts) else 0
+    is_kept = slots < nb_players
+
+    locations = np.full((len(actions), nb_players, 2), np.nan, dtype=np.float32)
+    mask = np.zeros((len(actions), nb_players), dtype=bool)
+    xy = action_locations[["location_x", "location_y"]].to_numpy(dtype=np.float32)[rows]
+    locations[action_pos[is_kept], slots[is_kept]] = xy[is_kept]
+    mask[action_pos[is_kept], slots[is_kept]] = True
+    return locations, mask
+
+
+def gamestates_tracking(
+    actions: Actions,
+    action_locations: pd.DataFrame,
+    nb_prev_actions: int = 3,
+    nb_players: Optional[int] = None,
+) -> TrackingGameStates:
+    """Convert the player locations of each action to tracking game states.
+
+    This is the counterpart of :func:`gamestates` for the tracking data. The
+    previous actions are only stored as indexes into the tracking tensor.
+
+    Parameters
+    ----------
+    actions : Actions
+        A DataFrame with the actions of a game.
+    action_locations : pd.DataFrame
+        A DataFrame with one row per player and action (see
+        :func:`tracking_tensor`).
+    nb_prev_actions : int, default=3  # noqa: DAR103
+        The number of previous actions included in the game state.
+    nb_players : int, optional
+        The number of players per action.
+
+    Returns
+    -------
+    TrackingGameStates
+        The tracking data of the <nb_prev_actions> previous actions for each
+        action.
+    """
+    locations, mask = tracking_tensor(actions, action_locations, nb_players)
+    return TrackingGameStates(
+        locations, mask, gamestate_indexes(actions, nb_prev_actions), actions.index
+    )
+
+
+def play_left_to_right_tracking(
+    states: TrackingGameStates, actions: Actions, home_team_id: int
+) -> TrackingGameStates:
+    """Perform all tracking game states in the same playing direction.
+
+    As in :func:`play_left_to_right`, the player locations of a game state
+    are mirrored if the first action in the game state is performed by the
+    away team.
+
+    Parameters
+    ----------
+    states : TrackingGameStates
+        The tracking game states of a game.
+    actions : Actions
+        The actions of the game.
+    home_team_id : int
+        The ID of the home team.
+
+    Returns
+    -------
+    TrackingGameStates
+        The tracking game states with all actions performed left to right.
+        The tracking tensor is shared with `states`.
+    """
+    is_flipped = actions["team_id"].to_numpy() != home_team_id
+    return TrackingGameStates(
+        states.locations, states.mask, states.indexes, states.index, is_flipped
+    )
+
+
+def playerlocations_tracking(states: TrackingGameStates) -> Features:
+    """Get the location of each player in the tracking game states.
+
+    Parameters
+    ----------
+    states : TrackingGameStates
+        The tracking game states of a game.
+
+    Returns
+    -------
+    Features
+        The 'location_x_p<j>' and 'location_y_p<j>' of each player for each
+        action in the game state, named as in :func:`playerlocations`.
+    """
+    nb_prev_actions, nb_players = len(states), states.nb_players
+    # (lags, actions, players, xy) -> (actions, lags, xy, players)
+    values = states.take_locations().transpose(1, 0, 3, 2).reshape(len(states.index), -1)
+    columns = [
+        f"location_{xy}_p{j}_a{i}"
+        for i in range(nb_prev_actions)
+        for xy in "xy"
+        for j in range(nb_players)
+    ]
+    return pd.DataFrame(values, index=states.index, columns=columns)
+
+
 @no_type_check
 def simple(actionfn: Callable) -> FeatureTransfomer:
     """Make a function decorator to apply actionfeatures to game states.
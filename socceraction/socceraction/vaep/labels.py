@@ -1,5 +1,9 @@
 """Implements the label tranformers of the VAEP framework."""
 
+from typing import Optional, Union
+
+import numpy as np  # type: ignore
+import numpy.typing as npt
 import pandas as pd  # type: ignore
 from pandera.typing import DataFrame
 
@@ -232,3 +236,140 @@ def attacks(actions: DataFrame[SPADLSchema], nr_actions: int = 10) -> pd.DataFra
         res = res | cri | si | ogi
     
     return pd.DataFrame(res, columns=["attacks"])
+
+
+# The events counted by each label in the actions ahead, as
+# (event kinds of the current action, event kinds by the same team,
+# event kinds by the other team).
+_label_events = {
+    "scores": (["goal"], ["goal"], ["owngoal"]),
+    "concedes": (["owngoal"], ["owngoal"], ["goal"]),
+    "recoveries": (["tackle", "interception"], ["tackle", "interception"], []),
+    "losts": ([], [], ["tackle", "interception"]),
+    "attacked": (["owngoal"], ["owngoal"], ["cross", "goal"]),
+    "attacks": (["cross", "goal"], ["cross", "goal"], ["owngoal"]),
+}
+
+fused_label_names = list(_label_events)
+
+
+def _event_kinds(actions: DataFrame[SPADLSchema]) -> dict[str, npt.NDArray[np.bool_]]:
+    """Encode the events used by the labels as boolean arrays.
+
+    The action type names are only scanned once per distinct name.
+    """
+    codes, type_names = pd.factorize(actions["type_name"])
+    result_ids = actions["result_id"].to_numpy()
+    is_success = result_ids == spadl.results.index("success")
+
+    def is_type(name: str) -> npt.NDArray[np.bool_]:
+        return np.array([name in type_name for type_name in type_names], dtype=bool)[codes]
+
+    is_shot = is_type("shot")
+    return {
+        "goal": is_shot & is_success,
+        "owngoal": is_shot & (result_ids == spadl.results.index("owngoal")),
+        "tackle": is_type("tackle") & is_success,
+        "interception": is_type("interception") & is_success,
+        "cross": is_type("cross") & is_success,
+    }
+
+
+def _nr_actions_per_label(
+    names: list[str], nr_actions: Union[int, dict[str, int]]
+) -> dict[str, int]:
+    """Check the labels and return the number of actions to consider for each label."""
+    for name in names:
+        if name not in _label_events:
+            raise ValueError(f"{name} is not supported")
+    if isinstance(nr_actions, int):
+        return dict.fromkeys(names, nr_actions)
+    return nr_actions
+
+
+def _lookahead(
+    actions: DataFrame[SPADLSchema],
+    kinds: dict[str, npt.NDArray[np.bool_]],
+    keys: set[tuple[str, bool]],
+    max_ahead: int,
+) -> dict[tuple[str, bool], npt.NDArray[np.bool_]]:
+    """Find the events in the actions ahead of each action.
+
+    For each (event kind, same team) key, returns an (actions x max_ahead)
+    array whose column ``j`` is True if the event happens for the same (or
+    the other) team within the next ``j + 1`` actions.
+    """
+    n = len(actions)
+    # the position of the action i actions ahead, clipped at the last action
+    idx = np.minimum(np.arange(n)[:, None] + np.arange(1, max_ahead + 1)[None, :], n - 1)
+    team_ids = actions["team_id"].to_numpy()
+    is_same_team = team_ids[idx] == team_ids[:, None]
+    ahead = {}
+    for kind, same_team in keys:
+        events = kinds[kind][idx] & (is_same_team if same_team else ~is_same_team)
+        ahead[kind, same_team] = np.logical_or.accumulate(events, axis=1)
+    return ahead
+
+
+def fused_labels(
+    actions: DataFrame[SPADLSchema],
+    names: Optional[list[str]] = None,
+    nr_actions: Union[int, dict[str, int]] = 10,
+) -> pd.DataFrame:
+    """Compute several labels in a single pass over the actions.
+
+    This gives the same result as calling :func:`scores`, :func:`concedes`,
+    :func:`recoveries`, :func:`losts`, :func:`attacked` and :func:`attacks`
+    separately, but encodes the events only once and computes all labels from
+    one (actions x nr_actions) lookahead matrix.
+
+    Parameters
+    ----------
+    actions : pd.DataFrame
+        The actions of a game.
+    names : list(str), optional
+        The labels to compute. Computes all labels in
+        :attr:`fused_label_names` if None.
+    nr_actions : int or dict(str, int), default=10  # noqa: DAR103
+        Number of actions after the current action to consider, either for
+        all labels or per label.
+
+    Raises
+    ------
+    ValueError
+        If a label is not supported.
+
+    Returns
+    -------
+    pd.DataFrame
+        A dataframe with a column for each label and a row for each action.
+    """
+    names = fused_label_names if names is None else names
+    nr_actions = _nr_actions_per_label(names, nr_actions)
+    n = len(actions)
+    max_ahead = max([nr_actions[name] - 1 for name in names] + [0])
+    kinds = _event_kinds(actions)
+
+    # cumulative "any" over the actions ahead, per event kind and team
+    keys = {
+        (kind, same_team)
+        for name in names
+        for kinds_ahead, same_team in zip(_label_events[name][1:], (True, False))
+        for kind in kinds_ahead
+    }
+    ahead = _lookahead(actions, kinds, keys, max_ahead)
+
+    y = {}
+    for name in names:
+        current_kinds, same_kinds, other_kinds = _label_events[name]
+        res = np.zeros(n, dtype=bool)
+        for kind in current_kinds:
+            res |= kinds[kind]
+        nr = nr_actions[name]
+        if nr >= 2:
+            for kind in same_kinds:
+                res |= ahead[kind, True][:, nr - 2]
+            for kind in other_kinds:
+                res |= ahead[kind, False][:, nr - 2]
+        y[name] = res
+    return pd.DataFrame(y, index=actions.index, columns=names)
@@ -0,0 +1,341 @@
+"""Implements an on-disk store for the features and labels of the VAEP framework.
+
+Each game is stored in its own directory. The output of every feature or
+label transformer is stored as a separate block, keyed on a hash of the
+actions, the transformer and its parameters. A block is only recomputed when
+its key changes, e.g., when a transformer is added or its code is changed.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from functools import partial
+from types import CodeType
+from typing import TYPE_CHECKING, Any, Callable, Optional, Union
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None  # type: ignore
+
+if TYPE_CHECKING:
+    from .base import VAEP
+    from .features import GameStates
+
+store_formats = {"parquet": ".parquet", "feather": ".feather"}
+
+# the block with the player locations of the tracking data
+_tracking_block = "features.playerlocations_tracking"
+
+
+def hash_actions(actions: pd.DataFrame) -> str:
+    """Return a hash of the content of a dataframe of actions.
+
+    Parameters
+    ----------
+    actions : pd.DataFrame
+        The actions of a game.
+
+    Returns
+    -------
+    str
+        A hex digest that changes when the values, columns or index change.
+    """
+    sha = hashlib.sha1(json.dumps([str(c) for c in actions.columns]).encode())
+    sha.update(pd.util.hash_pandas_object(actions, index=True).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+def _update_code(sha: "hashlib._Hash", code: CodeType) -> None:
+    sha.update(code.co_code)
+    for const in code.co_consts:
+        # nested functions and lambdas are hashed by their code
+        if isinstance(const, CodeType):
+            _update_code(sha, const)
+        else:
+            sha.update(repr(const).encode())
+
+
+def hash_transformer(fn: Callable[..., pd.DataFrame]) -> str:
+    """Return a hash of a feature or label transformer.
+
+    The hash is based on the name and code of the transformer, so it changes
+    when the implementation of the transformer changes.
+
+    Parameters
+    ----------
+    fn : callable
+        A feature or label transformer.
+
+    Returns
+    -------
+    str
+        A hex digest of the transformer.
+    """
+    sha = hashlib.sha1()
+    if isinstance(fn, partial):
+        sha.update(repr((fn.args, sorted(fn.keywords.items()))).encode())
+        fn = fn.func
+    # the transformers wrapped by `simple` are hashed by the wrapped function
+    fn = inspect.unwrap(fn)
+    sha.update(f"{fn.__module__}.{fn.__qualname__}".encode())
+    if hasattr(fn, "__code__"):
+        _update_code(sha, fn.__code__)
+    # lambdas created in a loop only differ in the variables they close over
+    for cell in getattr(fn, "__closure__", None) or []:
+        value = cell.cell_contents
+        sha.update((hash_transformer(value) if callable(value) else repr(value)).encode())
+    return sha.hexdigest()
+
+
+def _block_ids(
+    kind: str, fns: list[Callable[..., pd.DataFrame]]
+) -> dict[str, Callable[..., pd.DataFrame]]:
+    # blocks are named after their transformer; repeated transformers, e.g.
+    # two partials of the same function, are numbered in order
+    blocks: dict[str, Callable[..., pd.DataFrame]] = {}
+    for fn in fns:
+        wrapped = inspect.unwrap(fn.func if isinstance(fn, partial) else fn)
+        name = f"{kind}.{wrapped.__module__}.{wrapped.__qualname__}"
+        block_id, i = name, 1
+        while block_id in blocks:
+            block_id, i = f"{name}.{i}", i + 1
+        blocks[block_id] = fn
+    return blocks
+
+
+class FeatureStore:
+    """An on-disk store of the features and labels of a VAEP model.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the store.
+    format : str, default='parquet'  # noqa: DAR103
+        The file format of the blocks, either 'parquet' or 'feather'.
+
+    Raises
+    ------
+    ValueError
+        If the file format is not supported.
+    """
+
+    def __init__(self, path: str, format: str = "parquet") -> None:
+        if format not in store_formats:
+            raise ValueError(f"A {format} store is not supported")
+        self.path = path
+        self.format = format
+
+    def compute_features(
+        self,
+        model: "VAEP",
+        game: pd.Series,
+        game_actions: pd.DataFrame,
+        game_locations: Optional[pd.DataFrame] = None,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        """Load the features of a game, computing only the missing blocks.
+
+        Parameters
+        ----------
+        model : VAEP
+            The model whose feature transformers are used.
+        game : pd.Series
+            The SPADL representation of a single game.
+        game_actions : pd.DataFrame
+            The actions performed during `game` in the SPADL representation.
+        game_locations : pd.DataFrame, optional
+            The location of each player at each action of `game`.
+        columns : list(str), optional
+            The features to load. Loads all features if None.
+
+        Returns
+        -------
+        pd.DataFrame
+            The same features as :meth:`VAEP.compute_features`.
+        """
+        actions_key = hash_actions(game_actions)
+        params = [actions_key, int(game.home_team_id), model.nb_prev_actions]
+        fns = _block_ids("features", model.xfns)
+        keys = {
+            block_id: self._hash_block([*params, block_id], hash_transformer(fn))
+            for block_id, fn in fns.items()
+        }
+        if game_locations is not None:
+            keys[_tracking_block] = self._hash_block(
+                [*params, _tracking_block, model.nb_players], hash_actions(game_locations)
+            )
+
+        gamestates: list["GameStates"] = []
+
+        def compute(block_ids: list[str]) -> list[pd.DataFrame]:
+            blocks = []
+            for block_id in block_ids:
+                if block_id == _tracking_block:
+                    blocks.append(model._tracking_features(game, game_actions, game_locations))
+                    continue
+                # the game states are shared by all blocks
+                if not gamestates:
+                    gamestates.append(model._gamestates(game, game_actions))
+                blocks.append(fns[block_id](gamestates[0]))
+            return blocks
+
+        return self._load(game.game_id, "features", keys, compute, game_actions.index, columns)
+
+    def compute_labels(
+        self,
+        model: "VAEP",
+        game: pd.Series,
+        game_actions: pd.DataFrame,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        """Load the labels of a game, computing only the missing blocks.
+
+        Parameters
+        ----------
+        model : VAEP
+            The model whose label transformers are used.
+        game : pd.Series
+            The SPADL representation of a single game.
+        game_actions : pd.DataFrame
+            The actions performed during `game` in the SPADL representation.
+        columns : list(str), optional
+            The labels to load. Loads all labels if None.
+
+        Returns
+        -------
+        pd.DataFrame
+            The same labels as :meth:`VAEP.compute_labels`.
+        """
+        actions_key = hash_actions(game_actions)
+        fns = _block_ids("labels", model.yfns)
+        keys = {
+            block_id: self._hash_block([actions_key, block_id], hash_transformer(fn))
+            for block_id, fn in fns.items()
+        }
+
+        def compute(block_ids: list[str]) -> list[pd.DataFrame]:
+            game_actions_with_names = model._spadlcfg.add_names(game_actions)
+            return model._apply_yfns(
+                game_actions_with_names, [fns[block_id] for block_id in block_ids]
+            )
+
+        return self._load(game.game_id, "labels", keys, compute, game_actions.index, columns)
+
+    @staticmethod
+    def _hash_block(params: list[Any], fn_key: str) -> str:
+        return hashlib.sha1(json.dumps([*params, fn_key]).encode()).hexdigest()
+
+    def _load(
+        self,
+        game_id: Union[int, str],
+        kind: str,
+        keys: dict[str, str],
+        compute: Callable[[list[str]], list[pd.DataFrame]],
+        index: pd.Index,
+        columns: Optional[list[str]],
+    ) -> pd.DataFrame:
+        game_dir = os.path.join(self.path, str(game_id))
+        manifest = self._load_manifest(game_dir)
+
+        # compute and save the blocks whose key changed
+        missing = [
+            block_id
+            for block_id, key in keys.items()
+            if manifest.get(block_id, {}).get("key") != key
+            or not os.path.isfile(os.path.join(game_dir, manifest[block_id]["file"]))
+        ]
+        computed = dict(zip(missing, compute(missing))) if missing else {}
+        if computed:
+            os.makedirs(game_dir, exist_ok=True)
+        for block_id, block in computed.items():
+            manifest[block_id] = self._save_block(
+                game_dir, keys[block_id], block, manifest.get(block_id)
+            )
+        stale = self._drop_stale_blocks(game_dir, manifest, kind, keys)
+        if computed or stale:
+            self._save_manifest(game_dir, manifest)
+
+        # only the blocks and columns that are needed are read
+        wanted = None if columns is None else set(columns)
+        blocks = []
+        for block_id in keys:
+            block_columns = manifest[block_id]["columns"]
+            if wanted is not None:
+                block_columns = [c for c in block_columns if c in wanted]
+                if not block_columns:
+                    continue
+            if block_id in computed:
+                block = computed[block_id][block_columns]
+            else:
+                block = self._read_block(
+                    os.path.join(game_dir, manifest[block_id]["file"]), block_columns
+                )
+            blocks.append(block.set_axis(index))
+        if not blocks:
+            return pd.DataFrame(index=index, columns=columns)
+        X = pd.concat(blocks, axis=1)
+        return X if columns is None else X[columns]
+
+    @staticmethod
+    def _drop_stale_blocks(
+        game_dir: str, manifest: dict[str, Any], kind: str, keys: dict[str, str]
+    ) -> list[str]:
+        # drop the blocks of transformers that were removed from the model
+        stale = [
+            block_id
+            for block_id in manifest
+            if block_id.startswith(f"{kind}.")
+            and block_id not in keys
+            and block_id != _tracking_block
+        ]
+        for block_id in stale:
+            file_path = os.path.join(game_dir, manifest.pop(block_id)["file"])
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+        return stale
+
+    @staticmethod
+    def _load_manifest(game_dir: str) -> dict[str, Any]:
+        manifest_path = os.path.join(game_dir, "manifest.json")
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_manifest(game_dir: str, manifest: dict[str, Any]) -> None:
+        manifest_path = os.path.join(game_dir, "manifest.json")
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _save_block(
+        self, game_dir: str, key: str, block: pd.DataFrame, entry: Optional[dict[str, Any]]
+    ) -> dict[str, Any]:
+        if pyarrow is None:
+            raise ImportError("pyarrow is not installed.")
+        file_name = key + store_formats[self.format]
+        file_path = os.path.join(game_dir, file_name)
+        data = block.reset_index(drop=True)
+        if self.format == "parquet":
+            data.to_parquet(file_path + ".tmp", index=False)
+        else:
+            data.to_feather(file_path + ".tmp")
+        os.replace(file_path + ".tmp", file_path)
+        # remove the outdated block
+        if entry is not None and entry["file"] != file_name:
+            old_path = os.path.join(game_dir, entry["file"])
+            if os.path.isfile(old_path):
+                os.remove(old_path)
+        return {"key": key, "file": file_name, "columns": [str(c) for c in block.columns]}
+
+    def _read_block(self, file_path: str, columns: list[str]) -> pd.DataFrame:
+        if pyarrow is None:
+            raise ImportError("pyarrow is not installed.")
+        if self.format == "parquet":
+            return pd.read_parquet(file_path, columns=columns)
+        return pd.read_feather(file_path, columns=columns)
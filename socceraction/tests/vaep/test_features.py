@@ -1,3 +1,5 @@
+import numpy as np
+import pandas as pd
 import socceraction.spadl as spadl
 import socceraction.spadl as spadlcfg
 from pandas import testing as tm
@@ -130,3 +132,61 @@ def test_time_delta(spadl_actions: DataFrame[SPADLSchema]) -> None:
     assert out.loc[200, "time_delta_2"] == 0.0
     assert out.loc[201, "time_delta_1"] == 1.32
     assert out.loc[201, "time_delta_2"] == 1.32
+
+
+def test_gamestates(spadl_actions: DataFrame[SPADLSchema]) -> None:
+    gamestates = fs.gamestates(spadl_actions, 3)
+    assert len(gamestates) == 3
+    # previous actions within the same period
+    assert gamestates[1].loc[2, "action_id"] == spadl_actions.loc[1, "action_id"]
+    assert gamestates[2].loc[2, "action_id"] == spadl_actions.loc[0, "action_id"]
+    # the first action of a period is repeated
+    assert gamestates[1].loc[0, "action_id"] == spadl_actions.loc[0, "action_id"]
+    assert gamestates[2].loc[201, "action_id"] == spadl_actions.loc[200, "action_id"]
+    tm.assert_index_equal(gamestates[2].index, spadl_actions.index)
+
+
+def test_gamestates_array(spadl_actions: DataFrame[SPADLSchema]) -> None:
+    gamestates = fs.gamestates(spadl_actions, 3)
+    states = fs.gamestates_array(spadl_actions, 3, ["start_x", "time_seconds"])
+    assert states.shape == (3, len(spadl_actions), 2)
+    for i, actions in enumerate(gamestates):
+        assert (states[i] == actions[["start_x", "time_seconds"]].to_numpy()).all()
+
+
+def _action_locations(spadl_actions: DataFrame[SPADLSchema], nb_players: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "game_id": np.repeat(spadl_actions.game_id.values, nb_players),
+            "action_id": np.repeat(spadl_actions.action_id.values, nb_players),
+            "location_x": rng.uniform(0, 105, nb_players * len(spadl_actions)),
+            "location_y": rng.uniform(0, 68, nb_players * len(spadl_actions)),
+        }
+    )
+
+
+def test_gamestates_tracking(spadl_actions: DataFrame[SPADLSchema]) -> None:
+    action_locations = _action_locations(spadl_actions, 4)
+    states = fs.gamestates_tracking(spadl_actions, action_locations.iloc[1:], 3)
+    assert states.locations.shape == (len(spadl_actions), 4, 2)
+    assert states.locations.dtype == np.float32
+    # the first action lacks one player
+    assert states.mask[0].sum() == 3
+    assert np.isnan(states.locations[0, 3]).all()
+    assert np.allclose(states[2][201], states.locations[200])
+    # mirroring is applied to the game states of the away team
+    ltr_states = fs.play_left_to_right_tracking(states, spadl_actions, 782)
+    assert ltr_states.locations is states.locations
+    away = spadl_actions.team_id.values != 782
+    assert np.allclose(ltr_states[1][away], np.array([105, 68]) - states[1][away], equal_nan=True)
+    assert np.allclose(ltr_states[1][~away], states[1][~away], equal_nan=True)
+
+
+def test_playerlocations_tracking(spadl_actions: DataFrame[SPADLSchema]) -> None:
+    spadl_actions = spadl_actions.set_index(spadl_actions.index + 10)
+    states = fs.gamestates_tracking(spadl_actions, _action_locations(spadl_actions, 4), 2)
+    out = fs.playerlocations_tracking(states)
+    assert out.shape == (len(spadl_actions), 2 * 2 * 4)
+    tm.assert_index_equal(out.index, spadl_actions.index)
+    assert np.allclose(out["location_y_p2_a1"].values, states[1][:, 2, 1])
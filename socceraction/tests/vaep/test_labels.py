@@ -16,3 +16,22 @@ def test_conceds(spadl_actions: DataFrame[SPADLSchema]) -> None:
     spadl_actions = spu.add_names(spadl_actions)
     concedes = lab.concedes(spadl_actions, nr_actions)
     assert len(concedes) == len(spadl_actions)
+
+
+def test_fused_labels(spadl_actions: DataFrame[SPADLSchema]) -> None:
+    spadl_actions = spu.add_names(spadl_actions)
+    fns = [lab.scores, lab.concedes, lab.recoveries, lab.losts, lab.attacked, lab.attacks]
+    for nr_actions in [2, 10]:
+        labels = lab.fused_labels(spadl_actions, nr_actions=nr_actions)
+        assert list(labels.columns) == [fn.__name__ for fn in fns]
+        for fn in fns:
+            expected = fn(spadl_actions, nr_actions).iloc[:, 0]
+            assert (labels[fn.__name__] == expected).all()
+
+
+def test_fused_labels_nr_actions_per_label(spadl_actions: DataFrame[SPADLSchema]) -> None:
+    spadl_actions = spu.add_names(spadl_actions)
+    labels = lab.fused_labels(spadl_actions, ["losts", "scores"], {"losts": 5, "scores": 20})
+    assert list(labels.columns) == ["losts", "scores"]
+    assert (labels["losts"] == lab.losts(spadl_actions, 5)["losts"]).all()
+    assert (labels["scores"] == lab.scores(spadl_actions, 20)["scores"]).all()
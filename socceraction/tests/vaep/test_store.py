@@ -0,0 +1,93 @@
+import json
+import os
+from functools import partial
+
+import pandas as pd
+import pytest
+from pandas import testing as tm
+from pandera.typing import DataFrame
+from socceraction.spadl import SPADLSchema
+from socceraction.vaep import VAEP, FeatureStore
+from socceraction.vaep import features as fs
+
+pytest.importorskip("pyarrow")
+
+game = pd.Series({"game_id": 8657, "home_team_id": 782})
+
+
+@pytest.mark.parametrize("format", ["parquet", "feather"])
+def test_compute_features(
+    spadl_actions: DataFrame[SPADLSchema], tmp_path: str, format: str
+) -> None:
+    model = VAEP(xfns=[fs.actiontype, fs.startlocation], nb_prev_actions=2)
+    store = FeatureStore(str(tmp_path), format)
+    expected = model.compute_features(game, spadl_actions)
+    tm.assert_frame_equal(store.compute_features(model, game, spadl_actions), expected)
+    # second call is read from disk
+    tm.assert_frame_equal(store.compute_features(model, game, spadl_actions), expected)
+    out = store.compute_features(
+        model, game, spadl_actions, columns=["start_y_a1", "actiontype_a0"]
+    )
+    tm.assert_frame_equal(out, expected[["start_y_a1", "actiontype_a0"]])
+
+
+def test_compute_features_adds_block(spadl_actions: DataFrame[SPADLSchema], tmp_path: str) -> None:
+    model = VAEP(xfns=[fs.actiontype], nb_prev_actions=2)
+    store = FeatureStore(str(tmp_path))
+    store.compute_features(model, game, spadl_actions)
+    block_files = set(os.listdir(os.path.join(tmp_path, "8657")))
+    model.xfns = [fs.actiontype, fs.startlocation]
+    out = store.compute_features(model, game, spadl_actions)
+    tm.assert_frame_equal(out, model.compute_features(game, spadl_actions))
+    # the existing block is kept and one block is added
+    assert block_files <= set(os.listdir(os.path.join(tmp_path, "8657")))
+    assert len(os.listdir(os.path.join(tmp_path, "8657"))) == len(block_files) + 1
+
+
+def test_compute_labels(spadl_actions: DataFrame[SPADLSchema], tmp_path: str) -> None:
+    model = VAEP()
+    store = FeatureStore(str(tmp_path))
+    expected = model.compute_labels(game, spadl_actions)
+    tm.assert_frame_equal(store.compute_labels(model, game, spadl_actions), expected)
+    # changed actions invalidate the stored labels
+    changed_actions = spadl_actions.copy()
+    changed_actions.loc[0, "result_id"] = 1 - changed_actions.loc[0, "result_id"]
+    out = store.compute_labels(model, game, changed_actions)
+    tm.assert_frame_equal(out, model.compute_labels(game, changed_actions))
+
+
+def _scaled_start_x(gamestates: fs.GameStates, scale: float) -> pd.DataFrame:
+    return pd.DataFrame({f"start_x_x{scale}": gamestates[0].start_x * scale})
+
+
+def test_compute_features_partials(spadl_actions: DataFrame[SPADLSchema], tmp_path: str) -> None:
+    xfns: list[fs.FeatureTransfomer] = [
+        partial(_scaled_start_x, scale=2),
+        partial(_scaled_start_x, scale=3),
+    ]
+    model = VAEP(xfns=xfns, nb_prev_actions=1)
+    store = FeatureStore(str(tmp_path))
+    expected = model.compute_features(game, spadl_actions)
+    assert list(expected.columns) == ["start_x_x2", "start_x_x3"]
+    tm.assert_frame_equal(store.compute_features(model, game, spadl_actions), expected)
+    tm.assert_frame_equal(store.compute_features(model, game, spadl_actions), expected)
+
+
+def test_compute_features_drops_block(
+    spadl_actions: DataFrame[SPADLSchema], tmp_path: str
+) -> None:
+    model = VAEP(xfns=[fs.actiontype, fs.startlocation], nb_prev_actions=2)
+    store = FeatureStore(str(tmp_path))
+    store.compute_features(model, game, spadl_actions)
+    store.compute_labels(model, game, spadl_actions)
+    game_dir = os.path.join(tmp_path, "8657")
+    nb_files = len(os.listdir(game_dir))
+    model.xfns = [fs.actiontype]
+    out = store.compute_features(model, game, spadl_actions)
+    tm.assert_frame_equal(out, model.compute_features(game, spadl_actions))
+    # the block of the removed transformer is deleted, the labels are kept
+    assert len(os.listdir(game_dir)) == nb_files - 1
+    with open(os.path.join(game_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    assert not any("startlocation" in block_id for block_id in manifest)
+    assert sum(block_id.startswith("labels.") for block_id in manifest) == len(model.yfns)
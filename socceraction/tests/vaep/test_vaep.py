@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pytest
 from socceraction.vaep import VAEP
@@ -51,3 +52,40 @@ def test_predict_with_missing_features(sb_worldcup_data: pd.HDFStore, vaep_model
     del X["period_id_a0"]
     with pytest.raises(ValueError):
         vaep_model.rate(game, actions, X)
+
+
+@pytest.mark.parametrize("multi_output", [False, True])
+def test_fit_concurrent(spadl_actions: pd.DataFrame, multi_output: bool) -> None:
+    pytest.importorskip("xgboost")
+    model = VAEP(nb_prev_actions=1)
+    game = pd.Series({"home_team_id": 782})
+    features = model.compute_features(game, spadl_actions)
+    labels = model.compute_labels(game, spadl_actions)
+    labels.iloc[::7] = True
+    model.fit(features, labels, n_jobs=2, max_workers=2, multi_output=multi_output)
+    scores = model.score(features, labels)
+    assert set(scores) == set(labels.columns)
+
+
+@pytest.mark.parametrize("nb_players", [4, 12])
+def test_compute_features_tracking_columns(spadl_actions: pd.DataFrame, nb_players: int) -> None:
+    model = VAEP(nb_prev_actions=2)
+    game = pd.Series({"home_team_id": 782})
+    rng = np.random.default_rng(0)
+    action_locations = pd.DataFrame(
+        {
+            "game_id": np.repeat(spadl_actions.game_id.values, nb_players),
+            "action_id": np.repeat(spadl_actions.action_id.values, nb_players),
+            "location_x": rng.uniform(0, 105, nb_players * len(spadl_actions)),
+            "location_y": rng.uniform(0, 68, nb_players * len(spadl_actions)),
+        }
+    )
+    features = model.compute_features(game, spadl_actions, action_locations)
+    # every game has the same location features, whatever its number of players
+    expected_columns = [
+        f"location_{xy}_p{j}_a{i}" for i in range(2) for xy in "xy" for j in range(10)
+    ]
+    assert list(features.columns[-len(expected_columns) :]) == expected_columns
+    assert features[f"location_x_p{min(nb_players, 10) - 1}_a0"].notna().all()
+    if nb_players < 10:
+        assert features["location_x_p9_a0"].isna().all()
@@ -5,4 +5,5 @@ from . import edit_func as ef
 from . import search as sea
 from . import plot as pl
 from . import interpolate as inter
-from . import gshota
\ No newline at end of file
+from . import gshota
+from . import frame_store as fst
\ No newline at end of file
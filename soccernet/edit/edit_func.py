@@ -1,6 +1,10 @@
 import copy
-from typing import List, Dict, Tuple
+import numpy as np
+from typing import List, Dict, Tuple, Callable
+from scipy.optimize import linear_sum_assignment
 from edit.type_def import *
+from edit.frame_store import FrameStore
+from edit.filter_delete import TrackIndex
 import edit.convert_take as con
 import edit.math_func as mf
 
@@ -133,6 +137,180 @@ def get_nan_data(data_list : List[Data], data_num : int) -> List[Entry]:
                 nan_data.append(entry)
     return nan_data
 
+# 割当不可の組に与えるコスト
+invalid_cost = 1e6
+
+# 各選手情報の配列表現（player_listと同じ並び）
+class PlayerArrays:
+    def __init__(self, player_list : PlayerList):
+        self.player_list = player_list
+        self.jerseis = list(player_list.keys())
+        self.codes = {jersey: i for i, jersey in enumerate(self.jerseis)}
+        n = len(self.jerseis)
+        self.positions = np.zeros((n, 2), dtype=np.float64)
+        self.locations = np.full((n, 2), np.nan)
+        self.relations = np.full((n, n, 2), np.nan) #[jersey, o_jersey] -> sub_vector
+        self.has_relation = np.zeros(n, dtype=bool)
+        for i, p_info in enumerate(player_list.values()):
+            self.positions[i] = p_info["position"]
+            if len(p_info["location"]) == 2:
+                self.locations[i] = p_info["location"]
+            self.has_relation[i] = p_info["relation"] != {}
+            for o_jersey, sub_vector in p_info["relation"].items():
+                if o_jersey in self.codes:
+                    self.relations[i, self.codes[o_jersey]] = sub_vector
+
+    # 配列の内容をplayer_listへ書き戻す
+    def write_back(self) -> None:
+        for i, p_info in enumerate(self.player_list.values()):
+            if not np.isnan(self.locations[i, 0]):
+                p_info["location"] = self.locations[i].tolist()
+            for j in np.flatnonzero(~np.isnan(self.relations[i, :, 0])):
+                p_info["relation"][self.jerseis[j]] = self.relations[i, j].tolist()
+
+    # 各選手情報の更新（frame_locations: フレーム内の各選手の座標、居なければnan）
+    def update(self, frame_locations : np.ndarray, is_loc : bool) -> None:
+        present = ~np.isnan(frame_locations[:, 0])
+        self.locations[present] = frame_locations[present]
+        if is_loc:
+            return
+        pair = present[:, None] & present[None, :]
+        np.fill_diagonal(pair, False)
+        sub_vectors = frame_locations[:, None, :] - frame_locations[None, :, :]
+        self.relations[pair] = sub_vectors[pair]
+        self.has_relation |= pair.any(axis=1)
+
+# キャッシュ済みの配列表現の取得
+def take_player_arrays(player_list : PlayerList, arrays_cache : Dict[int, PlayerArrays]) -> PlayerArrays:
+    key = id(player_list)
+    if key not in arrays_cache or arrays_cache[key].player_list is not player_list:
+        arrays_cache[key] = PlayerArrays(player_list)
+    return arrays_cache[key]
+
+# フレーム内の背番号ありの選手の座標（同じ背番号が複数あれば後のものを採用）
+def take_frame_locations(
+    data_num : int, locations : np.ndarray, jerseis : List[str], teams : List[str],
+    arrays : PlayerArrays, e_team : str, is_print : bool = False
+) -> Tuple[np.ndarray, bool]:
+    frame_locations = np.full((len(arrays.jerseis), 2), np.nan)
+    has_other = False
+    for location, jersey, team in zip(locations, jerseis, teams):
+        if np.isnan(location[0]) or jersey == "" or team != e_team:
+            continue
+        has_other = True
+        if jersey in arrays.codes:
+            frame_locations[arrays.codes[jersey]] = location
+        elif is_print:
+            print(f"{data_num}: {jersey}, {team} not found")
+    return frame_locations, has_other
+
+# 座標由来のコスト行列（検出×(候補+背番号が無いデータ)）
+def calc_location_costs(
+    arrays : PlayerArrays, det_locations : np.ndarray, frame_locations : np.ndarray,
+    max_distance : float, nan_locations : np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    candidates = arrays.has_relation & np.isnan(frame_locations[:, 0])
+    targets = np.concatenate([arrays.locations, nan_locations])
+    is_target = np.concatenate([candidates, np.ones(len(nan_locations), dtype=bool)])
+    distances = np.linalg.norm(det_locations[:, None, :] - targets[None, :, :], axis=2)
+    with np.errstate(invalid="ignore"):
+        valid = is_target[None, :] & (distances < max_distance)
+    return distances, valid
+
+# 関係性由来のコスト行列（検出×候補）
+def calc_relation_costs(
+    arrays : PlayerArrays, det_locations : np.ndarray, frame_locations : np.ndarray,
+    min_match : float, min_order : float
+) -> Tuple[np.ndarray, np.ndarray]:
+    present = ~np.isnan(frame_locations[:, 0])
+    candidates = arrays.has_relation & ~present
+    sub_vectors = det_locations[:, None, :] - frame_locations[None, :, :] #[det, o_jersey]
+    common = present[None, :] & ~np.isnan(arrays.relations[:, :, 0]) #[jersey, o_jersey]
+    num = common.sum(axis=1)
+
+    # コサイン類似度
+    p_relations = np.where(common[:, :, None], arrays.relations, 0.0)
+    d_relations = np.where(present[:, None], sub_vectors, 0.0)
+    dots = np.einsum("dok,cok->dco", d_relations, p_relations)
+    norms = np.linalg.norm(d_relations, axis=2)[:, None, :] * np.linalg.norm(p_relations, axis=2)[None, :, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos = np.where(common[None, :, :], dots / norms, 0.0)
+
+    # 順番の一致（同じラインなら横方向、違うラインなら縦方向で比較）
+    positions = arrays.positions
+    same_line = positions[:, None, 0] == positions[None, :, 0]
+    axis = np.where(same_line, 1, 0)
+    position_order = np.take_along_axis(positions[:, None, :] > positions[None, :, :], axis[:, :, None], axis=2)[:, :, 0]
+    sub_order = d_relations[:, None, :, :] > 0 #[det, 1, o_jersey, xy]
+    sub_order = np.where(same_line[None, :, :], sub_order[..., 1], sub_order[..., 0])
+    order = (sub_order == position_order[None, :, :]) & common[None, :, :]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        match = cos.sum(axis=2) / num[None, :]
+        order_score = order.sum(axis=2) / num[None, :]
+        valid = (candidates & (num > 0))[None, :] & (match > min_match / num[None, :]) & (order_score > min_order)
+    return -match, valid
+
+# コスト行列から検出と候補の組を一括で決定
+def assign_jerseis(costs : np.ndarray, valid : np.ndarray) -> List[Tuple[int, int]]:
+    if not valid.any():
+        return []
+    rows, cols = linear_sum_assignment(np.where(valid, costs, invalid_cost))
+    return [(r, c) for r, c in zip(rows.tolist(), cols.tolist()) if valid[r, c]]
+
+# フレーム単位の背番号予測（全検出×全候補をまとめてスコア化して割当）
+def predict_frame_jerseis(
+    data_num : int, locations : np.ndarray, track_ids : List[float], jerseis : List[str], teams : List[str], roles : List[str],
+    arrays_left : PlayerArrays, arrays_right : PlayerArrays, is_loc : bool, nan_locations : np.ndarray,
+    min_match : float, max_distance : float, min_order : float
+) -> List[Tuple[float, str, str]]:
+    edits : List[Tuple[float, str, str]] = []
+    targets = [
+        i for i in range(len(track_ids))
+        if not np.isnan(locations[i, 0]) and jerseis[i] == "" and teams[i] != "nan"
+    ]
+
+    # ゴールキーパーは背番号が無いデータとして扱う
+    keeper_ids = {track_ids[i] for i in targets if roles[i] == "goalkeeper"}
+    for track_id in keeper_ids:
+        edits.append((track_id, "", "nan"))
+    targets = [i for i in targets if track_ids[i] not in keeper_ids]
+
+    groups : Dict[str, List[int]] = {}
+    for i in targets:
+        groups.setdefault(teams[i], []).append(i)
+
+    for team, dets in groups.items():
+        arrays = arrays_left if team == "left" else arrays_right
+        frame_locations, has_other = take_frame_locations(data_num, locations, jerseis, teams, arrays, team)
+        det_locations = locations[dets]
+        if nan_locations is not None:
+            costs, valid = calc_location_costs(arrays, det_locations, frame_locations, max_distance, nan_locations)
+        elif not has_other or is_loc:
+            costs, valid = calc_location_costs(arrays, det_locations, frame_locations, max_distance, np.zeros((0, 2)))
+        else:
+            costs, valid = calc_relation_costs(arrays, det_locations, frame_locations, min_match, min_order)
+
+        for r, c in sorted(assign_jerseis(costs, valid)):
+            if c >= len(arrays.jerseis):
+                edits.append((track_ids[dets[r]], "", "nan"))
+            else:
+                edits.append((track_ids[dets[r]], arrays.jerseis[c], ""))
+    return edits
+
+# 背番号が無いデータの座標
+def take_nan_locations(nan_data : List[Entry]) -> np.ndarray:
+    nan_locations = np.zeros((len(nan_data), 2), dtype=np.float64)
+    for i, entry in enumerate(nan_data):
+        nan_locations[i] = con.take_entry_info(entry)[0]
+    return nan_locations
+
+# 背番号が無いデータの座標（FrameStore、最終フレーム）
+def take_nan_locations_store(store : FrameStore) -> np.ndarray:
+    sl = store.frame_slice(max_frame)
+    nan_mask = store.has_location()[sl] & (store.team[sl] == store.teams.find("nan"))
+    return np.column_stack([store.x[sl], store.y[sl]])[nan_mask]
+
 class EditFunc:
     def __init__(self, start_data_num : int, end_data_num : int):
         self.start_data_num = start_data_num
@@ -171,67 +349,210 @@ class EditFunc:
                 for track_id, jersey_number, team in edit_infos:
                     self.edit_data(data, data_num, start_frame, end_frame, True, track_id, jersey_number, team)
     
+    # 背番号削除（FrameStore）
+    def delete_jersey_number_store(self, stores : List[FrameStore]) -> None:
+        for data_num in range(self.start_data_num, self.end_data_num + 1):
+            self.delete_jersey_number_clip(stores[data_num])
+
+    # 背番号削除（FrameStore、1ファイル分）
+    def delete_jersey_number_clip(self, store : FrameStore) -> None:
+        store.jersey[store.frame >= 1] = store.jerseis.code("")
+        store.mark_dirty()
+
+    # track_idによる補正（FrameStore）
+    def edit_data_store(
+        self, store : FrameStore, start_frame : int, end_frame : int,
+        is_overwrite : bool, e_track_id : float, e_jersey : str, e_team : str
+    ) -> None:
+        mask = store.in_frames(start_frame, end_frame) & store.has_location() & (store.track_id == e_track_id)
+        if not is_overwrite:
+            mask &= (store.jersey == store.jerseis.find("")) & (store.team != store.teams.find("nan"))
+        store.jersey[mask] = store.jerseis.code(e_jersey)
+        if e_team != "":
+            store.team[mask] = store.teams.code(e_team)
+        store.mark_dirty()
+
+    # 手動補正（FrameStore）
+    def edit_data_manual_store(self, stores : List[FrameStore], edit_numbers : List[Edit]) -> None:
+        for data_num in range(self.start_data_num, self.end_data_num + 1):
+            self.edit_data_manual_clip(stores[data_num], edit_numbers[data_num])
+
+    # 手動補正（FrameStore、1ファイル分）
+    def edit_data_manual_clip(self, store : FrameStore, edit_number : Edit) -> None:
+        for (start_frame, end_frame), edit_infos in edit_number.items():
+            for track_id, jersey_number, team in edit_infos:
+                self.edit_data_store(store, start_frame, end_frame, True, track_id, jersey_number, team)
+
+    # track_idによる補正（TrackIndexで該当エントリーのみ走査）
+    def edit_track(
+        self, track_index : TrackIndex, is_overwrite : bool, e_track_id : float, e_jersey : str, e_team : str
+    ) -> None:
+        for frame_num, positions in track_index.tracks.get(e_track_id, {}).items():
+            frame_data = track_index.data[track_index.frame_ids[frame_num]]
+            for position in positions:
+                entry = frame_data[position]
+                location, track_id, jersey, team = con.take_entry_info(entry)
+                if location == "":
+                    continue
+                if (jersey != "" or team == "nan") and not is_overwrite:
+                    continue
+                entry["jersey"] = e_jersey
+                if e_team != "":
+                    entry["team"] = e_team
+
+    # track_idによる補正（FrameStore、track_idの行インデックスを利用）
+    def edit_track_store(
+        self, store : FrameStore, is_overwrite : bool, e_track_id : float, e_jersey : str, e_team : str
+    ) -> None:
+        rows = store.take_track_rows().get(e_track_id)
+        if rows is None:
+            return
+        rows = rows[(store.frame[rows] >= 1) & (store.frame[rows] <= max_frame) & (store.has_location()[rows])]
+        if not is_overwrite:
+            rows = rows[(store.jersey[rows] == store.jerseis.find("")) & (store.team[rows] != store.teams.find("nan"))]
+        store.jersey[rows] = store.jerseis.code(e_jersey)
+        if e_team != "":
+            store.team[rows] = store.teams.code(e_team)
+        store.mark_dirty()
+
     # 自動補正
     def edit_data_auto(
         self, data_list : List[Data], player_lists_left : PlayerLists, player_lists_right : PlayerLists,
         min_match : float, max_distance : float, min_order : float, set_frames : Frame
+    ) -> None:
+        def iterate_frames(data_num : int):
+            data = data_list[data_num]
+            track_index = TrackIndex(data, data_num)
+            exist_frame_num = calc_exist_frame_num(data, data_num)
+            nan_locations = take_nan_locations(get_nan_data(data_list, data_num))
+            for frame_num, frame_data in con.iterate_frame_datas(data, data_num, 1, max_frame):
+                locations = np.full((len(frame_data), 2), np.nan)
+                track_ids, jerseis, teams, roles = [], [], [], []
+                for i, entry in enumerate(frame_data):
+                    location, track_id, jersey, team = con.take_entry_info(entry)
+                    if location != "":
+                        locations[i] = location
+                    track_ids.append(track_id)
+                    jerseis.append(jersey)
+                    teams.append(team)
+                    roles.append(entry["role"])
+                edit = lambda e_track_id, e_jersey, e_team: self.edit_track(track_index, False, e_track_id, e_jersey, e_team)
+                yield frame_num, frame_num == exist_frame_num, nan_locations, (locations, track_ids, jerseis, teams, roles), edit
+
+        self.run_edit_auto(
+            iterate_frames, player_lists_left, player_lists_right, min_match, max_distance, min_order, set_frames
+        )
+
+    # 自動補正（FrameStore）
+    def edit_data_auto_store(
+        self, stores : List[FrameStore], player_lists_left : PlayerLists, player_lists_right : PlayerLists,
+        min_match : float, max_distance : float, min_order : float, set_frames : Frame
+    ) -> None:
+        def iterate_frames(data_num : int):
+            nan_locations = take_nan_locations_store(stores[data_num - 1]) if data_num > 0 else np.zeros((0, 2))
+            return self.iterate_frames_store(stores[data_num], nan_locations)
+
+        self.run_edit_auto(
+            iterate_frames, player_lists_left, player_lists_right, min_match, max_distance, min_order, set_frames
+        )
+
+    # 自動補正用のフレーム走査（FrameStore、nan_locationsは前のファイルの背番号が無いデータの座標）
+    def iterate_frames_store(self, store : FrameStore, nan_locations : np.ndarray):
+        has_location = store.has_location()
+        locations = np.where(has_location[:, None], np.column_stack([store.x, store.y]), np.nan)
+        jerseis = store.jerseis.decode(store.jersey).tolist()
+        teams = store.teams.decode(store.team).tolist()
+        roles = store.roles.decode(store.role).tolist()
+        track_ids = store.track_id.tolist()
+
+        frame_positions = [p for p in np.argsort(store.frame_nums, kind="stable") if 1 <= store.frame_nums[p] <= max_frame]
+        exist_frame_num = 0
+        for p in frame_positions:
+            if store.offsets[p] < store.offsets[p + 1] and has_location[store.offsets[p]]:
+                exist_frame_num = int(store.frame_nums[p])
+                break
+
+        edit = lambda e_track_id, e_jersey, e_team: self.edit_track_store(store, False, e_track_id, e_jersey, e_team)
+        for p in frame_positions:
+            s, e = int(store.offsets[p]), int(store.offsets[p + 1])
+            # 編集結果を反映するため、フレームごとに最新の値を取得
+            jerseis[s:e] = store.jerseis.decode(store.jersey[s:e]).tolist()
+            teams[s:e] = store.teams.decode(store.team[s:e]).tolist()
+            frame_num = int(store.frame_nums[p])
+            frame = (locations[s:e], track_ids[s:e], jerseis[s:e], teams[s:e], roles[s:e])
+            yield frame_num, frame_num == exist_frame_num, nan_locations, frame, edit
+
+    # 自動補正の本体（iterate_frames: data_num -> (frame_num, is_exist, nan_locations, frame, edit)）
+    def run_edit_auto(
+        self, iterate_frames : Callable, player_lists_left : PlayerLists, player_lists_right : PlayerLists,
+        min_match : float, max_distance : float, min_order : float, set_frames : Frame
     ) -> None:
         prev_player_lists_left: PlayerLists = {}
         prev_player_lists_right: PlayerLists = {}
-        player_list_left: PlayerList = {}
-        player_list_right: PlayerList = {}
-
-        # 途中から補正した場合の処理
-        for (dnum, fnum), player_list in player_lists_left.items():
-            if dnum < self.start_data_num:
-                player_list_left = player_lists_left[(dnum, fnum)]
-        for (dnum, fnum), player_list in player_lists_right.items():
-            if dnum < self.start_data_num:
-                player_list_right = player_lists_right[(dnum, fnum)]
+        state = AutoEditState(player_lists_left, player_lists_right, self.start_data_num)
 
         for data_num in range(self.start_data_num, self.end_data_num + 1):
             if data_num == self.end_data_num:
+                state.write_back()
                 prev_player_lists_left = copy.deepcopy(player_lists_left)
                 prev_player_lists_right = copy.deepcopy(player_lists_right)
+            self.edit_clip_auto(state, data_num, iterate_frames(data_num), min_match, max_distance, min_order, set_frames)
 
-            data = data_list[data_num]
-            exist_frame_num = calc_exist_frame_num(data, data_num)
-            for frame_num, frame_data in con.iterate_frame_datas(data, data_num, 1, max_frame):
-                if (data_num, frame_num) in player_lists_left:
-                    player_list_left = player_lists_left[(data_num, frame_num)]
-                if (data_num, frame_num) in player_lists_right:
-                    player_list_right = player_lists_right[(data_num, frame_num)]
-
-                is_loc = calc_is_loc(data_num, frame_num, set_frames)
-                update_player_list(data_num, frame_data, player_list_left, "left", is_loc)
-                update_player_list(data_num, frame_data, player_list_right, "right", is_loc)
-
-                for entry in frame_data:
-                    location, track_id, jersey, team = con.take_entry_info(entry)
-                    if location == "":
-                        continue
-                    if jersey != "" or team == "nan":
-                        continue
-                    if entry["role"] == "goalkeeper":
-                        self.edit_data(data, data_num, 1, max_frame, False, track_id, "", "nan")
-                        continue
-                    
-                    relation : Relation = {}
-                    update_relation(frame_data, entry, relation)
-                    player_list = player_list_left if team == "left" else player_list_right
-                    if frame_num == exist_frame_num:
-                        nan_data = get_nan_data(data_list, data_num)
-                        pred_jersey = predict_jersey_by_location(entry, relation, player_list, max_distance, nan_data)
-                    elif relation == {} or is_loc:
-                        pred_jersey = predict_jersey_by_location(entry, relation, player_list, max_distance, [])
-                    else:
-                        pred_jersey = predict_jersey_by_relation(entry, relation, player_list, min_match, min_order)
-                    if pred_jersey == "none":
-                        self.edit_data(data, data_num, 1, max_frame, False, track_id, "", "nan")
-                    elif pred_jersey != "":
-                        self.edit_data(data, data_num, 1, max_frame, False, track_id, pred_jersey, "")
-        
+        state.write_back()
         player_lists_left.clear()
         player_lists_left.update(prev_player_lists_left)
         player_lists_right.clear()
-        player_lists_right.update(prev_player_lists_right)
\ No newline at end of file
+        player_lists_right.update(prev_player_lists_right)
+
+    # 自動補正（1ファイル分、stateはファイルをまたいで持ち越す）
+    def edit_clip_auto(
+        self, state : "AutoEditState", data_num : int, frames, min_match : float, max_distance : float,
+        min_order : float, set_frames : Frame
+    ) -> None:
+        for frame_num, is_exist, nan_locations, frame, edit in frames:
+            arrays_left, arrays_right = state.take_player_arrays(data_num, frame_num)
+            locations, track_ids, jerseis, teams, roles = frame
+            is_loc = calc_is_loc(data_num, frame_num, set_frames)
+            for arrays, e_team in ((arrays_left, "left"), (arrays_right, "right")):
+                frame_locations, has_other = take_frame_locations(data_num, locations, jerseis, teams, arrays, e_team, True)
+                arrays.update(frame_locations, is_loc)
+
+            edits = predict_frame_jerseis(
+                data_num, locations, track_ids, jerseis, teams, roles, arrays_left, arrays_right,
+                is_loc, nan_locations if is_exist else None, min_match, max_distance, min_order
+            )
+            for track_id, jersey, team in edits:
+                edit(track_id, jersey, team)
+
+# 自動補正の持ち越し状態（現在の各選手情報とその配列表現）
+class AutoEditState:
+    def __init__(self, player_lists_left : PlayerLists, player_lists_right : PlayerLists, start_data_num : int):
+        self.player_lists_left = player_lists_left
+        self.player_lists_right = player_lists_right
+        self.player_list_left : PlayerList = {}
+        self.player_list_right : PlayerList = {}
+        self.arrays_cache : Dict[int, PlayerArrays] = {}
+
+        # 途中から補正した場合の処理
+        for (dnum, fnum), player_list in player_lists_left.items():
+            if dnum < start_data_num:
+                self.player_list_left = player_lists_left[(dnum, fnum)]
+        for (dnum, fnum), player_list in player_lists_right.items():
+            if dnum < start_data_num:
+                self.player_list_right = player_lists_right[(dnum, fnum)]
+
+    # フレーム時点の各選手情報の配列表現
+    def take_player_arrays(self, data_num : int, frame_num : int) -> Tuple[PlayerArrays, PlayerArrays]:
+        if (data_num, frame_num) in self.player_lists_left:
+            self.player_list_left = self.player_lists_left[(data_num, frame_num)]
+        if (data_num, frame_num) in self.player_lists_right:
+            self.player_list_right = self.player_lists_right[(data_num, frame_num)]
+        return (
+            take_player_arrays(self.player_list_left, self.arrays_cache),
+            take_player_arrays(self.player_list_right, self.arrays_cache),
+        )
+
+    # 配列表現の内容をplayer_listsへ書き戻す
+    def write_back(self) -> None:
+        for arrays in self.arrays_cache.values():
+            arrays.write_back()
@@ -2,32 +2,173 @@ import os
 import json
 import shutil
 import shlex
-from typing import List, Dict, Tuple
+import pickle
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Union, Iterator
 from edit.type_def import *
+from edit.frame_store import FrameStore
 import edit.convert_take as con
-import edit.create as cre
+import edit.frame_store as fst
+
+# 出力形式ごとの拡張子
+save_extensions = {"indent": ".json", "minified": ".json", "binary": ".store"}
+
+# キャッシュの保存先
+def take_cache_path(file_path : str) -> str:
+    dir_path, file_name = os.path.split(file_path)
+    return os.path.join(dir_path, ".cache", os.path.splitext(file_name)[0])
+
+# キャッシュのキー（ファイルサイズと更新時刻）
+def take_cache_key(file_path : str) -> Dict[str, int]:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+# binary形式で保存したファイルのパス
+def take_store_file_path(file_path : str) -> str:
+    return os.path.splitext(file_path)[0] + save_extensions["binary"]
+
+# binary形式で保存したファイルの読み込み
+def load_store_file(file_path : str, data_num : int) -> FrameStore:
+    store = fst.load_frame_store(take_store_file_path(file_path))
+    store.data_num = data_num
+    return store
+
+# キャッシュが有効かを判定
+def calc_is_cached(file_path : str) -> bool:
+    return fst.load_frame_store_meta(take_cache_path(file_path)) == take_cache_key(file_path)
+
+# JSONの読み込みとキャッシュ作成（as_store=Falseなら解析結果をそのまま返す、プロセスプール用）
+def parse_file(file_path : str, data_num : int, use_cache : bool, as_store : bool = True) -> Union[Data, FrameStore]:
+    cache_key = take_cache_key(file_path)
+    with open(file_path, "r") as file:
+        data = json.load(file)
+    if not as_store and not use_cache:
+        return data
+    store = FrameStore.from_data(data, data_num)
+    if use_cache:
+        fst.save_frame_store(store, take_cache_path(file_path), cache_key)
+    return store if as_store else data
+
+# ファイルの書き込み（一時ファイル経由で置き換え）
+def write_text(file_path : str, text : str) -> None:
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, file_path)
+
+# 出力のハッシュ（出力形式と内容、FrameStoreは変更が無ければ再計算しない）
+# Dataは変換せずにpickleのバイト列をハッシュする（from_dataやJSONへの変換より数倍速い）
+def calc_output_hash(data, data_num : int, encoding : str) -> str:
+    if isinstance(data, FrameStore):
+        return f"{encoding}:{data.take_content_hash()}"
+    sha = hashlib.sha1(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    return f"{encoding}:data:{sha.hexdigest()}"
+
+# 書き込みが必要かを判定（前回保存時とハッシュが異なるか、ファイルが無い）
+def calc_is_changed(file_path : str, new_hash : str, old_hash : str) -> bool:
+    return new_hash != old_hash or not os.path.exists(file_path)
+
+# 1ファイル分の書き込み（プロセスプール用）
+def write_file(file_path : str, data, data_num : int, encoding : str) -> None:
+    if encoding == "binary":
+        store = data if isinstance(data, FrameStore) else FrameStore.from_data(data, data_num)
+        fst.save_frame_store(store, file_path)
+        return
+
+    if isinstance(data, FrameStore):
+        data = data.to_data()
+    if encoding == "indent":
+        text = json.dumps(data, indent=4)
+    else:
+        text = json.dumps(data, separators=(",", ":"))
+    write_text(file_path, text)
+
+# 前回保存時のハッシュ
+def load_manifest(files : str) -> Dict[str, str]:
+    manifest_path = os.path.join(files, ".manifest.json")
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+# ハッシュの保存（今回の出力に含まれないファイルは削除）
+def save_manifest(files : str, manifest : Dict[str, str], file_names : List[str]) -> None:
+    for file_name in os.listdir(files):
+        if file_name.startswith("trim_") and file_name not in file_names:
+            file_path = os.path.join(files, file_name)
+            if os.path.isdir(file_path):
+                shutil.rmtree(file_path)
+            else:
+                os.remove(file_path)
+    manifest = {file_name: manifest[file_name] for file_name in file_names if file_name in manifest}
+    write_text(os.path.join(files, ".manifest.json"), json.dumps(manifest))
 
 class FileManager:
     def __init__(self, data_path : str):
         self.data_path= data_path
 
     # 入力ファイル読み込み
-    def load_files(self, data_file : str, start_file_num : int, end_file_num : int) -> List[Data]:
-        data_list : List[Data] = []
+    def load_files(
+        self, data_file : str, start_file_num : int, end_file_num : int,
+        as_store : bool = False, use_cache : bool = True, max_workers : int = None
+    ) -> Union[List[Data], List[FrameStore]]:
         files = os.path.join(self.data_path, data_file)
+        file_paths : Dict[int, str] = {}
         for file_num in range(start_file_num, end_file_num + 1):
             file_name = con.convert_num_to_file_name(file_num)
             file_path = os.path.join(files, file_name)
-            if os.path.isfile(file_path):
-                with open(file_path, "r") as file:
-                    data = json.load(file)
-                    data_list.append(data)
+            if os.path.isfile(file_path) or os.path.isdir(take_store_file_path(file_path)):
+                file_paths[file_num] = file_path
             else:
                 print(f"{file_name} not found")
-        
-        print(f"Loaded {len(data_list)} files")
-        return data_list
+
+        # binary形式とキャッシュがあるファイルはmmapで読み込み、無いファイルは並列にJSONを解析
+        # （as_store=Falseなら解析したファイルはJSONのまま返す）
+        stores : Dict[int, Union[Data, FrameStore]] = {}
+        parse_nums = []
+        for file_num, file_path in file_paths.items():
+            if not os.path.isfile(file_path):
+                stores[file_num] = load_store_file(file_path, file_num)
+            elif use_cache and calc_is_cached(file_path):
+                stores[file_num] = fst.load_frame_store(take_cache_path(file_path))
+            else:
+                parse_nums.append(file_num)
+        if len(parse_nums) > 1 and max_workers != 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                parsed = executor.map(
+                    parse_file, [file_paths[n] for n in parse_nums], parse_nums,
+                    [use_cache] * len(parse_nums), [as_store] * len(parse_nums)
+                )
+                stores.update(zip(parse_nums, parsed))
+        else:
+            for file_num in parse_nums:
+                stores[file_num] = parse_file(file_paths[file_num], file_num, use_cache, as_store)
+
+        store_list = [stores[file_num] for file_num in file_paths]
+        print(f"Loaded {len(store_list)} files ({len(store_list) - len(parse_nums)} from cache)")
+        if as_store:
+            return store_list
+        return [store.to_data() if isinstance(store, FrameStore) else store for store in store_list]
     
+    # 入力ファイルを1ファイルずつ読み込むジェネレーター（binary形式とキャッシュはmmap）
+    def iterate_files(
+        self, data_file : str, start_file_num : int, end_file_num : int, use_cache : bool = True
+    ) -> Iterator[FrameStore]:
+        files = os.path.join(self.data_path, data_file)
+        for file_num in range(start_file_num, end_file_num + 1):
+            file_name = con.convert_num_to_file_name(file_num)
+            file_path = os.path.join(files, file_name)
+            if os.path.isfile(file_path):
+                if use_cache and calc_is_cached(file_path):
+                    yield fst.load_frame_store(take_cache_path(file_path))
+                else:
+                    yield parse_file(file_path, file_num, use_cache)
+            elif os.path.isdir(take_store_file_path(file_path)):
+                yield load_store_file(file_path, file_num)
+            else:
+                print(f"{file_name} not found")
+
     # 正解ファイル読み込み
     def load_label_file(self) -> List[Data]:
         data_list : List[Data] = []
@@ -35,18 +176,19 @@ class FileManager:
         if os.path.isfile(file_path):
             with open(file_path, "r") as file:
                 file_data = json.load(file)
-                data : Data = {}
-                for ann in file_data["annotations"]:
-                    if "bbox_pitch" not in ann:
-                        continue
-                    attributes = ann["attributes"]
-                    entry = cre.create_entry(
-                        e_bbox=ann["bbox_pitch"], e_track_id=ann["track_id"], e_jersey=attributes["jersey"],
-                        e_role=attributes["role"], e_team=attributes["team"])
-                    if ann["image_id"] not in data:
-                        data[ann["image_id"]] = []
-                    data[ann["image_id"]].append(entry)
-                data_list.append(data)
+            data : Data = {}
+            for ann in file_data["annotations"]:
+                if "bbox_pitch" not in ann:
+                    continue
+                attributes = ann["attributes"]
+                data.setdefault(ann["image_id"], []).append({
+                    "bbox_pitch": ann["bbox_pitch"],
+                    "track_id" : ann["track_id"],
+                    "jersey" : attributes["jersey"],
+                    "role" : attributes["role"],
+                    "team" : attributes["team"]
+                })
+            data_list.append(data)
         else:
             print(f"Label data not found")
         
@@ -54,24 +196,41 @@ class FileManager:
     
     # ファイル保存(単体)
     def save_file(self, file_path : str, data : Data) -> None:
-        with open(file_path, "w") as file:
-            json.dump(data, file, indent=4)
+        write_text(file_path, json.dumps(data, indent=4))
     
-    # ファイル保存
-    def save_files(self, data_list : List[Data]) -> None:
+    # ファイル保存（変更のあったファイルのみシリアライズして書き込み、dirty_numsを指定すればそのファイルのみ確認）
+    # FrameStoreは変更が無ければ内容のハッシュを再計算しない
+    # Dataは毎回全ファイルをハッシュするため、変更したファイルが分かっている場合はdirty_numsを渡す
+    def save_files(
+        self, data_list : Union[List[Data], List[FrameStore]], dirty_nums : List[int] = None,
+        encoding : str = "indent", max_workers : int = None
+    ) -> None:
+        if encoding not in save_extensions:
+            raise ValueError(f"{encoding} is not supported")
         files = os.path.join(self.data_path, f"edit_datas")
-        if os.path.exists(files):
-            shutil.rmtree(files)
-            print(f"Existed files deleted")
         os.makedirs(files, exist_ok=True)
-        
-        for data_num in range(len(data_list)):
-            data = data_list[data_num]
-            file_name = con.convert_num_to_file_name(data_num)
-            file_path = os.path.join(files, file_name)
-            self.save_file(file_path, data)
-        
-        print(f"Data saved to {files}")
+        manifest = load_manifest(files)
+
+        file_names = [con.num_to_str(data_num) + save_extensions[encoding] for data_num in range(len(data_list))]
+        save_nums = range(len(data_list)) if dirty_nums is None else sorted(set(dirty_nums))
+        new_hashes = {n: calc_output_hash(data_list[n], n, encoding) for n in save_nums}
+        write_nums = [
+            n for n in save_nums
+            if calc_is_changed(os.path.join(files, file_names[n]), new_hashes[n], manifest.get(file_names[n]))
+        ]
+        args = [(os.path.join(files, file_names[n]), data_list[n], n, encoding) for n in write_nums]
+        if len(args) > 1 and max_workers != 1:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(write_file, *zip(*args)))
+        else:
+            for arg in args:
+                write_file(*arg)
+
+        for n in write_nums:
+            manifest[file_names[n]] = new_hashes[n]
+        save_manifest(files, manifest, file_names)
+
+        print(f"Data saved to {files} ({len(write_nums)} of {len(data_list)} files written)")
 
     # ファイル読み込み(AnyNumbers)
     def load_any_file(self) -> Tuple[List, Frame, Frame]:
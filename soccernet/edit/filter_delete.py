@@ -1,5 +1,7 @@
+import numpy as np
 from typing import List, Dict, Tuple
 from edit.type_def import *
+from edit.frame_store import FrameStore
 import edit.convert_take as con
 import edit.math_func as mf
 
@@ -54,30 +56,167 @@ def calc_track_counts(data : Data, data_num : int) -> Dict[float, int]:
             track_counts[track_id] = track_counts.get(track_id, 0) + 1
     return track_counts
 
+# track_idの転置索引（track_id -> {frame_num: [position]}）
+class TrackIndex:
+    def __init__(self, data : Data, data_num : int):
+        self.data = data
+        self.data_num = data_num
+        self.frame_ids : Dict[int, str] = {}
+        self.frame_tracks : Dict[int, List[float]] = {}
+        self.tracks : Dict[float, Dict[int, List[int]]] = {}
+        for frame_num, frame_data in con.iterate_frame_datas(data, data_num, 1, max_frame):
+            self.frame_ids[frame_num] = con.convert_num_to_id(data_num, frame_num)
+            self.index_frame(frame_num, frame_data)
+
+    # フレームの登録
+    def index_frame(self, frame_num : int, frame_data : List[Entry]) -> None:
+        track_ids = [entry["track_id"] for entry in frame_data]
+        self.frame_tracks[frame_num] = track_ids
+        for position, track_id in enumerate(track_ids):
+            self.tracks.setdefault(track_id, {}).setdefault(frame_num, []).append(position)
+
+    # フレームの登録解除
+    def unindex_frame(self, frame_num : int) -> None:
+        for track_id in set(self.frame_tracks.pop(frame_num, [])):
+            frames = self.tracks[track_id]
+            del frames[frame_num]
+            if not frames:
+                del self.tracks[track_id]
+
+    # 外部で編集したフレームの再登録
+    def update_frame(self, frame_num : int) -> None:
+        self.unindex_frame(frame_num)
+        frame_id = con.convert_num_to_id(self.data_num, frame_num)
+        if frame_id in self.data:
+            self.frame_ids[frame_num] = frame_id
+            self.index_frame(frame_num, self.data[frame_id])
+
+    # track_idの出現回数
+    def calc_track_counts(self) -> Dict[float, int]:
+        return {
+            track_id: sum(len(positions) for positions in frames.values())
+            for track_id, frames in self.tracks.items()
+        }
+
+    # track_idが出現するフレーム
+    def take_frames(self, track_id : float) -> List[int]:
+        return sorted(self.tracks.get(track_id, {}).keys())
+
+    # track_idの一括削除（mapping: track_id -> 削除するフレーム、Noneなら全フレーム）
+    def delete_tracks(self, mapping : Dict[float, List[int]]) -> None:
+        frame_deletes : Dict[int, set] = {}
+        for track_id, frame_nums in mapping.items():
+            frames = self.tracks.get(track_id, {})
+            targets = frames.keys() if frame_nums is None else [f for f in frame_nums if f in frames]
+            for frame_num in targets:
+                frame_deletes.setdefault(frame_num, set()).add(track_id)
+
+        for frame_num, track_ids in frame_deletes.items():
+            frame_data = self.data[self.frame_ids[frame_num]]
+            frame_data[:] = [entry for entry in frame_data if entry["track_id"] not in track_ids]
+            self.unindex_frame(frame_num)
+            self.index_frame(frame_num, frame_data)
+
 # track_id削除
 def delete_track_id(data : Data, data_num : int, start_frame : int, end_frame : int, e_track_id : float) -> None:
     for frame_num, frame_data in con.iterate_frame_datas(data, data_num, start_frame, end_frame):
-        for entry in frame_data:
-            location, track_id, jersey, team = con.take_entry_info(entry)
-            if track_id == e_track_id:
-                frame_data.remove(entry)
+        frame_data[:] = [entry for entry in frame_data if entry["track_id"] != e_track_id]
 
 # 一度しか出現しないtrack_idを削除
 def delete_once_track_id(data_list : List[Data], edit_numbers : List[Edit]) -> None:
     for data_num, data in enumerate(data_list):
-        edit_ids = []
+        edit_ids = set()
         for (start_frame, end_frame), edit_infos in edit_numbers[data_num].items():
             for track_id, jersey_number, team in edit_infos:
-                edit_ids.append(track_id)
-        
-        track_counts = calc_track_counts(data, data_num)
-        for track_id, count in track_counts.items():
-            if count == 1 and track_id not in edit_ids:
-                delete_track_id(data, data_num, 1, max_frame, track_id)
+                edit_ids.add(track_id)
+
+        track_index = TrackIndex(data, data_num)
+        track_counts = track_index.calc_track_counts()
+        track_index.delete_tracks({
+            track_id: None for track_id, count in track_counts.items() if count == 1 and track_id not in edit_ids
+        })
 
 # 特定フレームのtrack_idを削除
 def delete_track_id_by_frame(data_list : List[Data], delete_numbers : Delete) -> None:
     for data_num, frame_track_ids in delete_numbers.items():
-        data = data_list[data_num]
+        mapping : Dict[float, List[int]] = {}
         for frame_num, track_id in frame_track_ids:
-            delete_track_id(data, data_num, frame_num, frame_num, track_id)
\ No newline at end of file
+            mapping.setdefault(track_id, []).append(frame_num)
+        TrackIndex(data_list[data_num], data_num).delete_tracks(mapping)
+
+# team反転（FrameStore）
+def reverse_team_store(stores : List[FrameStore], reverse_numbers : List[int]) -> None:
+    for data_num in reverse_numbers:
+        reverse_team_clip(stores[data_num])
+
+# team反転（FrameStore、1ファイル分）
+def reverse_team_clip(store : FrameStore) -> None:
+    visible = store.frame >= 1
+    left = visible & (store.team == store.teams.find("left"))
+    right = visible & (store.team == store.teams.find("right"))
+    store.team[left] = store.teams.code("right")
+    store.team[right] = store.teams.code("left")
+    store.mark_dirty()
+
+# フィルタリング（手動、FrameStore）
+def filter_data_manual_store(stores : List[FrameStore], filter_frames : Frame) -> None:
+    for data_num, (start_frame, end_frame) in filter_frames.items():
+        filter_data_manual_clip(stores[data_num], start_frame, end_frame)
+
+# フィルタリング（手動、FrameStore、1ファイル分）
+def filter_data_manual_clip(store : FrameStore, start_frame : int, end_frame : int) -> None:
+    store.clear_location(store.in_frames(start_frame, end_frame))
+
+# フィルタリング判定（FrameStore、フレーム単位）
+def calc_is_filter_store(store : FrameStore) -> np.ndarray:
+    pitch_x_range = pitch_width / 2
+    pitch_y_range = pitch_length / 2 + 5
+    has_loc = store.has_location()
+    outside = has_loc & ((np.abs(store.x) > pitch_x_range) | (np.abs(store.y) > pitch_y_range))
+    player_nums = store.frame_counts(has_loc)
+    return (store.frame_counts(outside) > 0) | (player_nums < 5)
+
+# フィルタリング（自動、FrameStore）
+def filter_data_auto_store(stores : List[FrameStore]) -> None:
+    for store in stores:
+        filter_data_auto_clip(store)
+
+# フィルタリング（自動、FrameStore、1ファイル分）
+def filter_data_auto_clip(store : FrameStore) -> None:
+    is_filter = calc_is_filter_store(store) & (store.frame_nums >= 1)
+    store.clear_location(is_filter[store.pos])
+
+# track_idの出現回数（FrameStore）
+def calc_track_counts_store(store : FrameStore) -> Dict[float, int]:
+    track_ids, counts = np.unique(store.track_id[store.frame >= 1], return_counts=True)
+    return dict(zip(track_ids.tolist(), counts.tolist()))
+
+# 一度しか出現しないtrack_idを削除（FrameStore）
+def delete_once_track_id_store(stores : List[FrameStore], edit_numbers : List[Edit]) -> None:
+    for data_num, store in enumerate(stores):
+        delete_once_track_id_clip(store, edit_numbers[data_num])
+
+# 一度しか出現しないtrack_idを削除（FrameStore、1ファイル分）
+def delete_once_track_id_clip(store : FrameStore, edit_number : Edit) -> None:
+    edit_ids = []
+    for (start_frame, end_frame), edit_infos in edit_number.items():
+        for track_id, jersey_number, team in edit_infos:
+            edit_ids.append(track_id)
+
+    visible = store.frame >= 1
+    track_ids, inverse = np.unique(store.track_id, return_inverse=True)
+    counts = np.bincount(inverse, weights=visible, minlength=len(track_ids))
+    once = (counts == 1) & ~np.isin(track_ids, edit_ids)
+    store.delete_rows(visible & once[inverse])
+
+# 特定フレームのtrack_idを削除（FrameStore）
+def delete_track_id_by_frame_store(stores : List[FrameStore], delete_numbers : Delete) -> None:
+    for data_num, frame_track_ids in delete_numbers.items():
+        delete_track_id_by_frame_clip(stores[data_num], frame_track_ids)
+
+# 特定フレームのtrack_idを削除（FrameStore、1ファイル分）
+def delete_track_id_by_frame_clip(store : FrameStore, frame_track_ids : List[Tuple[int, float]]) -> None:
+    mapping : Dict[float, List[int]] = {}
+    for frame_num, track_id in frame_track_ids:
+        mapping.setdefault(track_id, []).append(frame_num)
+    store.delete_tracks(mapping)
@@ -0,0 +1,450 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from typing import List, Dict, Tuple, Callable
+from edit.type_def import *
+import edit.convert_take as con
+
+# bbox_pitchの状態
+bbox_dict = 0
+bbox_empty = 1
+bbox_none = 2
+
+# bbox_pitchのキー（x_bottom_middle, y_bottom_middle以外）
+corner_keys = ["x_bottom_left", "y_bottom_left", "x_bottom_right", "y_bottom_right"]
+
+# bbox_pitchのキー（x, y, cornersの順）
+bbox_keys = ["x_bottom_middle", "y_bottom_middle", *corner_keys]
+bbox_key_set = set(bbox_keys)
+
+# エントリーのキー（これ以外のキーはextrasに保持）
+entry_keys = {"bbox_pitch", "track_id", "jersey", "role", "team"}
+
+# 保存形式のバージョン（変更時は古いキャッシュを無効にする）
+store_version = 3
+
+# エントリーの既知以外の内容（無ければNone）
+# entry: その他のキー、bbox_pitch: bbox_pitchのその他のキー、bbox_missing: bbox_pitchに無いキー（座標はNaN）
+def take_entry_extra(entry : Entry) -> Dict:
+    extra = {}
+    if len(entry) > len(entry_keys):
+        extra["entry"] = {key: value for key, value in entry.items() if key not in entry_keys}
+    b = entry["bbox_pitch"]
+    if isinstance(b, dict) and b.keys() != bbox_key_set:
+        bbox_extra = {key: value for key, value in b.items() if key not in bbox_key_set}
+        if bbox_extra:
+            extra["bbox_pitch"] = bbox_extra
+        bbox_missing = [key for key in bbox_keys if key not in b]
+        if bbox_missing:
+            extra["bbox_missing"] = bbox_missing
+    return extra or None
+
+
+# 文字列とコードの対応
+class Vocab:
+    def __init__(self, names : List = None):
+        self.names : List = []
+        self.codes : Dict = {}
+        for name in names or []:
+            self.code(name)
+
+    # コードの取得（無ければ追加）
+    def code(self, name) -> int:
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+    # コードの取得（無ければ-1）
+    def find(self, name) -> int:
+        return self.codes.get(name, -1)
+
+    # コード配列から文字列配列へ変換
+    def decode(self, codes : np.ndarray) -> np.ndarray:
+        names = np.empty(len(self.names) + 1, dtype=object)
+        names[:len(self.names)] = self.names
+        return names[codes]
+
+    def copy(self) -> "Vocab":
+        return Vocab(self.names)
+
+# 列指向のフレームデータ（1ファイル分）
+class FrameStore:
+    def __init__(self, data_num : int):
+        self.data_num = data_num
+        # フレーム単位
+        self.frame_ids : List[str] = []
+        self.frame_nums = np.zeros(0, dtype=np.int32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        # エントリー単位
+        self.pos = np.zeros(0, dtype=np.int32)
+        self.frame = np.zeros(0, dtype=np.int32)
+        self.track_id = np.zeros(0, dtype=np.float64)
+        self.track_is_int = np.zeros(0, dtype=bool)
+        self.jersey = np.zeros(0, dtype=np.int32)
+        self.team = np.zeros(0, dtype=np.int32)
+        self.role = np.zeros(0, dtype=np.int32)
+        self.x = np.zeros(0, dtype=np.float64)
+        self.y = np.zeros(0, dtype=np.float64)
+        self.corners = np.zeros((0, len(corner_keys)), dtype=np.float64)
+        self.bbox_state = np.zeros(0, dtype=np.int8)
+        # その他のキー（無ければNone）
+        self.extras = np.zeros(0, dtype=object)
+        # track_idの転置索引（エントリー変更時に破棄）
+        self.track_rows : Dict[float, np.ndarray] = None
+        # 内容のハッシュ（エントリー変更時に破棄、Noneなら未計算）
+        self.content_hash : str = None
+        # 文字列の対応
+        self.jerseis = Vocab()
+        self.teams = Vocab()
+        self.roles = Vocab()
+
+    def __len__(self) -> int:
+        return len(self.track_id)
+
+    # 列名の一覧
+    row_columns = [
+        "pos", "frame", "track_id", "track_is_int", "jersey", "team", "role", "x", "y", "corners", "bbox_state", "extras"
+    ]
+
+    # Dataからの変換
+    @classmethod
+    def from_data(cls, data : Data, data_num : int) -> "FrameStore":
+        store = cls(data_num)
+        frame_num_by_id = {con.convert_num_to_id(data_num, f): f for f in range(1, max_frame + 1)}
+
+        n = sum(len(frame_data) for frame_data in data.values())
+        pos = np.empty(n, dtype=np.int32)
+        track_id = np.empty(n, dtype=np.float64)
+        track_is_int = np.zeros(n, dtype=bool)
+        jersey = np.empty(n, dtype=np.int32)
+        team = np.empty(n, dtype=np.int32)
+        role = np.empty(n, dtype=np.int32)
+        bbox = np.full((n, 6), np.nan, dtype=np.float64)
+        bbox_state = np.zeros(n, dtype=np.int8)
+        extras = np.full(n, None, dtype=object)
+        frame_nums = np.empty(len(data), dtype=np.int32)
+        offsets = np.empty(len(data) + 1, dtype=np.int64)
+
+        i = 0
+        for p, (frame_id, frame_data) in enumerate(data.items()):
+            store.frame_ids.append(frame_id)
+            frame_nums[p] = frame_num_by_id.get(frame_id, -1)
+            offsets[p] = i
+            for entry in frame_data:
+                b = entry["bbox_pitch"]
+                if b == "":
+                    bbox_state[i] = bbox_empty
+                elif b is None:
+                    bbox_state[i] = bbox_none
+                else:
+                    bbox[i] = (
+                        b.get("x_bottom_left", np.nan), b.get("y_bottom_left", np.nan),
+                        b.get("x_bottom_right", np.nan), b.get("y_bottom_right", np.nan),
+                        b.get("x_bottom_middle", np.nan), b.get("y_bottom_middle", np.nan)
+                    )
+                pos[i] = p
+                track_id[i] = entry["track_id"]
+                track_is_int[i] = isinstance(entry["track_id"], int) and not isinstance(entry["track_id"], bool)
+                jersey[i] = store.jerseis.code(entry["jersey"])
+                team[i] = store.teams.code(entry["team"])
+                role[i] = store.roles.code(entry["role"])
+                extras[i] = take_entry_extra(entry)
+                i += 1
+        offsets[len(data)] = i
+
+        store.frame_nums = frame_nums
+        store.offsets = offsets
+        store.pos = pos
+        store.frame = frame_nums[pos]
+        store.track_id = track_id
+        store.track_is_int = track_is_int
+        store.jersey = jersey
+        store.team = team
+        store.role = role
+        store.x = np.ascontiguousarray(bbox[:, 4])
+        store.y = np.ascontiguousarray(bbox[:, 5])
+        store.corners = np.ascontiguousarray(bbox[:, :4])
+        store.bbox_state = bbox_state
+        store.extras = extras
+        return store
+
+    # Dataへの変換
+    def to_data(self) -> Data:
+        data : Data = {}
+        jerseis = self.jerseis.decode(self.jersey)
+        teams = self.teams.decode(self.team)
+        roles = self.roles.decode(self.role)
+        x = self.x.tolist()
+        y = self.y.tolist()
+        corners = self.corners.tolist()
+        track_id = self.track_id.astype(object)
+        track_id[self.track_is_int] = self.track_id[self.track_is_int].astype(np.int64)
+        track_id = track_id.tolist()
+        bbox_state = self.bbox_state.tolist()
+        extras = self.extras
+        for p, frame_id in enumerate(self.frame_ids):
+            frame_data : List[Entry] = []
+            for i in range(self.offsets[p], self.offsets[p + 1]):
+                if bbox_state[i] == bbox_empty:
+                    bbox = ""
+                elif bbox_state[i] == bbox_none:
+                    bbox = None
+                else:
+                    c = corners[i]
+                    bbox = {
+                        "x_bottom_left" : c[0],
+                        "y_bottom_left" : c[1],
+                        "x_bottom_right" : c[2],
+                        "y_bottom_right" : c[3],
+                        "x_bottom_middle" : x[i],
+                        "y_bottom_middle" : y[i]
+                    }
+                    if extras[i] is not None:
+                        for key in extras[i].get("bbox_missing", []):
+                            del bbox[key]
+                        bbox.update(extras[i].get("bbox_pitch", {}))
+                entry = {
+                    "bbox_pitch": bbox,
+                    "track_id" : track_id[i],
+                    "jersey" : jerseis[i],
+                    "role" : roles[i],
+                    "team" : teams[i]
+                }
+                if extras[i] is not None:
+                    entry.update(extras[i].get("entry", {}))
+                frame_data.append(entry)
+            data[frame_id] = frame_data
+        return data
+
+    # コピー
+    def copy(self) -> "FrameStore":
+        store = FrameStore(self.data_num)
+        store.frame_ids = list(self.frame_ids)
+        store.frame_nums = self.frame_nums.copy()
+        store.offsets = self.offsets.copy()
+        for column in self.row_columns:
+            setattr(store, column, getattr(self, column).copy())
+        store.jerseis = self.jerseis.copy()
+        store.teams = self.teams.copy()
+        store.roles = self.roles.copy()
+        store.content_hash = self.content_hash
+        return store
+
+    # 変更の記録（配列を直接書き換えた場合も呼ぶ）
+    def mark_dirty(self) -> None:
+        self.content_hash = None
+
+    # 内容のハッシュ（変更が無ければ再計算しない）
+    def take_content_hash(self) -> str:
+        if self.content_hash is None:
+            self.content_hash = calc_store_hash(self)
+        return self.content_hash
+
+    # 座標を持つエントリー
+    def has_location(self) -> np.ndarray:
+        return self.bbox_state == bbox_dict
+
+    # フレーム範囲内のエントリー
+    def in_frames(self, start_frame : int, end_frame : int) -> np.ndarray:
+        return (self.frame >= start_frame) & (self.frame <= end_frame)
+
+    # フレーム番号からフレーム位置への変換（無ければ-1）
+    def frame_pos(self, frame_num : int) -> int:
+        hits = np.flatnonzero(self.frame_nums == frame_num)
+        return int(hits[0]) if len(hits) else -1
+
+    # フレーム内のエントリー範囲
+    def frame_slice(self, frame_num : int) -> slice:
+        p = self.frame_pos(frame_num)
+        if p < 0:
+            return slice(0, 0)
+        return slice(int(self.offsets[p]), int(self.offsets[p + 1]))
+
+    # 各フレームのエントリー数
+    def frame_counts(self, mask : np.ndarray = None) -> np.ndarray:
+        return np.bincount(self.pos, weights=mask, minlength=len(self.frame_ids)).astype(np.int64)
+
+    # 座標の削除（bbox_pitchを""にする）
+    def clear_location(self, mask : np.ndarray) -> None:
+        self.mark_dirty()
+        self.bbox_state[mask] = bbox_empty
+        self.x[mask] = np.nan
+        self.y[mask] = np.nan
+        self.corners[mask] = np.nan
+
+    # オフセットの再計算
+    def rebuild_offsets(self) -> None:
+        self.mark_dirty()
+        self.track_rows = None
+        self.offsets = np.zeros(len(self.frame_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.pos, minlength=len(self.frame_ids)), out=self.offsets[1:])
+
+    # track_idごとのエントリー位置
+    def take_track_rows(self) -> Dict[float, np.ndarray]:
+        if self.track_rows is None:
+            order = np.argsort(self.track_id, kind="stable")
+            track_ids, starts = np.unique(self.track_id[order], return_index=True)
+            self.track_rows = dict(zip(track_ids.tolist(), np.split(order, starts[1:])))
+        return self.track_rows
+
+    # track_idの一括削除（mapping: track_id -> 削除するフレーム、Noneなら全フレーム）
+    def delete_tracks(self, mapping : Dict[float, List[int]]) -> None:
+        track_rows = self.take_track_rows()
+        mask = np.zeros(len(self), dtype=bool)
+        for track_id, frame_nums in mapping.items():
+            rows = track_rows.get(track_id)
+            if rows is None:
+                continue
+            rows = rows[self.frame[rows] >= 1]
+            if frame_nums is not None:
+                rows = rows[np.isin(self.frame[rows], frame_nums)]
+            mask[rows] = True
+        self.delete_rows(mask)
+
+    # エントリーの削除
+    def delete_rows(self, mask : np.ndarray) -> None:
+        keep = ~mask
+        for column in self.row_columns:
+            setattr(self, column, getattr(self, column)[keep])
+        self.rebuild_offsets()
+
+    # エントリーの追加（各フレームの末尾に追加）
+    def append_rows(
+        self, pos : np.ndarray, x : np.ndarray, y : np.ndarray, jersey : np.ndarray, team : np.ndarray,
+        track_id : np.ndarray = None, role : np.ndarray = None
+    ) -> None:
+        n = len(pos)
+        if n == 0:
+            return
+        if track_id is None:
+            track_id = np.zeros(n, dtype=np.float64)
+        if role is None:
+            role = np.full(n, self.roles.code("player"), dtype=np.int32)
+        pos = np.asarray(pos, dtype=np.int32)
+        new_columns = {
+            "pos": pos,
+            "frame": self.frame_nums[pos],
+            "track_id": np.asarray(track_id, dtype=np.float64),
+            "track_is_int": np.zeros(n, dtype=bool),
+            "jersey": np.asarray(jersey, dtype=np.int32),
+            "team": np.asarray(team, dtype=np.int32),
+            "role": np.asarray(role, dtype=np.int32),
+            "x": np.asarray(x, dtype=np.float64),
+            "y": np.asarray(y, dtype=np.float64),
+            "corners": np.zeros((n, len(corner_keys)), dtype=np.float64),
+            "bbox_state": np.full(n, bbox_dict, dtype=np.int8),
+            "extras": np.full(n, None, dtype=object),
+        }
+        order = np.argsort(np.concatenate([self.pos, pos]), kind="stable")
+        for column in self.row_columns:
+            merged = np.concatenate([getattr(self, column), new_columns[column]])
+            setattr(self, column, merged[order])
+        self.rebuild_offsets()
+
+# FrameStoreの保存（列ごとの.npyとメタ情報）
+def save_frame_store(store : FrameStore, dir_path : str, meta : Dict = None) -> None:
+    tmp_path = f"{dir_path}.tmp{os.getpid()}"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "frame_nums.npy"), store.frame_nums)
+    np.save(os.path.join(tmp_path, "offsets.npy"), store.offsets)
+    for column in store.row_columns:
+        if column != "extras":
+            np.save(os.path.join(tmp_path, f"{column}.npy"), getattr(store, column))
+    info = {
+        "version": store_version,
+        "meta": meta or {},
+        "data_num": store.data_num,
+        "frame_ids": store.frame_ids,
+        "jerseis": store.jerseis.names,
+        "teams": store.teams.names,
+        "roles": store.roles.names,
+        "extras": take_extras(store),
+        "content_hash": store.take_content_hash(),
+    }
+    with open(os.path.join(tmp_path, "info.json"), "w") as file:
+        json.dump(info, file)
+    # 古いディレクトリを退避してから置き換え（途中で止まっても退避先に残る）
+    old_path = f"{dir_path}.old{os.getpid()}"
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(dir_path):
+        os.rename(dir_path, old_path)
+    os.rename(tmp_path, dir_path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+# その他のキーを持つエントリー（[エントリー位置, キーと値]のリスト）
+def take_extras(store : FrameStore) -> List:
+    rows = np.flatnonzero(store.extras != None)
+    return [[int(i), store.extras[i]] for i in rows]
+
+# FrameStoreの内容のハッシュ
+def calc_store_hash(store : FrameStore) -> str:
+    sha = hashlib.sha1()
+    sha.update(json.dumps([
+        store.data_num, store.frame_ids, store.jerseis.names, store.teams.names, store.roles.names,
+        take_extras(store)
+    ]).encode())
+    sha.update(np.ascontiguousarray(store.frame_nums).tobytes())
+    for column in store.row_columns:
+        if column != "extras":
+            sha.update(np.ascontiguousarray(getattr(store, column)).tobytes())
+    return sha.hexdigest()
+
+# メタ情報の読み込み（無い場合、保存形式が古い場合はNone）
+def load_frame_store_meta(dir_path : str) -> Dict:
+    info_path = os.path.join(dir_path, "info.json")
+    if not os.path.isfile(info_path):
+        return None
+    with open(info_path, "r") as file:
+        info = json.load(file)
+    if info.get("version") != store_version:
+        return None
+    return info["meta"]
+
+# 配列の読み込み（空配列はmmapできないため通常読み込み）
+def load_array(file_path : str, mmap_mode : str) -> np.ndarray:
+    try:
+        return np.load(file_path, mmap_mode=mmap_mode)
+    except ValueError:
+        return np.load(file_path)
+
+# FrameStoreの読み込み（mmap_mode="c"なら書き込みはメモリ上のみ）
+def load_frame_store(dir_path : str, mmap_mode : str = "c") -> FrameStore:
+    with open(os.path.join(dir_path, "info.json"), "r") as file:
+        info = json.load(file)
+    store = FrameStore(info["data_num"])
+    store.frame_ids = info["frame_ids"]
+    store.frame_nums = load_array(os.path.join(dir_path, "frame_nums.npy"), mmap_mode)
+    store.offsets = load_array(os.path.join(dir_path, "offsets.npy"), mmap_mode)
+    for column in store.row_columns:
+        if column != "extras":
+            setattr(store, column, load_array(os.path.join(dir_path, f"{column}.npy"), mmap_mode))
+    store.extras = np.full(len(store.track_id), None, dtype=object)
+    for i, extra in info["extras"]:
+        store.extras[i] = extra
+    store.jerseis = Vocab(info["jerseis"])
+    store.teams = Vocab(info["teams"])
+    store.roles = Vocab(info["roles"])
+    store.content_hash = info["content_hash"]
+    return store
+
+# 複数ファイルの変換
+def create_frame_stores(data_list : List[Data]) -> List[FrameStore]:
+    return [FrameStore.from_data(data, data_num) for data_num, data in enumerate(data_list)]
+
+# 複数ファイルの逆変換
+def convert_frame_stores(stores : List[FrameStore]) -> List[Data]:
+    return [store.to_data() for store in stores]
+
+# Data用の処理をFrameStoreに適用
+def apply_data_pass(stores : List[FrameStore], data_pass : Callable, *args, **kwargs):
+    data_list = convert_frame_stores(stores)
+    result = data_pass(data_list, *args, **kwargs)
+    stores[:] = [FrameStore.from_data(data, store.data_num) for data, store in zip(data_list, stores)]
+    return result
@@ -1,4 +1,6 @@
 import numpy as np
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from scipy.optimize import linear_sum_assignment
 from typing import List, Dict, Tuple
 from edit.type_def import *
@@ -25,27 +27,42 @@ class GSHOTA:
         location2, track_id2, jersey2, team2 = con.take_entry_info(entry2)
         return mf.calc_location_sim(location1, location2, self.tau) * self.calc_id_sim(entry1, entry2)
     
+    # フレーム内の座標とIDを配列に変換
+    def take_frame_arrays(self, frame_data : List[Entry]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        locations = np.full((len(frame_data), 2), np.nan)
+        ids = np.empty(len(frame_data), dtype=object)
+        for i, entry in enumerate(frame_data):
+            location, track_id, jersey, team = con.take_entry_info(entry)
+            if location != "":
+                locations[i] = location
+            ids[i] = (jersey, team)
+        track_ids = np.array([entry["track_id"] for entry in frame_data])
+        return locations, ids, track_ids
+
+    # 類似度行列
+    def calc_sim_matrix(
+        self, locations_gt : np.ndarray, ids_gt : np.ndarray, locations_pred : np.ndarray, ids_pred : np.ndarray
+    ) -> np.ndarray:
+        sub = locations_gt[:, None, :] - locations_pred[None, :, :]
+        dis = np.sqrt(sub[:, :, 0]**2 + sub[:, :, 1]**2)
+        loc_sim = np.exp(np.log(0.05) * dis**2 / self.tau**2)
+        id_sim = ids_gt[:, None] == ids_pred[None, :]
+        return np.nan_to_num(loc_sim * id_sim, nan=0.0)
+
     # ハンガリアン法でマッチング
     def match_gt_pred(self, frame_data_gt : List[Entry], frame_data_pred : List[Entry]) -> FrameMatchIds:
-        n_gt = len(frame_data_gt)
-        n_pred= len(frame_data_pred)
-        sim_matrix = np.zeros((n_gt, n_pred))
+        locations_gt, ids_gt, track_ids_gt = self.take_frame_arrays(frame_data_gt)
+        locations_pred, ids_pred, track_ids_pred = self.take_frame_arrays(frame_data_pred)
+        sim_matrix = self.calc_sim_matrix(locations_gt, ids_gt, locations_pred, ids_pred)
 
-        for i in range(n_gt):
-            for j in range(n_pred):
-                sim_matrix[i, j] = self.calc_sim(frame_data_gt[i], frame_data_pred[j])
-        
         cost_matrix = 1 - sim_matrix
         gt_idx, pred_idx = linear_sum_assignment(cost_matrix)
-        frame_matche_ids : FrameMatchIds = []
-        for i , j in zip(gt_idx, pred_idx):
-            if sim_matrix[i, j] >= self.alpha:
-                track_id_gt = frame_data_gt[i]["track_id"]
-                track_id_pred = frame_data_pred[j]["track_id"]
-                frame_matche_ids.append((track_id_gt, track_id_pred))
-        
+        matched = sim_matrix[gt_idx, pred_idx] >= self.alpha
+        frame_matche_ids : FrameMatchIds = list(zip(
+            track_ids_gt[gt_idx[matched]].tolist(), track_ids_pred[pred_idx[matched]].tolist()
+        ))
         return frame_matche_ids
-    
+
     # track_idの出現数を数える
     def calc_track_id_count(self, data : Data, data_num : int, e_track_id : str) -> int:
         count = 0
@@ -56,7 +73,14 @@ class GSHOTA:
                     count += 1
                     break
         return count
-    
+
+    # 全track_idの出現フレーム数を数える
+    def calc_track_id_counts(self, data : Data, data_num : int) -> Counter:
+        counts : Counter = Counter()
+        for frame_num, frame_data in con.iterate_frame_datas(data, data_num, 1, max_frame):
+            counts.update({entry["track_id"] for entry in frame_data})
+        return counts
+
     # GS-HOTAの計算
     def calc_gs_hota(self, data_gt : Data, data_pred : Data, data_num : int) -> Tuple[float, float, float]:
         match_ids : FrameMatchIds = []
@@ -82,12 +106,27 @@ class GSHOTA:
         fp = total_pred - tp
         det_a = tp / (tp + fn + fp )
 
-        track_consistency = []
-        for (track_id_gt, track_id_pred) in set(match_ids):
-            consistent_frames = match_ids.count((track_id_gt, track_id_pred))
-            total_frames = self.calc_track_id_count(data_gt, data_num, track_id_gt)
-            track_consistency.append(consistent_frames / total_frames)
+        match_counts = Counter(match_ids)
+        track_counts = self.calc_track_id_counts(data_gt, data_num)
+        track_consistency = [
+            consistent_frames / track_counts[track_id_gt]
+            for (track_id_gt, track_id_pred), consistent_frames in match_counts.items()
+        ]
         ass_a = np.mean(track_consistency)
 
         gshota = mf.cal_root(det_a * ass_a)
-        return gshota, det_a, ass_a
\ No newline at end of file
+        return gshota, det_a, ass_a
+
+    # GS-HOTAの計算（引数をまとめて受け取る）
+    def calc_gs_hota_clip(self, clip : Tuple[Data, Data, int]) -> Tuple[float, float, float]:
+        data_gt, data_pred, data_num = clip
+        return self.calc_gs_hota(data_gt, data_pred, data_num)
+
+    # GS-HOTAの計算（複数ファイルを並列）
+    def calc_gs_hota_many(
+        self, clips : List[Tuple[Data, Data, int]], max_workers : int = None
+    ) -> List[Tuple[float, float, float]]:
+        if max_workers == 1 or len(clips) <= 1:
+            return [self.calc_gs_hota_clip(clip) for clip in clips]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.calc_gs_hota_clip, clips))
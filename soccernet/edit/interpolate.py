@@ -1,5 +1,7 @@
+import numpy as np
 from typing import List, Dict, Tuple
 from edit.type_def import *
+from edit.frame_store import FrameStore
 import edit.convert_take as con
 import edit.create as cre
 import edit.math_func as mf
@@ -50,68 +52,188 @@ def update_trajectories(data_list : List[Data], trajectories : Trajectories, e_t
                 else:
                     print(f"{jersey}, {team} not found in trajectory at {data_num}")
 
-# 現フレームにない背番号を取得
-def get_none_jerseis(frame_data : List[Entry], trajectory : Trajectory, e_team : str) -> List[str]:
-    cur_jerseis = []
-    for entry in frame_data:
-        location, track_id, jersey, team = con.take_entry_info(entry)
-        if location == "":
-            continue
-        if jersey == "" or team == "nan":
+# 複数ある背番号の統合（FrameStore）
+def integrate_jerseis_store(stores : List[FrameStore]) -> None:
+    for store in stores:
+        integrate_jerseis_clip(store)
+
+# 複数ある背番号の統合（FrameStore、1ファイル分）
+def integrate_jerseis_clip(store : FrameStore) -> None:
+    visible = store.frame >= 1
+    has_loc = store.has_location()
+    named = np.flatnonzero(visible & has_loc & (store.jersey != store.jerseis.find("")))
+    order = np.lexsort((named, store.team[named], store.jersey[named], store.pos[named]))
+    rows = named[order]
+    keys = np.stack([store.pos[rows], store.jersey[rows], store.team[rows]], axis=1)
+    is_first = np.ones(len(rows), dtype=bool)
+    is_first[1:] = (keys[1:] != keys[:-1]).any(axis=1)
+
+    # 重複したエントリーの座標を先頭のエントリーに順に平均
+    starts = np.flatnonzero(is_first)
+    ends = np.append(starts[1:], len(rows))
+    for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+        first = rows[start]
+        for i in rows[start + 1:end]:
+            store.x[first] = 0.5 * (store.x[first] + store.x[i])
+            store.y[first] = 0.5 * (store.y[first] + store.y[i])
+    store.mark_dirty()
+
+    drop = visible & ~has_loc
+    drop[rows[~is_first]] = True
+    store.delete_rows(drop)
+
+# 座標時系列データの更新（FrameStore）
+def update_trajectories_store(stores : List[FrameStore], trajectories : Trajectories, e_team : str) -> None:
+    trajectory : Trajectory = {}
+    for store in stores:
+        trajectory = update_trajectory_clip(store, trajectories, trajectory, e_team)
+
+# 座標時系列データの更新（FrameStore、1ファイル分、ファイル終了時点の座標時系列データを返す）
+def update_trajectory_clip(
+    store : FrameStore, trajectories : Trajectories, trajectory : Trajectory, e_team : str
+) -> Trajectory:
+    data_num = store.data_num
+    visible_frames = np.unique(store.frame_nums[store.frame_nums >= 1])
+    switch_frames = [f for f in visible_frames.tolist() if (data_num, f) in trajectories]
+
+    mask = (store.frame >= 1) & store.has_location()
+    mask &= (store.jersey != store.jerseis.find("")) & (store.team == store.teams.find(e_team))
+    rows = np.flatnonzero(mask)
+    rows = rows[np.argsort(store.frame[rows], kind="stable")]
+    segments = np.searchsorted(switch_frames, store.frame[rows], side="right")
+
+    jerseis = store.jerseis.decode(store.jersey[rows])
+    times = data_num * 30 + (store.frame[rows] / 750) * 30
+    for segment in range(len(switch_frames) + 1):
+        if segment > 0:
+            trajectory = trajectories[(data_num, switch_frames[segment - 1])]
+        in_segment = np.flatnonzero(segments == segment)
+        for i in in_segment:
+            jersey = jerseis[i]
+            if jersey in trajectory:
+                trajectory[jersey].append((float(times[i]), [float(store.x[rows[i]]), float(store.y[rows[i]])]))
+            else:
+                print(f"{jersey}, {e_team} not found in trajectory at {data_num}")
+    return trajectory
+
+# 座標時系列の配列（時刻、座標）への変換（take_arraysを持つ記録はそれを使う）
+def take_record_arrays(records) -> Tuple[np.ndarray, np.ndarray]:
+    if hasattr(records, "take_arrays"):
+        return records.take_arrays()
+    times = np.array([t for t, loc in records], dtype=np.float64)
+    locations = np.array([loc for t, loc in records], dtype=np.float64).reshape(-1, 2)
+    return times, locations
+
+# 座標時系列データの索引
+class TrajectoryIndex:
+    def __init__(self, trajectory : Trajectory):
+        self.jerseis : List[str] = list(trajectory.keys())
+        self.times : Dict[str, np.ndarray] = {}
+        self.locations : Dict[str, np.ndarray] = {}
+        for jersey, records in trajectory.items():
+            times, locations = take_record_arrays(records)
+            if np.any(times[1:] < times[:-1]):
+                order = np.argsort(times, kind="stable")
+                times, locations = times[order], locations[order]
+            self.times[jersey] = times
+            self.locations[jersey] = locations
+
+    # 指定した時刻における各選手の座標（同じ時刻が複数あれば後のもの）
+    def take_locs_by_times(self, times : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        hits = np.zeros((len(times), len(self.jerseis)), dtype=bool)
+        locs = np.full((len(times), len(self.jerseis), 2), np.nan)
+        for j, jersey in enumerate(self.jerseis):
+            r_times = self.times[jersey]
+            if len(r_times) == 0:
+                continue
+            i = np.searchsorted(r_times, times, side="right") - 1
+            hit = (i >= 0) & (r_times[np.maximum(i, 0)] == times)
+            hits[:, j] = hit
+            locs[hit, j] = self.locations[jersey][i[hit]]
+        return hits, locs
+
+    # 指定した時間における座標の取得
+    def take_loc_info_by_time(self, time : float) -> Dict[str, List[float]]:
+        hits, locs = self.take_locs_by_times(np.array([time], dtype=np.float64))
+        return {jersey: locs[0, j].tolist() for j, jersey in enumerate(self.jerseis) if hits[0, j]}
+
+    # 他の選手との関係性による座標予測（複数時刻、共通する選手は背番号順で最初のもの）
+    def predict_location_by_relation(self, times : np.ndarray, o_time : float, e_jersey : str) -> np.ndarray:
+        o_hits, o_locs = self.take_locs_by_times(np.array([o_time], dtype=np.float64))
+        o_loc = o_locs[0, self.jerseis.index(e_jersey)]
+        hits, locs = self.take_locs_by_times(times)
+        common = hits & o_hits
+        has_common = common.any(axis=1)
+        c = np.argmax(common, axis=1)
+        pred_locs = np.tile(o_loc, (len(times), 1))
+        sub_vectors = o_loc - o_locs[0, c]
+        c_locs = locs[np.arange(len(times)), c]
+        pred_locs[has_common] = c_locs[has_common] + sub_vectors[has_common]
+        return pred_locs
+
+    # 線形補間による座標予測（複数時刻）
+    def predict_location_by_interpolate(self, times : np.ndarray, e_jersey : str) -> np.ndarray:
+        r_times = self.times[e_jersey]
+        r_locs = self.locations[e_jersey]
+        i = np.clip(np.searchsorted(r_times, times, side="left") - 1, 0, len(r_times) - 2)
+        t1, t2 = r_times[i], r_times[i + 1]
+        ratio = ((times - t1) / (t2 - t1))[:, None]
+        return r_locs[i] + ratio * (r_locs[i + 1] - r_locs[i])
+
+    # 座標予測（複数時刻、予測できない時刻はnan）
+    def predict_locations(self, times : np.ndarray, e_jersey : str) -> np.ndarray:
+        pred_locs = np.full((len(times), 2), np.nan)
+        r_times = self.times[e_jersey]
+        if len(r_times) == 0:
+            return pred_locs
+        before = times < r_times[0]
+        after = times > r_times[-1]
+        inside = ~before & ~after
+        if before.any():
+            pred_locs[before] = self.predict_location_by_relation(times[before], r_times[0], e_jersey)
+        if after.any():
+            pred_locs[after] = self.predict_location_by_relation(times[after], r_times[-1], e_jersey)
+        if inside.any() and len(r_times) > 1:
+            pred_locs[inside] = self.predict_location_by_interpolate(times[inside], e_jersey)
+        return pred_locs
+
+# 索引の作成（同じ座標時系列データは共有）
+def take_trajectory_index(trajectory : Trajectory, indexes : Dict[int, TrajectoryIndex]) -> TrajectoryIndex:
+    if id(trajectory) not in indexes:
+        indexes[id(trajectory)] = TrajectoryIndex(trajectory)
+    return indexes[id(trajectory)]
+
+# 切り替えフレームごとに座標時系列データを割り当て
+def split_segments(
+    data_num : int, frame_nums : np.ndarray, trajectories : Trajectories, trajectory : Trajectory
+) -> Tuple[np.ndarray, List[Trajectory]]:
+    switch_frames = [f for f in np.unique(frame_nums).tolist() if (data_num, f) in trajectories]
+    segment_trajectories = [trajectory] + [trajectories[(data_num, f)] for f in switch_frames]
+    segments = np.searchsorted(switch_frames, frame_nums, side="right")
+    return segments, segment_trajectories
+
+# 欠損している背番号の座標予測（チーム単位）
+def predict_none_locations(
+    data_num : int, frame_nums : np.ndarray, present : List[set], segments : np.ndarray,
+    segment_trajectories : List[Trajectory], indexes : Dict[int, TrajectoryIndex]
+) -> List[Tuple[np.ndarray, str, np.ndarray]]:
+    predictions = []
+    times = data_num * 30 + (frame_nums / 750) * 30
+    for segment, trajectory in enumerate(segment_trajectories):
+        in_segment = np.flatnonzero(segments == segment)
+        if len(in_segment) == 0 or not trajectory:
             continue
-        if team == e_team:
-            cur_jerseis.append(jersey)
-    none_jerseis = [j for j in trajectory.keys() if j not in cur_jerseis]
-    return none_jerseis
-
-# 指定した時間における座標の取得
-def take_loc_info_by_time(time : float, trajectory : Trajectory) -> Dict[str, List[float]]:
-    loc_info: Dict[str, List[float]] = {}
-    for jersey, records in trajectory.items():
-        for t, loc in records:
-            if t == time:
-                loc_info[jersey] = loc
-    return loc_info
-
-# 他の選手との関係性による座標予測
-def predict_location_by_relation(time : float, o_time : float, trajectory : Trajectory, e_jersey : str) -> List[float]:
-    loc_info = take_loc_info_by_time(time, trajectory)
-    o_loc_info = take_loc_info_by_time(o_time, trajectory)
-    common = set(loc_info.keys()) & set(o_loc_info.keys())
-    if common:
-        c_jersey = next(iter(common))
-        sub_vector = mf.calc_sub(o_loc_info[e_jersey], o_loc_info[c_jersey])
-        return mf.calc_add(loc_info[c_jersey], sub_vector)
-    else:
-        return o_loc_info[e_jersey]
-    
-# 線形補間による座標予測
-def predict_location_by_interpolate(time : float, trajectory : Trajectory, e_jersey : str) -> List[float]:
-    pred_loc = []
-    records = trajectory[e_jersey]
-    for i in range(len(records) - 1):
-        t1, loc1 = records[i]
-        t2, loc2 = records[i + 1]
-        if t1 <= time <= t2:
-            pred_loc = mf.calc_linear(time, t1, loc1, t2, loc2)
-            break
-    return pred_loc
-
-# 座標予測
-def predict_location(time : float, trajectory : Trajectory, e_jersey : str) -> List[float]:
-    records = trajectory[e_jersey]
-    if records == []:
-        pred_loc = []
-    elif time < records[0][0]:
-        pred_loc = predict_location_by_relation(time, records[0][0], trajectory, e_jersey)
-    elif time > records[-1][0]:
-        pred_loc = predict_location_by_relation(time, records[-1][0], trajectory, e_jersey)
-    else:
-        pred_loc = predict_location_by_interpolate(time, trajectory, e_jersey)
-    if pred_loc == []:
-        print(f"{e_jersey} not found at {time}")
-    
-    return pred_loc
+        index = take_trajectory_index(trajectory, indexes)
+        for jersey in index.jerseis:
+            frames = np.array([i for i in in_segment if jersey not in present[i]], dtype=np.int64)
+            if len(frames) == 0:
+                continue
+            pred_locs = index.predict_locations(times[frames], jersey)
+            found = ~np.isnan(pred_locs).any(axis=1)
+            for time in times[frames[~found]].tolist():
+                print(f"{jersey} not found at {time}")
+            predictions.append((frames[found], jersey, pred_locs[found]))
+    return predictions
 
 # データに予測座標をいれたエントリーを追加
 def add_entry_to_data(
@@ -119,28 +241,93 @@ def add_entry_to_data(
 ) -> None:
     trajectory_left: Trajectory = {}
     trajectory_right: Trajectory = {}
+    indexes : Dict[int, TrajectoryIndex] = {}
     for data_num, data in enumerate(data_list):
-        for frame_num, frame_data in con.iterate_frame_datas(data, data_num, 1, max_frame):
-            if (data_num, frame_num) in trajectories_left:
-                trajectory_left = trajectories_left[(data_num, frame_num)]
-            if (data_num, frame_num) in trajectories_right:
-                trajectory_right= trajectories_right[(data_num, frame_num)]
-            
-            none_jerseis_left = get_none_jerseis(frame_data, trajectory_left, "left")
-            none_jerseis_right = get_none_jerseis(frame_data, trajectory_right, "right")
-            time = con.conver_num_to_time(data_num, frame_num)
-            entries: List[Entry] = []
-            
-            for jersey in none_jerseis_left:
-                pred_loc = predict_location(time, trajectory_left, jersey)
-                if pred_loc != []:
-                    bbox = cre.create_bbox(e_x_bottom_middle=pred_loc[0], e_y_bottom_middle=pred_loc[1])
-                    entry = cre.create_entry(e_bbox=bbox, e_jersey=jersey, e_team="left")
-                    entries.append(entry)
-            for jersey in none_jerseis_right:
-                pred_loc = predict_location(time, trajectory_right, jersey)
-                if pred_loc != []:
+        frame_datas = list(con.iterate_frame_datas(data, data_num, 1, max_frame))
+        if not frame_datas:
+            continue
+        frame_nums = np.array([frame_num for frame_num, frame_data in frame_datas], dtype=np.int64)
+        entries : List[List[Entry]] = [[] for _ in frame_datas]
+
+        for e_team, trajectories in (("left", trajectories_left), ("right", trajectories_right)):
+            trajectory = trajectory_left if e_team == "left" else trajectory_right
+            segments, segment_trajectories = split_segments(data_num, frame_nums, trajectories, trajectory)
+            present = []
+            for frame_num, frame_data in frame_datas:
+                cur_jerseis = set()
+                for entry in frame_data:
+                    location, track_id, jersey, team = con.take_entry_info(entry)
+                    if location != "" and jersey != "" and team == e_team:
+                        cur_jerseis.add(jersey)
+                present.append(cur_jerseis)
+
+            predictions = predict_none_locations(data_num, frame_nums, present, segments, segment_trajectories, indexes)
+            for frames, jersey, pred_locs in predictions:
+                for i, pred_loc in zip(frames.tolist(), pred_locs.tolist()):
                     bbox = cre.create_bbox(e_x_bottom_middle=pred_loc[0], e_y_bottom_middle=pred_loc[1])
-                    entry = cre.create_entry(e_bbox=bbox, e_jersey=jersey, e_team="right")
-                    entries.append(entry)
-            frame_data.extend(entries)
\ No newline at end of file
+                    entries[i].append(cre.create_entry(e_bbox=bbox, e_jersey=jersey, e_team=e_team))
+
+            if e_team == "left":
+                trajectory_left = segment_trajectories[-1]
+            else:
+                trajectory_right = segment_trajectories[-1]
+
+        for (frame_num, frame_data), frame_entries in zip(frame_datas, entries):
+            frame_data.extend(frame_entries)
+
+# データに予測座標をいれたエントリーを追加（FrameStore）
+def add_entry_to_store(
+    stores : List[FrameStore], trajectories_left : Trajectories, trajectories_right : Trajectories
+) -> None:
+    trajectory_left: Trajectory = {}
+    trajectory_right: Trajectory = {}
+    indexes : Dict[int, TrajectoryIndex] = {}
+    for store in stores:
+        trajectory_left, trajectory_right = add_entry_to_clip(
+            store, trajectories_left, trajectories_right, trajectory_left, trajectory_right, indexes
+        )
+
+# データに予測座標をいれたエントリーを追加（FrameStore、1ファイル分、ファイル終了時点の座標時系列データを返す）
+def add_entry_to_clip(
+    store : FrameStore, trajectories_left : Trajectories, trajectories_right : Trajectories,
+    trajectory_left : Trajectory, trajectory_right : Trajectory, indexes : Dict[int, TrajectoryIndex]
+) -> Tuple[Trajectory, Trajectory]:
+    data_num = store.data_num
+    frames = np.flatnonzero(store.frame_nums >= 1)
+    frames = frames[np.argsort(store.frame_nums[frames], kind="stable")]
+    if len(frames) == 0:
+        return trajectory_left, trajectory_right
+    frame_nums = store.frame_nums[frames].astype(np.int64)
+    new_pos, new_x, new_y, new_jersey, new_team = [], [], [], [], []
+
+    for e_team, trajectories in (("left", trajectories_left), ("right", trajectories_right)):
+        trajectory = trajectory_left if e_team == "left" else trajectory_right
+        segments, segment_trajectories = split_segments(data_num, frame_nums, trajectories, trajectory)
+        mask = store.has_location() & (store.jersey != store.jerseis.find("")) & (store.team == store.teams.find(e_team))
+        present = [set() for _ in frames]
+        rank = np.full(len(store.frame_ids), -1, dtype=np.int64)
+        rank[frames] = np.arange(len(frames))
+        rows = np.flatnonzero(mask & (rank[store.pos] >= 0))
+        for i, jersey in zip(rank[store.pos[rows]].tolist(), store.jerseis.decode(store.jersey[rows])):
+            present[i].add(jersey)
+
+        predictions = predict_none_locations(data_num, frame_nums, present, segments, segment_trajectories, indexes)
+        team_code = store.teams.code(e_team)
+        for pred_frames, jersey, pred_locs in predictions:
+            new_pos.append(frames[pred_frames])
+            new_x.append(pred_locs[:, 0])
+            new_y.append(pred_locs[:, 1])
+            new_jersey.append(np.full(len(pred_frames), store.jerseis.code(jersey)))
+            new_team.append(np.full(len(pred_frames), team_code))
+
+        if e_team == "left":
+            trajectory_left = segment_trajectories[-1]
+        else:
+            trajectory_right = segment_trajectories[-1]
+
+    if new_pos:
+        store.append_rows(
+            np.concatenate(new_pos), np.concatenate(new_x), np.concatenate(new_y),
+            np.concatenate(new_jersey), np.concatenate(new_team)
+        )
+    return trajectory_left, trajectory_right
@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import pickle
+import shutil
+import hashlib
+import argparse
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Callable
+from edit.type_def import *
+from edit.frame_store import FrameStore
+from edit.edit_func import EditFunc
+import edit.convert_take as con
+import edit.file_manager as fm
+import edit.frame_store as fst
+import edit.filter_delete as fd
+import edit.interpolate as inter
+import edit.create as cre
+import edit.stream as stream
+
+# チェックポイントの保存先（data_path以下）
+checkpoint_dir = ".pipeline"
+
+# 設定の既定値
+default_config = {
+    "data_file": "datas",
+    "start_file_num": 0,
+    "end_file_num": 0,
+    "min_match": 0.1,
+    "max_distance": 20.0,
+    "min_order": 0.5,
+    "encoding": "indent",
+    "checkpoint": True,
+    "trace_memory": True,
+    "max_workers": None,
+    "stream": False,
+}
+
+# 各処理（stores, extras, manager, config）
+def run_reverse_team(stores : List[FrameStore], extras : Dict, manager : fm.FileManager, config : Dict) -> None:
+    reverse_numbers, set_frames, replay_frames = manager.load_any_file()
+    fd.reverse_team_store(stores, reverse_numbers)
+
+def run_filter(stores : List[FrameStore], extras : Dict, manager : fm.FileManager, config : Dict) -> None:
+    fd.filter_data_manual_store(stores, manager.load_filter_file())
+    fd.filter_data_auto_store(stores)
+
+def run_edit(stores : List[FrameStore], extras : Dict, manager : fm.FileManager, config : Dict) -> None:
+    reverse_numbers, set_frames, replay_frames = manager.load_any_file()
+    formations_left, formations_right = manager.load_formation_file()
+    player_lists_left, player_lists_right = cre.create_player_lists(formations_left, formations_right)
+    edit_func = EditFunc(0, len(stores) - 1)
+    edit_func.delete_jersey_number_store(stores)
+    edit_func.edit_data_manual_store(stores, manager.load_edit_file())
+    edit_func.edit_data_auto_store(
+        stores, player_lists_left, player_lists_right,
+        config["min_match"], config["max_distance"], config["min_order"], set_frames
+    )
+
+def run_delete(stores : List[FrameStore], extras : Dict, manager : fm.FileManager, config : Dict) -> None:
+    fd.delete_once_track_id_store(stores, manager.load_edit_file())
+    fd.delete_track_id_by_frame_store(stores, manager.load_delete_file())
+
+def run_integrate(stores : List[FrameStore], extras : Dict, manager : fm.FileManager, config : Dict) -> None:
+    inter.integrate_jerseis_store(stores)
+
+def run_trajectories(stores : List[FrameStore], extras : Dict, manager : fm.FileManager, config : Dict) -> None:
+    reverse_numbers, set_frames, replay_frames = manager.load_any_file()
+    formations_left, formations_right = manager.load_formation_file()
+    trajectories_left, trajectories_right = cre.create_trajectories(formations_left, formations_right, replay_frames)
+    inter.update_trajectories_store(stores, trajectories_left, "left")
+    inter.update_trajectories_store(stores, trajectories_right, "right")
+    extras["trajectories_left"] = trajectories_left
+    extras["trajectories_right"] = trajectories_right
+
+def run_interpolate(stores : List[FrameStore], extras : Dict, manager : fm.FileManager, config : Dict) -> None:
+    inter.add_entry_to_store(stores, extras["trajectories_left"], extras["trajectories_right"])
+
+# 処理の順番（名前、処理、依存する入力ファイル、依存する設定）
+stages : List[Tuple[str, Callable, List[str], List[str]]] = [
+    ("reverse_team", run_reverse_team, ["AnyNumbers.txt"], []),
+    ("filter", run_filter, ["FilterNumbers.txt"], []),
+    ("edit", run_edit, ["AnyNumbers.txt", "Formations.txt", "EditNumbers.txt"], ["min_match", "max_distance", "min_order"]),
+    ("delete", run_delete, ["EditNumbers.txt", "DeleteNumbers.txt"], []),
+    ("integrate", run_integrate, [], []),
+    ("trajectories", run_trajectories, ["AnyNumbers.txt", "Formations.txt"], []),
+    ("interpolate", run_interpolate, [], []),
+]
+stage_names = [name for name, func, inputs, keys in stages]
+
+# ファイル内容のハッシュ（無ければNone）
+def calc_file_hash(file_path : str) -> str:
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+# 入力データのキー（各ファイルのサイズと更新時刻）
+def calc_source_key(data_path : str, config : Dict) -> str:
+    files = os.path.join(data_path, config["data_file"])
+    keys = []
+    for file_num in range(config["start_file_num"], config["end_file_num"] + 1):
+        file_path = os.path.join(files, con.convert_num_to_file_name(file_num))
+        keys.append(fm.take_cache_key(file_path) if os.path.isfile(file_path) else None)
+    sha = hashlib.sha1(json.dumps([
+        fst.store_version, config["data_file"], config["start_file_num"], keys
+    ]).encode())
+    return sha.hexdigest()
+
+# 各処理のキー（前の処理のキー、入力ファイル、設定から計算するため、上流が変われば下流も変わる）
+def calc_stage_keys(data_path : str, config : Dict) -> List[str]:
+    stage_keys = []
+    prev_key = calc_source_key(data_path, config)
+    for name, func, inputs, keys in stages:
+        sha = hashlib.sha1(prev_key.encode())
+        sha.update(json.dumps([
+            name, [calc_file_hash(os.path.join(data_path, input)) for input in inputs], [config[key] for key in keys]
+        ]).encode())
+        prev_key = sha.hexdigest()
+        stage_keys.append(prev_key)
+    return stage_keys
+
+# チェックポイントのパス
+def take_stage_path(data_path : str, stage_num : int) -> str:
+    return os.path.join(data_path, checkpoint_dir, f"{stage_num}_{stage_names[stage_num]}")
+
+# チェックポイントのキー（無ければNone）
+def load_stage_key(stage_path : str) -> str:
+    info_path = os.path.join(stage_path, "stage.json")
+    if not os.path.isfile(info_path):
+        return None
+    with open(info_path, "r") as file:
+        return json.load(file)["key"]
+
+# チェックポイントの保存（stage.jsonを最後に書き込み、途中で止まった場合は無効のまま）
+def save_checkpoint(stage_path : str, stage_key : str, stores : List[FrameStore], extras : Dict) -> None:
+    if os.path.exists(stage_path):
+        shutil.rmtree(stage_path)
+    os.makedirs(stage_path)
+    for store in stores:
+        fst.save_frame_store(store, os.path.join(stage_path, con.num_to_str(store.data_num)))
+    with open(os.path.join(stage_path, "extras.pkl"), "wb") as file:
+        pickle.dump(extras, file)
+    fm.write_text(os.path.join(stage_path, "stage.json"), json.dumps({
+        "key": stage_key, "data_nums": [store.data_num for store in stores]
+    }))
+
+# チェックポイントの読み込み
+def load_checkpoint(stage_path : str) -> Tuple[List[FrameStore], Dict]:
+    with open(os.path.join(stage_path, "stage.json"), "r") as file:
+        data_nums = json.load(file)["data_nums"]
+    stores = [fst.load_frame_store(os.path.join(stage_path, con.num_to_str(data_num))) for data_num in data_nums]
+    with open(os.path.join(stage_path, "extras.pkl"), "rb") as file:
+        extras = pickle.load(file)
+    return stores, extras
+
+# 再開する処理の番号（有効なチェックポイントの次）
+def calc_resume_stage(data_path : str, stage_keys : List[str], from_stage : str = None) -> int:
+    last_stage = len(stages) if from_stage is None else stage_names.index(from_stage)
+    for stage_num in reversed(range(last_stage)):
+        if load_stage_key(take_stage_path(data_path, stage_num)) == stage_keys[stage_num]:
+            return stage_num + 1
+    return 0
+
+# 1試合分の処理（各処理の時間とピークメモリを返す）
+def run_pipeline(data_path : str, config : Dict, from_stage : str = None) -> Dict:
+    config = {**default_config, **config}
+    if config["stream"]:
+        # ファイル単位で順に処理（チェックポイントは使わない）
+        return stream.run_stream(data_path, config)
+    manager = fm.FileManager(data_path)
+    stage_keys = calc_stage_keys(data_path, config)
+    resume_stage = calc_resume_stage(data_path, stage_keys, from_stage) if config["checkpoint"] else 0
+    report = {
+        "data_path": data_path,
+        "resume_stage": stage_names[resume_stage] if resume_stage < len(stages) else None,
+        "stages": [],
+    }
+
+    # ピークメモリはtracemallocで計測（mmapしたキャッシュの分は含まない）
+    is_tracing = config["trace_memory"] and not tracemalloc.is_tracing()
+    if is_tracing:
+        tracemalloc.start()
+    try:
+        start_time = time.perf_counter()
+        if resume_stage == 0:
+            stores = manager.load_files(
+                config["data_file"], config["start_file_num"], config["end_file_num"],
+                as_store=True, max_workers=config["max_workers"]
+            )
+            extras : Dict = {}
+        else:
+            stores, extras = load_checkpoint(take_stage_path(data_path, resume_stage - 1))
+        report["load_time"] = time.perf_counter() - start_time
+
+        for stage_num in range(resume_stage, len(stages)):
+            name, func, inputs, keys = stages[stage_num]
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            start_time = time.perf_counter()
+            func(stores, extras, manager, config)
+            stage_info = {"name": name, "time": time.perf_counter() - start_time}
+            if tracemalloc.is_tracing():
+                stage_info["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            if config["checkpoint"]:
+                save_checkpoint(take_stage_path(data_path, stage_num), stage_keys[stage_num], stores, extras)
+            report["stages"].append(stage_info)
+            print_stage_info(data_path, stage_info)
+
+        start_time = time.perf_counter()
+        manager.save_files(stores, encoding=config["encoding"], max_workers=config["max_workers"])
+        report["save_time"] = time.perf_counter() - start_time
+    finally:
+        if is_tracing:
+            tracemalloc.stop()
+
+    if config["checkpoint"]:
+        fm.write_text(os.path.join(data_path, checkpoint_dir, "report.json"), json.dumps(report, indent=4))
+    return report
+
+# 処理時間の表示
+def print_stage_info(data_path : str, stage_info : Dict) -> None:
+    text = f"{data_path}: {stage_info['name']} {stage_info['time']:.2f}s"
+    if "peak_memory" in stage_info:
+        text += f", peak {stage_info['peak_memory'] / 2**20:.1f}MB"
+    print(text)
+
+# 複数試合の処理（試合ごとに別プロセス）
+def run_pipelines(matches : List[Dict], config : Dict, from_stage : str = None, max_workers : int = None) -> List[Dict]:
+    configs = [{**config, **match} for match in matches]
+    data_paths = [match_config.pop("data_path") for match_config in configs]
+    if len(matches) > 1 and max_workers != 1:
+        # 試合単位で並列化するため、試合内の読み込み・保存は逐次
+        for match_config in configs:
+            match_config["max_workers"] = 1
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run_pipeline, data_paths, configs, [from_stage] * len(matches)))
+    return [run_pipeline(data_path, match_config, from_stage) for data_path, match_config in zip(data_paths, configs)]
+
+# 設定ファイルの読み込み（{"matches": [{"data_path": ..., "end_file_num": ...}], ...共通設定}）
+def load_config(config_path : str) -> Tuple[List[Dict], Dict]:
+    with open(config_path, "r") as file:
+        config = json.load(file)
+    matches = config.pop("matches")
+    for key in config:
+        if key not in default_config and key != "match_workers":
+            raise ValueError(f"{key} is not a config key")
+    return matches, config
+
+def main(argv : List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="DataEdit.ipynbの補正処理をまとめて実行")
+    parser.add_argument("config", help="設定ファイル（JSON）")
+    parser.add_argument("--from-stage", choices=stage_names, default=None, help="この処理から再実行")
+    parser.add_argument("--no-checkpoint", action="store_true", help="チェックポイントを使わない")
+    args = parser.parse_args(argv)
+
+    matches, config = load_config(args.config)
+    match_workers = config.pop("match_workers", None)
+    if args.no_checkpoint:
+        config["checkpoint"] = False
+    reports = run_pipelines(matches, config, args.from_stage, match_workers)
+    for report in reports:
+        if "stages" not in report:
+            print(f"{report['data_path']}: {report['edit_time'] + report['interpolate_time']:.2f}s in stream")
+            continue
+        total = sum(stage_info["time"] for stage_info in report["stages"])
+        if report["resume_stage"] is None:
+            print(f"{report['data_path']}: all stages up to date")
+        else:
+            print(f"{report['data_path']}: resumed from {report['resume_stage']}, {total:.2f}s in stages")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,5 +1,5 @@
-from typing import List, Dict, Tuple
-from edit.type_def import max_frame, Data, Edit
+from typing import List, Dict, Tuple, Set
+from edit.type_def import max_frame, Data, Edit, Delete, Entry
 import edit.convert_take as con
 import edit.math_func as mf
 
@@ -75,4 +75,196 @@ def search_frames(data : Data, data_num : int, edit_numbers : List[Edit]) -> Non
     for (start_frame, end_frame), edit_infos in edit_number.items():
         print(f"start {start_frame}")
         for (track_id, jersey, team) in edit_infos:
-            search_frame(data, data_num, track_id)
\ No newline at end of file
+            search_frame(data, data_num, track_id)
+
+# 検索用インデックス（試合全体、編集に合わせてフレーム単位で更新）
+class SearchIndex:
+    def __init__(self, data_list : List[Data]):
+        self.data_list = data_list
+        self.tracks : List[Dict[float, Dict[int, List[int]]]] = [] #track_id -> {frame_num: positions}（座標無しも含む）
+        self.jerseis : List[Dict[Tuple[str, str], Dict[int, List[int]]]] = [] #(jersey, team) -> {frame_num: positions}
+        self.none_frames : List[Set[int]] = []
+        self.multiple_frames : List[Set[int]] = [] #同じ(jersey, team)が複数あるフレーム
+        self.frame_keys : List[Dict[int, Tuple[List[float], List[Tuple[str, str]]]]] = []
+        for data_num in range(len(data_list)):
+            self.index_clip(data_num)
+
+    # ファイル単位の登録
+    def index_clip(self, data_num : int) -> None:
+        while len(self.tracks) <= data_num:
+            self.tracks.append({})
+            self.jerseis.append({})
+            self.none_frames.append(set())
+            self.multiple_frames.append(set())
+            self.frame_keys.append({})
+        for frame_num in range(1, max_frame + 1):
+            self.index_frame(data_num, frame_num)
+
+    # フレームの登録
+    def index_frame(self, data_num : int, frame_num : int) -> None:
+        frame_id = con.convert_num_to_id(data_num, frame_num)
+        if frame_id not in self.data_list[data_num]:
+            self.none_frames[data_num].add(frame_num)
+            return
+
+        tracks : Dict[float, List[int]] = {}
+        jerseis : Dict[Tuple[str, str], List[int]] = {}
+        is_none = False
+        for position, entry in enumerate(self.data_list[data_num][frame_id]):
+            location, track_id, jersey, team = con.take_entry_info(entry)
+            tracks.setdefault(track_id, []).append(position)
+            if location == "":
+                is_none = True
+                continue
+            if jersey != "":
+                jerseis.setdefault((jersey, team), []).append(position)
+
+        for track_id, positions in tracks.items():
+            self.tracks[data_num].setdefault(track_id, {})[frame_num] = positions
+        for key, positions in jerseis.items():
+            self.jerseis[data_num].setdefault(key, {})[frame_num] = positions
+        if is_none:
+            self.none_frames[data_num].add(frame_num)
+        if any(len(positions) > 1 and key[1] != "nan" for key, positions in jerseis.items()):
+            self.multiple_frames[data_num].add(frame_num)
+        self.frame_keys[data_num][frame_num] = (list(tracks), list(jerseis))
+
+    # フレームの登録解除
+    def unindex_frame(self, data_num : int, frame_num : int) -> None:
+        self.none_frames[data_num].discard(frame_num)
+        self.multiple_frames[data_num].discard(frame_num)
+        track_ids, keys = self.frame_keys[data_num].pop(frame_num, ([], []))
+        for index, index_keys in ((self.tracks[data_num], track_ids), (self.jerseis[data_num], keys)):
+            for key in index_keys:
+                frames = index[key]
+                del frames[frame_num]
+                if not frames:
+                    del index[key]
+
+    # 外部で編集したフレームの再登録
+    def update_frames(self, data_num : int, frame_nums : List[int]) -> None:
+        for frame_num in set(frame_nums):
+            self.unindex_frame(data_num, frame_num)
+            self.index_frame(data_num, frame_num)
+
+    # 外部で編集したファイルの再登録
+    def update_clip(self, data_num : int) -> None:
+        self.update_frames(data_num, range(1, max_frame + 1))
+
+    # track_idが出現するフレームと背番号（背番号は最後に出現したエントリーのもの）
+    def take_track_frames(self, data_num : int, e_track_id : float) -> Tuple[List[int], str]:
+        frame_nums = []
+        e_jersey = ""
+        for frame_num, positions in sorted(self.tracks[data_num].get(e_track_id, {}).items()):
+            frame_data = self.take_frame_entries(data_num, frame_num)
+            located = [frame_data[p] for p in positions if frame_data[p]["bbox_pitch"] != ""]
+            if located:
+                frame_nums.append(frame_num)
+                e_jersey = located[-1]["jersey"]
+        return frame_nums, e_jersey
+
+    # フレーム内のエントリー
+    def take_frame_entries(self, data_num : int, frame_num : int) -> List[Entry]:
+        return self.data_list[data_num].get(con.convert_num_to_id(data_num, frame_num))
+
+    # フレーム内のtrack_id（座標があるもの、出現順）
+    def take_track_ids(self, data_num : int, frame_num : int) -> List[float]:
+        frame_data = self.take_frame_entries(data_num, frame_num)
+        if frame_data is None:
+            return None
+        return [entry["track_id"] for entry in frame_data if entry["bbox_pitch"] != ""]
+
+    # (jersey, team)が出現するフレーム
+    def take_jersey_frames(self, data_num : int, jersey : str, team : str) -> List[int]:
+        return sorted(self.jerseis[data_num].get((jersey, team), {}))
+
+    # データがないフレーム
+    def take_none_frames(self, data_num : int) -> List[int]:
+        return sorted(self.none_frames[data_num])
+
+    # 選手が複数いるフレーム（同じ(jersey, team)が複数あるフレームのみ距離を確認）
+    def take_multiple_frames(self, max_distance : float) -> List[Tuple[int, int, str, str, float, float]]:
+        results = []
+        for data_num, multiple_frames in enumerate(self.multiple_frames):
+            for frame_num in sorted(multiple_frames):
+                track_locs : Dict[Tuple[str, str], Tuple[float, List[float]]] = {}
+                for entry in self.take_frame_entries(data_num, frame_num):
+                    location, track_id, jersey, team = con.take_entry_info(entry)
+                    if location == "" or jersey == "" or team == "nan":
+                        continue
+                    if not (jersey, team) in track_locs:
+                        track_locs[(jersey, team)] = (track_id, location)
+                    elif mf.calc_distance(location, track_locs[(jersey, team)][1]) >= max_distance:
+                        results.append((data_num, frame_num, jersey, team, track_locs[(jersey, team)][0], track_id))
+                        break
+        return results
+
+    # track_idによる補正（EditFunc.edit_dataと同じ条件、該当フレームのみ走査して再登録）
+    def edit_track(
+        self, data_num : int, start_frame : int, end_frame : int,
+        is_overwrite : bool, e_track_id : float, e_jersey : str, e_team : str
+    ) -> None:
+        frame_nums = [f for f in self.tracks[data_num].get(e_track_id, {}) if start_frame <= f <= end_frame]
+        for frame_num in frame_nums:
+            frame_data = self.take_frame_entries(data_num, frame_num)
+            for position in self.tracks[data_num][e_track_id][frame_num]:
+                entry = frame_data[position]
+                if entry["bbox_pitch"] == "":
+                    continue
+                if (entry["jersey"] != "" or entry["team"] == "nan") and not is_overwrite:
+                    continue
+                entry["jersey"] = e_jersey
+                if e_team != "":
+                    entry["team"] = e_team
+        self.update_frames(data_num, frame_nums)
+
+    # track_idの削除（frame_numsがNoneなら全フレーム）
+    def delete_track(self, data_num : int, frame_nums : List[int], e_track_id : float) -> None:
+        frames = self.tracks[data_num].get(e_track_id, {})
+        targets = list(frames) if frame_nums is None else [f for f in frame_nums if f in frames]
+        for frame_num in targets:
+            frame_data = self.take_frame_entries(data_num, frame_num)
+            frame_data[:] = [entry for entry in frame_data if entry["track_id"] != e_track_id]
+        self.update_frames(data_num, targets)
+
+    # 手動補正の適用
+    def apply_edit_numbers(self, edit_numbers : List[Edit]) -> None:
+        for data_num, edit_number in enumerate(edit_numbers[:len(self.data_list)]):
+            for (start_frame, end_frame), edit_infos in edit_number.items():
+                for track_id, jersey, team in edit_infos:
+                    self.edit_track(data_num, start_frame, end_frame, True, track_id, jersey, team)
+
+    # track_id削除の適用
+    def apply_delete_numbers(self, delete_numbers : Delete) -> None:
+        for data_num, frame_track_ids in delete_numbers.items():
+            for frame_num, track_id in frame_track_ids:
+                self.delete_track(data_num, [frame_num], track_id)
+
+    # 以下、search_*と同じ出力
+    def search_frame(self, data_num : int, e_track_id : float) -> None:
+        frame_list, e_jersey = self.take_track_frames(data_num, e_track_id)
+        print(f"({e_track_id}, {e_jersey}): {con.convert_list_to_string(frame_list)}")
+
+    def search_none_frame(self, data_num : int) -> None:
+        print(f"none frame: {con.convert_list_to_string(self.take_none_frames(data_num))}")
+
+    def search_track_id(self, data_num : int, frame_num : int) -> None:
+        track_ids = self.take_track_ids(data_num, frame_num)
+        if track_ids is None:
+            print(f"{con.convert_num_to_id(data_num, frame_num)} not found")
+            return
+        print(f"track_id : {track_ids}")
+
+    def search_multiple_frame(self, max_distance : float) -> None:
+        prev_data_num = -1
+        for data_num, frame_num, jersey, team, track_id, o_track_id in self.take_multiple_frames(max_distance):
+            if data_num != prev_data_num:
+                prev_data_num = data_num
+                print(f"data_num: {data_num}")
+            print(f"{frame_num}: {jersey}, {team} (track_id: {track_id}, {o_track_id})")
+
+    def search_frames(self, data_num : int, edit_numbers : List[Edit]) -> None:
+        for (start_frame, end_frame), edit_infos in edit_numbers[data_num].items():
+            print(f"start {start_frame}")
+            for (track_id, jersey, team) in edit_infos:
+                self.search_frame(data_num, track_id)
@@ -0,0 +1,134 @@
+import sys
+import cmd
+import json
+import shlex
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from typing import List
+from edit.type_def import max_frame
+import edit.convert_take as con
+import edit.file_manager as fm
+import edit.search as sea
+
+# 検索用の対話シェル
+class SearchShell(cmd.Cmd):
+    intro = "frame / none / track / jersey / multiple / edit / delete / reload / quit"
+    prompt = "(search) "
+
+    def __init__(self, index : sea.SearchIndex, manager = None):
+        super().__init__()
+        self.index = index
+        self.manager = manager
+
+    def onecmd(self, line : str) -> bool:
+        try:
+            return super().onecmd(line)
+        except (ValueError, IndexError, KeyError) as e:
+            print(f"error: {e}")
+            return False
+
+    def do_frame(self, arg : str) -> None:
+        "frame <data_num> <track_id>: track_idが出現するフレーム"
+        data_num, track_id = shlex.split(arg)
+        self.index.search_frame(int(data_num), float(track_id))
+
+    def do_none(self, arg : str) -> None:
+        "none <data_num>: データがないフレーム"
+        self.index.search_none_frame(int(arg))
+
+    def do_track(self, arg : str) -> None:
+        "track <data_num> <frame_num>: フレーム内のtrack_id"
+        data_num, frame_num = shlex.split(arg)
+        self.index.search_track_id(int(data_num), int(frame_num))
+
+    def do_jersey(self, arg : str) -> None:
+        "jersey <data_num> <jersey> <team>: 背番号が出現するフレーム"
+        data_num, jersey, team = shlex.split(arg)
+        print(con.convert_list_to_string(self.index.take_jersey_frames(int(data_num), jersey, team)))
+
+    def do_multiple(self, arg : str) -> None:
+        "multiple <max_distance>: 選手が複数いるフレーム"
+        self.index.search_multiple_frame(float(arg))
+
+    def do_edit(self, arg : str) -> None:
+        "edit <data_num> <track_id> <jersey> [team] [start_frame end_frame]: track_idの補正（上書き）"
+        parts = shlex.split(arg)
+        data_num, track_id, jersey = int(parts[0]), float(parts[1]), parts[2]
+        team = parts[3] if len(parts) in (4, 6) else ("nan" if jersey == "" else "")
+        start_frame, end_frame = (int(parts[-2]), int(parts[-1])) if len(parts) >= 5 else (1, max_frame)
+        self.index.edit_track(data_num, start_frame, end_frame, True, track_id, jersey, team)
+
+    def do_delete(self, arg : str) -> None:
+        "delete <data_num> <track_id> [frame_num ...]: track_idの削除"
+        parts = shlex.split(arg)
+        frame_nums = [int(part) for part in parts[2:]] or None
+        self.index.delete_track(int(parts[0]), frame_nums, float(parts[1]))
+
+    def do_reload(self, arg : str) -> None:
+        "reload: EditNumbers.txtとDeleteNumbers.txtを読み直して適用"
+        if self.manager is None:
+            print("no file manager")
+            return
+        self.index.apply_edit_numbers(self.manager.load_edit_file())
+        self.index.apply_delete_numbers(self.manager.load_delete_file())
+
+    def do_quit(self, arg : str) -> bool:
+        "quit: 終了"
+        return True
+
+# 検索用のHTTPサーバー（GET /<query>?data_num=...、JSONで返す）
+def serve_search(index : sea.SearchIndex, port : int, host : str = "127.0.0.1") -> None:
+    queries = {
+        "frame": lambda q: dict(zip(("frames", "jersey"), index.take_track_frames(int(q["data_num"]), float(q["track_id"])))),
+        "none": lambda q: {"frames": index.take_none_frames(int(q["data_num"]))},
+        "track": lambda q: {"track_ids": index.take_track_ids(int(q["data_num"]), int(q["frame_num"]))},
+        "entries": lambda q: {"entries": index.take_frame_entries(int(q["data_num"]), int(q["frame_num"]))},
+        "jersey": lambda q: {"frames": index.take_jersey_frames(int(q["data_num"]), q["jersey"], q["team"])},
+        "multiple": lambda q: {"frames": index.take_multiple_frames(float(q.get("max_distance", 0.0)))},
+    }
+
+    class SearchHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+            name = url.path.strip("/")
+            try:
+                status, body = 200, queries[name](query)
+            except KeyError as e:
+                status, body = 404 if name not in queries else 400, {"error": f"{e} not found"}
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+            text = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(text)))
+            self.end_headers()
+            self.wfile.write(text)
+
+    server = ThreadingHTTPServer((host, port), SearchHandler)
+    print(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(argv : List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="試合データの検索")
+    parser.add_argument("data_path")
+    parser.add_argument("end_file_num", type=int)
+    parser.add_argument("--data-file", default="datas")
+    parser.add_argument("--http", type=int, default=None, help="HTTPで待ち受けるポート（指定しなければ対話シェル）")
+    args = parser.parse_args(argv)
+
+    manager = fm.FileManager(args.data_path)
+    index = sea.SearchIndex(manager.load_files(args.data_file, 0, args.end_file_num))
+    if args.http is None:
+        SearchShell(index, manager).cmdloop()
+    else:
+        serve_search(index, args.http)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
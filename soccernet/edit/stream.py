@@ -0,0 +1,208 @@
+import os
+import time
+import shutil
+import numpy as np
+from typing import List, Dict, Tuple, Iterator
+from edit.type_def import *
+from edit.frame_store import FrameStore
+from edit.edit_func import EditFunc, AutoEditState, take_nan_locations_store
+import edit.convert_take as con
+import edit.file_manager as fm
+import edit.frame_store as fst
+import edit.filter_delete as fd
+import edit.interpolate as inter
+import edit.create as cre
+
+# ファイルへ書き出すまでに貯める記録数
+spill_chunk = 4096
+
+# 座標時系列の記録（ファイルへ追記し、読み込み時はmmap）
+class SpillRecords:
+    def __init__(self, file_path : str):
+        self.file_path = file_path
+        self.buffer : List[Tuple[float, float, float]] = []
+        self.size = 0
+
+    def append(self, record : Tuple[float, List[float]]) -> None:
+        time, location = record
+        self.buffer.append((time, location[0], location[1]))
+        if len(self.buffer) >= spill_chunk:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        with open(self.file_path, "ab") as file:
+            np.asarray(self.buffer, dtype=np.float64).tofile(file)
+        self.size += len(self.buffer)
+        self.buffer = []
+
+    def __len__(self) -> int:
+        return self.size + len(self.buffer)
+
+    # 時刻と座標の配列（TrajectoryIndex用）
+    def take_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        self.flush()
+        if self.size == 0:
+            return np.zeros(0, dtype=np.float64), np.zeros((0, 2), dtype=np.float64)
+        records = np.memmap(self.file_path, dtype=np.float64, mode="r", shape=(self.size, 3))
+        return records[:, 0], records[:, 1:]
+
+# 座標時系列データの記録先をファイルに置き換え
+def spill_trajectories(trajectories : Trajectories, dir_path : str, e_team : str) -> None:
+    for (data_num, start_frame), trajectory in trajectories.items():
+        for i, jersey in enumerate(trajectory):
+            file_path = os.path.join(dir_path, f"{e_team}_{data_num}_{start_frame}_{i}.bin")
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            trajectory[jersey] = SpillRecords(file_path)
+
+# 記録の書き出し
+def flush_trajectories(trajectories : Trajectories) -> None:
+    for trajectory in trajectories.values():
+        for records in trajectory.values():
+            records.flush()
+
+# 以下、1ファイルずつ処理して次へ渡すジェネレーター（各処理の1ファイル分の関数を呼ぶ）
+def reverse_team_stream(stores : Iterator[FrameStore], reverse_numbers : List[int]) -> Iterator[FrameStore]:
+    for store in stores:
+        if store.data_num in reverse_numbers:
+            fd.reverse_team_clip(store)
+        yield store
+
+def filter_stream(stores : Iterator[FrameStore], filter_frames : Frame) -> Iterator[FrameStore]:
+    for store in stores:
+        if store.data_num in filter_frames:
+            start_frame, end_frame = filter_frames[store.data_num]
+            fd.filter_data_manual_clip(store, start_frame, end_frame)
+        fd.filter_data_auto_clip(store)
+        yield store
+
+# 背番号補正（持ち越し: 各選手情報、前のファイルの背番号が無いデータの座標）
+def edit_stream(
+    stores : Iterator[FrameStore], player_lists_left : PlayerLists, player_lists_right : PlayerLists,
+    edit_numbers : List[Edit], min_match : float, max_distance : float, min_order : float, set_frames : Frame
+) -> Iterator[FrameStore]:
+    state = AutoEditState(player_lists_left, player_lists_right, 0)
+    nan_locations = np.zeros((0, 2))
+    for store in stores:
+        data_num = store.data_num
+        edit_func = EditFunc(data_num, data_num)
+        edit_func.delete_jersey_number_clip(store)
+        edit_func.edit_data_manual_clip(store, edit_numbers[data_num])
+        frames = edit_func.iterate_frames_store(store, nan_locations)
+        edit_func.edit_clip_auto(state, data_num, frames, min_match, max_distance, min_order, set_frames)
+        nan_locations = take_nan_locations_store(store)
+        yield store
+
+def delete_stream(stores : Iterator[FrameStore], edit_numbers : List[Edit], delete_numbers : Delete) -> Iterator[FrameStore]:
+    for store in stores:
+        fd.delete_once_track_id_clip(store, edit_numbers[store.data_num])
+        if store.data_num in delete_numbers:
+            fd.delete_track_id_by_frame_clip(store, delete_numbers[store.data_num])
+        yield store
+
+def integrate_stream(stores : Iterator[FrameStore]) -> Iterator[FrameStore]:
+    for store in stores:
+        inter.integrate_jerseis_clip(store)
+        yield store
+
+# 座標時系列データの更新（持ち越し: 現在の座標時系列データ）
+def trajectories_stream(
+    stores : Iterator[FrameStore], trajectories_left : Trajectories, trajectories_right : Trajectories
+) -> Iterator[FrameStore]:
+    trajectory_left : Trajectory = {}
+    trajectory_right : Trajectory = {}
+    for store in stores:
+        trajectory_left = inter.update_trajectory_clip(store, trajectories_left, trajectory_left, "left")
+        trajectory_right = inter.update_trajectory_clip(store, trajectories_right, trajectory_right, "right")
+        yield store
+
+# 座標補間（持ち越し: 現在の座標時系列データ、座標時系列データの索引）
+def interpolate_stream(
+    stores : Iterator[FrameStore], trajectories_left : Trajectories, trajectories_right : Trajectories
+) -> Iterator[FrameStore]:
+    trajectory_left : Trajectory = {}
+    trajectory_right : Trajectory = {}
+    indexes : Dict[int, inter.TrajectoryIndex] = {}
+    for store in stores:
+        trajectory_left, trajectory_right = inter.add_entry_to_clip(
+            store, trajectories_left, trajectories_right, trajectory_left, trajectory_right, indexes
+        )
+        yield store
+
+# 一時保存（座標補間は全ファイルの座標時系列データが揃ってから行うため）
+def spill_stream(stores : Iterator[FrameStore], dir_path : str) -> Iterator[str]:
+    for store in stores:
+        store_path = os.path.join(dir_path, con.num_to_str(store.data_num))
+        fst.save_frame_store(store, store_path)
+        yield store_path
+
+def load_stream(store_paths : List[str]) -> Iterator[FrameStore]:
+    for store_path in store_paths:
+        yield fst.load_frame_store(store_path)
+
+# 出力（変更のあったファイルのみ書き込み）
+def save_stream(stores : Iterator[FrameStore], files : str, encoding : str) -> Tuple[int, int]:
+    os.makedirs(files, exist_ok=True)
+    manifest = fm.load_manifest(files)
+    file_names = []
+    written = 0
+    for store in stores:
+        file_name = con.num_to_str(store.data_num) + fm.save_extensions[encoding]
+        file_names.append(file_name)
+        file_path = os.path.join(files, file_name)
+        new_hash = fm.calc_output_hash(store, store.data_num, encoding)
+        if fm.calc_is_changed(file_path, new_hash, manifest.get(file_name)):
+            fm.write_file(file_path, store, store.data_num, encoding)
+            manifest[file_name] = new_hash
+            written += 1
+    fm.save_manifest(files, manifest, file_names)
+    return written, len(file_names)
+
+# 1試合分の処理（ファイル単位で順に処理し、メモリ上には現在のファイルと持ち越し状態のみ置く）
+def run_stream(data_path : str, config : Dict) -> Dict:
+    if config["encoding"] not in fm.save_extensions:
+        raise ValueError(f"{config['encoding']} is not supported")
+    manager = fm.FileManager(data_path)
+    reverse_numbers, set_frames, replay_frames = manager.load_any_file()
+    formations_left, formations_right = manager.load_formation_file()
+    filter_frames = manager.load_filter_file()
+    edit_numbers = manager.load_edit_file()
+    delete_numbers = manager.load_delete_file()
+    player_lists_left, player_lists_right = cre.create_player_lists(formations_left, formations_right)
+    trajectories_left, trajectories_right = cre.create_trajectories(formations_left, formations_right, replay_frames)
+
+    spill_dir = os.path.join(data_path, ".stream")
+    os.makedirs(spill_dir, exist_ok=True)
+    spill_trajectories(trajectories_left, spill_dir, "left")
+    spill_trajectories(trajectories_right, spill_dir, "right")
+    report = {"data_path": data_path}
+    try:
+        # 1回目: 背番号補正から座標時系列データの更新まで
+        start_time = time.perf_counter()
+        stores = manager.iterate_files(config["data_file"], config["start_file_num"], config["end_file_num"])
+        stores = reverse_team_stream(stores, reverse_numbers)
+        stores = filter_stream(stores, filter_frames)
+        stores = edit_stream(
+            stores, player_lists_left, player_lists_right, edit_numbers,
+            config["min_match"], config["max_distance"], config["min_order"], set_frames
+        )
+        stores = delete_stream(stores, edit_numbers, delete_numbers)
+        stores = integrate_stream(stores)
+        stores = trajectories_stream(stores, trajectories_left, trajectories_right)
+        store_paths = list(spill_stream(stores, spill_dir))
+        flush_trajectories(trajectories_left)
+        flush_trajectories(trajectories_right)
+        report["edit_time"] = time.perf_counter() - start_time
+
+        # 2回目: 座標補間と出力
+        start_time = time.perf_counter()
+        stores = interpolate_stream(load_stream(store_paths), trajectories_left, trajectories_right)
+        files = os.path.join(data_path, "edit_datas")
+        written, total = save_stream(stores, files, config["encoding"])
+        report["interpolate_time"] = time.perf_counter() - start_time
+        print(f"Data saved to {files} ({written} of {total} files written)")
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return report